@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+from shadergraph import Node, Plug, UniformNode, FloatValue, ColorValue, Vec3Value, Vec4Value, Mat4Value
+from shadergraph import FragCoordNode, DivideNode, OperatorIINode, SmoothStepNode, PlotNode, ScaleNode, Vec4ToColorNode, InvertColorNode, AddColorNode, VectorTransformNode
+from shadergraph import FunctionINode, FunctionIINode, FunctionIIINode, FunctionIVNode
+from typecheck import checkTypes
+
+# window depth of a quad drawn at z=0 with the default depth range
+FRAG_DEPTH = 0.5
+
+def length( x ):
+    return np.sqrt( np.sum( x*x, -1, keepdims=True ) )
+
+def dot( x, y ):
+    return np.sum( x*y, -1, keepdims=True )
+
+def vector( *parts ):
+    """Concatenate floats and vectors into one vector, broadcasting the pixel axes."""
+    parts = [np.asarray( part, np.float32 ) for part in parts]
+    shape = np.broadcast_shapes( *( part.shape[:-1] for part in parts ) )
+    return np.concatenate( [np.broadcast_to( part, shape+part.shape[-1:] ) for part in parts], -1 )
+
+def smoothstep( edge0, edge1, x ):
+    t = np.clip( ( x-edge0 ) / ( edge1-edge0 ), 0, 1 )
+    return t*t*( 3-2*t )
+
+def refract( i, n, eta ):
+    d = dot( n, i )
+    k = 1 - eta*eta*( 1 - d*d )
+    return np.where( k < 0, np.float32( 0 ), eta*i - ( eta*d + np.sqrt( np.maximum( k, 0 ) ) )*n )
+
+# the built-ins offered by the Function nodes, on float32 arrays whose last axis holds the components
+FUNCTIONS = {
+    'abs': np.abs, 'acos': np.arccos, 'acosh': np.arccosh, 'asin': np.arcsin, 'asinh': np.arcsinh,
+    'atan': np.arctan, 'atanh': np.arctanh, 'ceil': np.ceil, 'cos': np.cos, 'cosh': np.cosh,
+    'degrees': np.degrees, 'exp': np.exp, 'exp2': np.exp2, 'floor': np.floor, 'log': np.log, 'log2': np.log2,
+    'radians': np.radians, 'round': np.round, 'roundEven': np.round, 'sign': np.sign, 'sin': np.sin,
+    'sinh': np.sinh, 'sqrt': np.sqrt, 'tan': np.tan, 'tanh': np.tanh, 'trunc': np.trunc,
+    'length': length,
+    'normalize': lambda x: x / length( x ),
+    # what current drivers return for the deprecated noise functions
+    'noise1': lambda x: np.zeros( x.shape[:-1]+( 1, ), np.float32 ),
+    'noise2': lambda x: np.zeros( x.shape[:-1]+( 2, ), np.float32 ),
+    'noise3': lambda x: np.zeros( x.shape[:-1]+( 3, ), np.float32 ),
+    'noise4': lambda x: np.zeros( x.shape[:-1]+( 4, ), np.float32 ),
+    'cross': lambda x, y: np.cross( *np.broadcast_arrays( x, y ) ),
+    'distance': lambda x, y: length( x-y ),
+    'dot': dot,
+    'max': np.maximum,
+    'min': np.minimum,
+    'mod': lambda x, y: x - y*np.floor( x/y ),
+    # the fractional part, the whole part goes to the second parameter
+    'modf': lambda x, y: x - np.trunc( x ),
+    'pow': np.power,
+    'reflect': lambda i, n: i - 2*dot( n, i )*n,
+    'step': lambda edge, x: np.where( x < edge, np.float32( 0 ), np.float32( 1 ) ),
+    'clamp': lambda x, lo, hi: np.minimum( np.maximum( x, lo ), hi ),
+    'mix': lambda x, y, a: x*( 1-a ) + y*a,
+    'refract': refract,
+    'smoothstep': smoothstep,
+    'vec3': lambda *parts: vector( *parts ) if len( parts ) > 1 else vector( *parts*3 ),
+    'vec4': lambda *parts: vector( *parts ) if len( parts ) > 1 else vector( *parts*4 ),
+}
+
+def callFunction( node, inputs ):
+    name = inputs['Function']
+    if name not in FUNCTIONS:
+        raise ValueError( f'{node.name}: {name} is not supported on the CPU' )
+    args = [inputs[plug.name] for plug in node.inplugs.values() if not plug.internal]
+    return {'Result': FUNCTIONS[name]( *args )}
+
+def operator( inputs ):
+    a, b = inputs['From'], inputs['What']
+    return {'+': a+b, '-': a-b, '*': a*b, '/': a/b}[inputs['Operator']]
+
+def transform( matrix, v ):
+    # mat4 values are column major, like their GLSL constructor
+    return np.einsum( '...ji,...j->...i', matrix.reshape( matrix.shape[:-1]+( 4, 4 ) ), v )
+
+NODES = {
+    DivideNode: lambda node, i: {'Result': i['Divident'] / i['Divisor']},
+    OperatorIINode: lambda node, i: {'Result': operator( i )},
+    SmoothStepNode: lambda node, i: {'Result': smoothstep( i['Edge1'], i['Edge2'], i['Interpolation'] )},
+    PlotNode: lambda node, i: {'Result': smoothstep( i['Pct']-0.02, i['Pct'], i['Interp'] ) - smoothstep( i['Pct'], i['Pct']+0.02, i['Interp'] )},
+    ScaleNode: lambda node, i: {'ScaleOutColor': i['ScaleInColor'] * i['ScaleFloat']},
+    Vec4ToColorNode: lambda node, i: {'Color': vector( i['R'], i['G'], i['B'], i['A'] )},
+    InvertColorNode: lambda node, i: {'outColor': vector( 1-i['inColor'][..., :3], i['inColor'][..., 3:] )},
+    AddColorNode: lambda node, i: {'Result': i['Color1'] + i['Color2']},
+    VectorTransformNode: lambda node, i: {'Result': transform( i['Matrix'], i['Vector'] )},
+    FunctionINode: callFunction,
+    FunctionIINode: callFunction,
+    FunctionIIINode: callFunction,
+    FunctionIVNode: callFunction,
+}
+
+def literal( value ):
+    """Array of an unconnected plug value; floats keep a last axis of one component."""
+    if isinstance( value, FloatValue ):
+        return np.array( [value.value], np.float32 )
+    if isinstance( value, ColorValue ):
+        return np.array( value.color, np.float32 )
+    if isinstance( value, ( Vec3Value, Vec4Value ) ):
+        return np.array( value.vector, np.float32 )
+    if isinstance( value, Mat4Value ):
+        return np.array( value.mat, np.float32 )
+    return value.value
+
+def uniformValue( name, uniforms ):
+    """A uniform named by a custom node variable, with an optional component like sg_ScreenSize.x."""
+    name, _, component = name.partition( '.' )
+    if name not in uniforms:
+        raise ValueError( f'no value for the uniform {name}' )
+    value = np.array( uniforms[name], np.float32 ).reshape( -1 )
+    if component:
+        index = 'xyzw'.index( component )
+        value = value[index:index+1]
+    return value
+
+def evaluateNode( node, inputs, coords, uniforms ):
+    if isinstance( node, FragCoordNode ):
+        x, y = coords
+        return {'X': x, 'Y': y, 'Z': np.array( [FRAG_DEPTH], np.float32 )}
+    if isinstance( node, UniformNode ):
+        name, _, function = node.uniform
+        values = uniforms[name] if name in uniforms else function()
+        return {node.plug.name: np.array( values, np.float32 ).reshape( -1 )}
+    if type( node ) in NODES:
+        return NODES[type( node )]( node, inputs )
+    if type( node ) is Node:
+        # custom nodes read the uniforms they are named after
+        return {plug.name: uniformValue( plug.variable, uniforms ) for plug in node.outplugs.values()}
+    raise ValueError( f'{node.name} can only be evaluated on the GPU' )
+
+def renderGraph( graph, width, height, time=0.0, uniforms=None ):
+    """RGBA float32 image (height, width, 4), top row first, of the fragment shader of graph.
+
+    Evaluates the fragment shader over every pixel of a quad covering the
+    viewport, as the preview does at render scale 1: each node is one NumPy
+    operation on the whole grid. Window coordinates are constant along a row
+    or a column, so they stay (1, width) and (height, 1) arrays until nodes
+    combine them. Colours are clamped like an 8 bit framebuffer would.
+
+    uniforms maps uniform names (sg_Time, sg_ScreenSize, RandomFloat1, ...)
+    to values, replacing the time, the size and the random values drawn
+    for the uniform nodes. Raises ValueError for type mismatches and for
+    nodes that need the GPU, such as Vertex Color.
+    """
+    errors = checkTypes( graph )
+    if errors:
+        raise ValueError( next( iter( errors.values() ) ) )
+    # uniform names as in the generated GLSL
+    graph.nameVariables()
+    uniforms = {'sg_Time': time, 'sg_ScreenSize': ( width, height ), **( uniforms or {} )}
+    coords = ( ( np.arange( width, dtype=np.float32 )+0.5 ).reshape( 1, width, 1 ),
+               ( height-0.5-np.arange( height, dtype=np.float32 ) ).reshape( height, 1, 1 ) )
+
+    fsnode = graph.getFragmentShaderNode()
+    used = {fsnode}
+    pending = [fsnode]
+    while pending:
+        for node in graph.sources( pending.pop() ):
+            if node not in used:
+                used.add( node )
+                pending.append( node )
+    order = graph.getOrder()
+
+    values = {}
+    with np.errstate( all='ignore' ):
+        for node in sorted( used, key=order.get ):
+            inputs = {name: values[plug.value] if isinstance( plug.value, Plug ) else literal( plug.value ) for name, plug in node.inplugs.items()}
+            if node is fsnode:
+                color = inputs['Color']
+                break
+            for name, value in evaluateNode( node, inputs, coords, uniforms ).items():
+                values[node.outplugs[name]] = value
+        return np.clip( np.broadcast_to( color, ( height, width, 4 ) ), 0, 1 ).astype( np.float32 )
+
+if __name__ == '__main__':
+    import glob
+    import math
+    import os
+    import re
+    import sys
+    import time
+    import types
+    from graphio import readGraph
+    from shadergraph import NodeFactory
+
+    NodeFactory.addCustomNode( 'Screen Size', [( 'Width', 'float', 'sg_ScreenSize.x' ), ( 'Height', 'float', 'sg_ScreenSize.y' )] )
+    NodeFactory.addCustomNode( 'Time', [( 'time', 'float', 'sg_Time' )] )
+    NodeFactory.addCustomNode( 'MVP Matrix', [( 'Matrix', 'mat4', 'MVP' )] )
+
+    def fragmentAt( graph, x, y, width, height, t ):
+        """Run the generated GLSL main() of the fragment shader for one pixel, statement by statement."""
+        graph.prepare()
+        code, _ = graph.getFragmentShaderNode().generateCode( 'Pixel Color', '', '' )
+        scope = {name: getattr( math, name ) for name in ( 'sin', 'cos', 'tan', 'exp', 'log', 'sqrt', 'floor', 'ceil' )}
+        scope.update( abs=abs, vec4=lambda *c: np.array( c, np.float64 ),
+                      step=lambda edge, x: 0.0 if x < edge else 1.0,
+                      smoothstep=lambda e0, e1, x: ( lambda t: t*t*( 3-2*t ) )( min( max( ( x-e0 ) / ( e1-e0 ), 0 ), 1 ) ),
+                      gl_FragCoord=types.SimpleNamespace( x=x+0.5, y=height-0.5-y, z=FRAG_DEPTH ), sg_RenderScale=1.0,
+                      sg_ScreenSize=types.SimpleNamespace( x=width, y=height ), sg_Time=t )
+        for statement in code.split( ';' ):
+            statement = re.sub( r'^\s*(float|vec[234]|mat4)\s+', '', statement )
+            if statement.strip():
+                exec( statement.strip(), scope )
+        return np.clip( scope['sg_FragColor'], 0, 1 )
+
+    # against the generated GLSL at a few pixels, then the time of a 1080p frame
+    width, height = 1920, 1080
+    for filename in sorted( glob.glob( os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), 'examples', '*.glsg' ) ) ):
+        graph = readGraph( filename )
+        start = time.perf_counter()
+        image = renderGraph( graph, width, height, time=1.25 )
+        elapsed = time.perf_counter()-start
+        for x, y in ( ( 0, 0 ), ( 959, 539 ), ( 1919, 1079 ), ( 400, 900 ), ( 1500, 100 ) ):
+            assert np.allclose( image[y, x], fragmentAt( graph, x, y, width, height, 1.25 ), atol=1e-3 ), ( filename, x, y )
+        print( f'{os.path.basename( filename )}: {width}x{height} in {elapsed*1000:.0f}ms' )
@@ -1,13 +1,21 @@
 
+import collections
 import numpy as np
+import os
+import mesh
 from readobj import Obj3D
-from shadergraph import NodeFactory, ShaderGraph
+from readply import PlyMesh
+from readglb import GlbMesh
+from shadergraph import NodeFactory, ShaderGraph, InputMeshNode, InstanceNode, Plug
+from typecheck import checkTypes
+import threading
 import time
 
 import wx
 from wx import glcanvas
 
-from utils import ortho, perspective, translate, rotate
+from utils import ortho, translateBatch
+from camera import Camera
 
 from OpenGL.GL import *
 from OpenGL.GLU import *
@@ -18,8 +26,33 @@ REALTIME = False
 RENDER_BACKGROUND = True
 RENDER_FOREGROUND = True
 
+# number of preview mesh copies, laid out on a grid by the Instance node's Transform (applied by ShaderGraph.new)
+INSTANCE_COUNT = 1
+
+# compiled shader programs kept for reuse, e.g. after undoing an edit
+PROGRAM_CACHE_SIZE = 16
+
+# render at a reduced resolution while the user interacts, see ResolutionScaler
+DYNAMIC_RESOLUTION = True
+RESOLUTION_TARGET_MS = 16.0
+RESOLUTION_MIN_SCALE = 0.25
+RESOLUTION_MAX_SCALE = 1.0
+# full resolution again this long after the last input
+RESOLUTION_IDLE_MS = 250
+
 File3D = 'cube.obj'
 
+# mesh importers by file extension
+MESH_LOADERS = {
+    '.obj': Obj3D,
+    '.ply': PlyMesh,
+    '.glb': GlbMesh,
+}
+
+# vertex layout of the preview mesh, one of mesh.POSITION_FORMATS / mesh.NORMAL_FORMATS
+POSITION_FORMAT = 'float'
+NORMAL_FORMAT = 'float'
+
 vertexBGShader = """
 #version 330
 
@@ -56,12 +89,41 @@ custom_vs_nodes = {
     'MVP':('MVP Matrix', [('Matrix', 'mat4', 'MVP')], 'mat4', 'self.getMVP()', glUniformMatrix4fv),
 }
 
+GL_TYPES = {
+    'GL_FLOAT': GL_FLOAT,
+    'GL_HALF_FLOAT': GL_HALF_FLOAT,
+    'GL_SHORT': GL_SHORT,
+    'GL_UNSIGNED_SHORT': GL_UNSIGNED_SHORT,
+    'GL_INT_2_10_10_10_REV': GL_INT_2_10_10_10_REV,
+}
+
 # Add custom nodes to the node factory
 for value in custom_vs_nodes.values():
     NodeFactory.addCustomNode(value[0], value[1])
 for value in custom_fs_nodes.values():
     NodeFactory.addCustomNode(value[0], value[1])
 
+class ResolutionScaler:
+    """Adapts the render scale so frames take about `target_ms`.
+
+    Frame time is taken to grow with the pixel count, i.e. the square of the scale.
+    """
+    def __init__( self, target_ms=RESOLUTION_TARGET_MS, min_scale=RESOLUTION_MIN_SCALE, max_scale=RESOLUTION_MAX_SCALE ):
+        self.target_ms = target_ms
+        self.min_scale = min_scale
+        self.max_scale = max_scale
+        self.scale = max_scale
+        
+    def update( self, frame_ms ):
+        if frame_ms > 0:
+            wanted = self.scale * ( self.target_ms / frame_ms ) ** 0.5
+            # move half way to avoid oscillating
+            self.scale = min( self.max_scale, max( self.min_scale, ( self.scale + wanted ) / 2 ) )
+        return self.scale
+        
+    def reset( self ):
+        self.scale = self.max_scale
+        
 class GLFrame( glcanvas.GLCanvas ):
     """A simple class for using OpenGL with wxPython."""
     
@@ -69,6 +131,7 @@ class GLFrame( glcanvas.GLCanvas ):
     far_plane = 100
     world_pos = (0, 0, -6)
     world_rot = (0, 0, 0)
+    fovy = 45.0
     
     def __init__(self, parent, graph):
         self.GLinitialized = False
@@ -84,6 +147,26 @@ class GLFrame( glcanvas.GLCanvas ):
         self.SetCurrent( self.context )
 
         self.left_down = False
+        self.camera = Camera( self.fovy, self.near_plane, self.far_plane, self.world_pos, self.world_rot )
+        self.bgmvp = np.zeros( (4, 4), 'f' )
+        
+        # LOD level and triangle count of the last drawn frame (for profiling)
+        self.lod_level = 0
+        self.triangles_drawn = 0
+        self.chunks_drawn = self.chunks_culled = 0
+        # duration of the last OnPaintGL in milliseconds
+        self.frame_time = 0
+        self.instance_count = INSTANCE_COUNT
+        self.instancevbo = None
+        # (vertex shader, fragment shader) source -> program, least recently used first
+        self.programs = collections.OrderedDict()
+        
+        # dynamic resolution
+        self.scaler = ResolutionScaler()
+        self.render_scale = 1.0
+        self.interaction_end = 0
+        self.fbo = None
+        self.fbo_size = (0, 0)
         
         #
         # Set the event handlers.
@@ -96,7 +179,10 @@ class GLFrame( glcanvas.GLCanvas ):
         self.Bind(wx.EVT_LEFT_UP, self.processLeftUp)
 
         self.timer = wx.Timer(self)
-        self.Bind(wx.EVT_TIMER, self.processPaintEvent)
+        self.Bind(wx.EVT_TIMER, self.processPaintEvent, self.timer)
+        
+        self.idletimer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.processIdleTimer, self.idletimer)
 
         self.graph = graph
         
@@ -116,6 +202,20 @@ class GLFrame( glcanvas.GLCanvas ):
     def GetGLExtents(self):
         """Get the extents of the OpenGL canvas."""
         return self.GetClientSize()
+        
+    def GetRenderExtents(self):
+        """Extents of the (possibly scaled down) target the scene is rendered into."""
+        width, height = self.GetGLExtents()
+        return max(1, int(width*self.render_scale)), max(1, int(height*self.render_scale))
+        
+    def interact( self ):
+        """Render at a reduced resolution until input stops for RESOLUTION_IDLE_MS."""
+        self.interaction_end = time.perf_counter() + RESOLUTION_IDLE_MS / 1000
+        self.idletimer.StartOnce( RESOLUTION_IDLE_MS )
+        
+    def processIdleTimer( self, event ):
+        self.scaler.reset()
+        self.Refresh( False )
 
     #
     # wxPython Window Handlers
@@ -133,13 +233,16 @@ class GLFrame( glcanvas.GLCanvas ):
         if self.left_down:
             pos = event.GetPosition()
             diff = (pos-self.last_pos)
-            self.world_rot = ( self.world_rot[0]+diff[1], self.world_rot[1]+diff[0], self.world_rot[2] )
+            self.camera.orbit( diff[0], diff[1] )
             self.last_pos = pos
+            self.interact()
             self.Refresh( False )
         
     def processWheelEvent( self, event ):
         delta = event.GetWheelRotation() / 100
-        self.world_pos = ( self.world_pos[0], self.world_pos[1], self.world_pos[2]+delta )
+        self.camera.dolly( delta )
+        self.interact()
+        self.Refresh( False )
         
     def processEraseBackgroundEvent( self, event ):
         """Process the erase background event."""
@@ -159,6 +262,7 @@ class GLFrame( glcanvas.GLCanvas ):
             self.GLinitialized = True
 
         if self.graph.requires_compilation:
+            self.interact()
             self.compileFGShaders()
         self.OnPaintGL()
         event.Skip()
@@ -180,18 +284,87 @@ class GLFrame( glcanvas.GLCanvas ):
         width, height = self.GetGLExtents()
         bgdata = [[width,height,0.],  [0.,height,0.],  [width,0.,0.],  [0.,0.,0.]]
         self.bgvbo = vbo.VBO( np.array( bgdata, 'f' ) )
+        self.camera.setViewport( width, height )
+        ortho( 0, width, 0, height, -1, 1, out=self.bgmvp )
         
         self.compileBGShaders()
         
-        cube = Obj3D( File3D )
-        fgdata = cube.getVerticesAndNormalsFlat()
-        self.fgvbo = vbo.VBO( np.array( fgdata, 'f' ) )
+        cube = MESH_LOADERS[os.path.splitext( File3D )[1].lower()]( File3D )
+        lods = mesh.iterLODChain( *cube.getArrays() )
+        full = next( lods )
+        self.mesh_center, self.mesh_radius = mesh.boundingSphere( full[:, :3] )
+        
+        # all levels share the bounds of the full mesh for position quantization
+        positions = full[:, :3]
+        self.mesh_bounds = positions.min( axis=0 ), positions.max( axis=0 )
+        InputMeshNode.position_format = POSITION_FORMAT
+        InputMeshNode.normal_format = NORMAL_FORMAT
+        self.fgvbos = []
+        self.fgchunks = []
+        self.lod_triangles = []
+        packed, self.fgattributes, chunks, perror, nerror = self.packLOD( full )
+        self.addLOD( packed, chunks )
+        self.showStatus( f'Vertex format {POSITION_FORMAT}/{NORMAL_FORMAT}: {packed.dtype.itemsize} bytes per vertex, '
+                         f'max position error {perror:.2e} of bounds diagonal, max normal error {nerror:.3f} degrees' )
+        self.fgstride = packed.dtype.itemsize
+        # simplifying takes seconds on large meshes, the full mesh is drawn until the coarser levels arrive
+        threading.Thread( target=self.buildLODs, args=( lods, ), daemon=True ).start()
+        
+        self.setInstanceCount( self.instance_count )
         
         self.compileFGShaders()
         
         if REALTIME:
             self.timer.Start(1000/60)    # 1 second interval
         
+    def setInstanceCount( self, count ):
+        """Lay out `count` copies of the mesh on a cube shaped grid centered on the origin."""
+        self.instance_count = count
+        side = int( np.ceil( count ** (1/3) ) )
+        cells = np.indices( (side, side, side) ).reshape( 3, -1 ).T[:count]
+        spacing = 2.5 * self.mesh_radius
+        offsets = ( cells - (side-1)/2 ) * spacing
+        transforms = translateBatch( np.identity( 4, 'f' ), offsets[:, 0], offsets[:, 1], offsets[:, 2] )
+        
+        # GLSL reads a mat4 attribute as four column vectors
+        if self.instancevbo:
+            self.instancevbo.delete()
+        self.instancevbo = vbo.VBO( np.ascontiguousarray( transforms.transpose( 0, 2, 1 ) ) )
+        
+    def placesInstances( self ):
+        """Whether the vertex shader applies the Instance node's Transform, without it every copy is drawn in the same place."""
+        visited = set()
+        pending = [self.graph.getVertexShaderNode()]
+        while pending:
+            for plug in pending.pop().inplugs.values():
+                source = plug.value
+                if not isinstance( source, Plug ):
+                    continue
+                if isinstance( source.parent, InstanceNode ) and source.name == 'Transform':
+                    return True
+                if source.parent not in visited:
+                    visited.add( source.parent )
+                    pending.append( source.parent )
+        return False
+        
+    def benchmarkInstancing( self, counts=(1, 10, 100, 1000, 10000), frames=20 ):
+        """Print the average frame time for growing instance counts."""
+        if not self.placesInstances():
+            print( 'instancing benchmark skipped: the vertex shader does not apply the Instance Transform, copies would only measure overdraw' )
+            return
+        current = self.instance_count
+        for count in counts:
+            self.setInstanceCount( count )
+            self.OnPaintGL()
+            glFinish()
+            start = time.perf_counter()
+            for i in range( frames ):
+                self.OnPaintGL()
+            glFinish()
+            elapsed = ( time.perf_counter()-start ) / frames
+            print( f'{count} instances: {elapsed*1000:.2f}ms per frame, {self.triangles_drawn} triangles' )
+        self.setInstanceCount( current )
+        
     def compileBGShaders(self):
         try:
             VERTEX_SHADER = shaders.compileShader( vertexBGShader, GL_VERTEX_SHADER )
@@ -239,8 +412,23 @@ class GLFrame( glcanvas.GLCanvas ):
         return vertexShader, fragmentShader
         
     def compileFGShaders(self):
+        # mismatched types would only fail in the driver, without saying which plug
+        errors = checkTypes(self.graph)
+        if errors:
+            self.graph.requires_compilation = False
+            self.graph.in_error = True
+            for message in errors.values():
+                print(message)
+            return
         try:
             vertexShader, fragmentShader = self.generateCode()
+            key = (vertexShader, fragmentShader)
+            if key in self.programs:
+                self.programs.move_to_end(key)
+                self.fgshader = self.programs[key]
+                self.graph.requires_compilation = False
+                self.graph.in_error = False
+                return
             
             # Vertex Shader
             print('====Vertex Shader======')
@@ -255,6 +443,10 @@ class GLFrame( glcanvas.GLCanvas ):
             FRAGMENT_SHADER = shaders.compileShader( fragmentShader, GL_FRAGMENT_SHADER )
             
             self.fgshader = shaders.compileProgram( VERTEX_SHADER, FRAGMENT_SHADER )
+            self.programs[key] = self.fgshader
+            if len(self.programs) > PROGRAM_CACHE_SIZE:
+                _, program = self.programs.popitem(last=False)
+                glDeleteProgram(program)
 
             self.graph.requires_compilation = False
             self.graph.in_error = False
@@ -268,6 +460,8 @@ class GLFrame( glcanvas.GLCanvas ):
     def OnReshape( self, width, height ):
         """Reshape the OpenGL viewport based on the dimensions of the window."""
         glViewport( 0, 0, width, height )
+        self.camera.setViewport( width, height )
+        ortho( 0, width, 0, height, -1, 1, out=self.bgmvp )
         
         if self.GLinitialized:
             bgdata = [[width,height,0.],  [0.,height,0.],  [width,0.,0.],  [0.,0.,0.]]
@@ -276,26 +470,89 @@ class GLFrame( glcanvas.GLCanvas ):
             self.bgvbo = vbo.VBO( np.array( bgdata, 'f' ) )
         
     def getMVP( self ):
-        width, height = self.GetGLExtents()
-        MVP = perspective(45.0, width / height, self.near_plane, self.far_plane);
-        
-        MVP = translate( MVP, self.world_pos[0], self.world_pos[1], self.world_pos[2] )
-        MVP = rotate( MVP, self.world_rot[1], 0, 1, 0 )
-        MVP = rotate( MVP, self.world_rot[0], 1, 0, 0 )
+        return (1, True, self.camera.getMVP())
+        
+    def packLOD( self, data ):
+        """Packed vertices of a level with their attribute layout, its chunks and the position and normal errors of the packing."""
+        data, *chunks = mesh.buildChunks( data )
+        packed, attributes, perror, nerror = mesh.packVertices( data, POSITION_FORMAT, NORMAL_FORMAT, self.mesh_bounds )
+        return packed, attributes, chunks, perror, nerror
+
+    def buildLODs( self, lods ):
+        """Worker thread: simplify and pack the coarser levels, handing each to the UI thread."""
+        for data in lods:
+            packed, attributes, chunks, perror, nerror = self.packLOD( data )
+            wx.CallAfter( self.addLOD, packed, chunks )
+
+    def addLOD( self, packed, chunks ):
+        """Make the next coarser level available to selectLOD."""
+        # the window may have closed while the level was built
+        if not self:
+            return
+        self.fgvbos.append( vbo.VBO( packed ) )
+        self.fgchunks.append( chunks )
+        self.lod_triangles.append( len( packed ) // 3 )
+        if len( self.fgvbos ) > 1:
+            self.Refresh( False )
+
+    def selectLOD( self ):
+        _, _, MVP = self.getMVP()
+        _, height = self.GetGLExtents()
+        radius = mesh.projectedRadius( MVP, self.mesh_center, self.mesh_radius, height )
+        return mesh.selectLOD( self.lod_triangles, radius )
+        
+    def showStatus( self, text ):
+        """Show a diagnostic in the status bar of the frame, if it has one."""
+        top = wx.GetTopLevelParent( self )
+        if top and top.GetStatusBar():
+            top.SetStatusText( text )
+
+    def bindRenderTarget( self ):
+        """Bind the offscreen target for the current render scale, None at full resolution."""
+        interacting = DYNAMIC_RESOLUTION and time.perf_counter() < self.interaction_end
+        scale = self.scaler.scale if interacting else self.scaler.max_scale
+        if scale != self.render_scale:
+            self.render_scale = scale
+            self.showStatus( f'Preview scale {round( scale*100 )}%' )
+        
+        if self.render_scale >= 1:
+            return None
+        
+        size = self.GetRenderExtents()
+        if size != self.fbo_size:
+            self.deleteRenderTarget()
+            self.fbo = glGenFramebuffers( 1 )
+            self.fbo_color, self.fbo_depth = glGenRenderbuffers( 2 )
+            glBindRenderbuffer( GL_RENDERBUFFER, self.fbo_color )
+            glRenderbufferStorage( GL_RENDERBUFFER, GL_RGBA8, *size )
+            glBindRenderbuffer( GL_RENDERBUFFER, self.fbo_depth )
+            glRenderbufferStorage( GL_RENDERBUFFER, GL_DEPTH_COMPONENT24, *size )
+            glBindRenderbuffer( GL_RENDERBUFFER, 0 )
+            glBindFramebuffer( GL_FRAMEBUFFER, self.fbo )
+            glFramebufferRenderbuffer( GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_RENDERBUFFER, self.fbo_color )
+            glFramebufferRenderbuffer( GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT, GL_RENDERBUFFER, self.fbo_depth )
+            self.fbo_size = size
+            
+        glBindFramebuffer( GL_FRAMEBUFFER, self.fbo )
+        glViewport( 0, 0, *size )
+        return size
         
-        return (1, True, MVP)
+    def deleteRenderTarget( self ):
+        if self.fbo:
+            glDeleteFramebuffers( 1, [self.fbo] )
+            glDeleteRenderbuffers( 2, [self.fbo_color, self.fbo_depth] )
+            self.fbo = None
+            self.fbo_size = (0, 0)
         
     def OnPaintGL( self ):
+        start = time.perf_counter()
+        target = self.bindRenderTarget()
         glClear( GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT )
 
-        width, height = self.GetGLExtents()
-        
         if RENDER_BACKGROUND:
-            MVP = ortho( 0,width, 0, height, -1, 1 )
-            
             shaders.glUseProgram( self.bgshader )
             
-            glUniformMatrix4fv( glGetUniformLocation(self.bgshader, 'MVP'), 1, True, MVP )
+            glUniformMatrix4fv( glGetUniformLocation(self.bgshader, 'MVP'), 1, True, self.bgmvp )
             
             self.bgvbo.bind()
             glEnableClientState( GL_VERTEX_ARRAY );
@@ -309,11 +566,18 @@ class GLFrame( glcanvas.GLCanvas ):
         if RENDER_FOREGROUND:
             shaders.glUseProgram( self.fgshader )
             
-            self.fgvbo.bind()
-            glEnableVertexAttribArray( 0 )
-            glEnableVertexAttribArray( 1 )
-            glVertexAttribPointer( 0, 3, GL_FLOAT, GL_FALSE, 24, self.fgvbo )
-            glVertexAttribPointer( 1, 3, GL_FLOAT, GL_FALSE, 24, self.fgvbo+12 )
+            self.lod_level = self.selectLOD()
+            fgvbo = self.fgvbos[self.lod_level]
+            
+            fgvbo.bind()
+            for location, size, gltype, normalized, offset in self.fgattributes:
+                glEnableVertexAttribArray( location )
+                glVertexAttribPointer( location, size, GL_TYPES[gltype], normalized, self.fgstride, fgvbo+offset )
+            
+            if POSITION_FORMAT == 'quantized':
+                lo, hi = self.mesh_bounds
+                glUniform3f( glGetUniformLocation(self.fgshader, 'sg_BoundsMin'), *lo )
+                glUniform3f( glGetUniformLocation(self.fgshader, 'sg_BoundsSize'), *(hi-lo) )
             
             for uname, ucount, ufuncs in self.graph.uniforms.values():
                 UNIFORM_FUNCTION[ucount]( glGetUniformLocation(self.fgshader, uname), *ufuncs() )
@@ -323,22 +587,69 @@ class GLFrame( glcanvas.GLCanvas ):
                 
             for name, value in custom_fs_nodes.items():
                 value[4]( glGetUniformLocation(self.fgshader, name), *eval(value[3]) )
+            
+            glUniform1f( glGetUniformLocation(self.fgshader, 'sg_RenderScale'), self.render_scale )
                 
-            glDrawArrays( GL_TRIANGLES, 0, len( self.fgvbo ) )
+            fgvbo.unbind()
+            
+            # per instance transforms, one mat4 over four attribute locations
+            self.instancevbo.bind()
+            for column in range( 4 ):
+                glEnableVertexAttribArray( 2+column )
+                glVertexAttribPointer( 2+column, 4, GL_FLOAT, GL_FALSE, 64, self.instancevbo+column*16 )
+                glVertexAttribDivisor( 2+column, 1 )
+            self.instancevbo.unbind()
             
-            self.fgvbo.unbind()
-            glDisableVertexAttribArray( 0 )
-            glDisableVertexAttribArray( 1 )
+            if self.instance_count > 1:
+                # chunk bounds only hold for a single instance, draw whole level
+                vertices = len( fgvbo )
+                glDrawArraysInstanced( GL_TRIANGLES, 0, vertices, self.instance_count )
+                self.triangles_drawn = vertices // 3 * self.instance_count
+                self.chunks_drawn, self.chunks_culled = len( self.fgchunks[self.lod_level][0] ), 0
+            else:
+                # draw only the chunks inside the view frustum
+                firsts, counts, centers, radii, lo, hi = self.fgchunks[self.lod_level]
+                visible = mesh.visibleChunks( self.getMVP()[2], centers, radii, lo, hi )
+                firsts, counts = firsts[visible], counts[visible]
+                if len( firsts ):
+                    glMultiDrawArrays( GL_TRIANGLES, firsts, counts, len( firsts ) )
+                self.triangles_drawn = int( counts.sum() ) // 3
+                self.chunks_drawn = len( firsts )
+                self.chunks_culled = len( visible ) - len( firsts )
+            
+            for location, *_ in self.fgattributes:
+                glDisableVertexAttribArray( location )
+            for column in range( 4 ):
+                glVertexAttribDivisor( 2+column, 0 )
+                glDisableVertexAttribArray( 2+column )
         
         shaders.glUseProgram( 0 )
         
+        # upscale the offscreen target to the window
+        if target:
+            width, height = self.GetGLExtents()
+            glBindFramebuffer( GL_READ_FRAMEBUFFER, self.fbo )
+            glBindFramebuffer( GL_DRAW_FRAMEBUFFER, 0 )
+            glBlitFramebuffer( 0, 0, *target, 0, 0, width, height, GL_COLOR_BUFFER_BIT, GL_LINEAR )
+            glBindFramebuffer( GL_FRAMEBUFFER, 0 )
+            glViewport( 0, 0, width, height )
+        
         self.SwapBuffers()
+        self.frame_time = ( time.perf_counter()-start ) * 1000
+        if time.perf_counter() < self.interaction_end:
+            self.scaler.update( self.frame_time )
         
 if __name__=='__main__':
+    import sys
+    
     a = wx.App()
     f = wx.Frame(None)
     gf = GLFrame(f, ShaderGraph())
     f.Show()
+    
+    # python glframe.py instancing: frame time as the instance count grows
+    if 'instancing' in sys.argv[1:]:
+        wx.CallLater( 500, gf.benchmarkInstancing )
 
     a.MainLoop()
     a.Destroy()
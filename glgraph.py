@@ -0,0 +1,717 @@
+import math
+import numpy as np
+import time
+
+import wx
+from wx import glcanvas
+
+from shadergraph import Plug, ColorValue, FloatValue, StringValue, ListValue
+from spatialindex import GridIndex
+
+from OpenGL.GL import *
+from OpenGL.arrays import vbo
+from OpenGL.GL import shaders
+
+# same zoom range and level of detail as GraphWindow
+MIN_ZOOM = 0.05
+MAX_ZOOM = 4.0
+LOD_ZOOM = 0.5
+EDGE_CURVATURE = 50
+# line segments per connection curve
+CURVE_SEGMENTS = 16
+
+PLUG_CIRCLE_RADIUS = 4
+PLUG_VALUE_GAP = 6
+
+# rectangles and ellipses, one instanced quad each
+SHAPE_DTYPE = np.dtype( [( 'rect', '<f4', 4 ), ( 'kind', '<f4' ), ( 'outline', '<f4' ), ( 'fill', 'u1', 4 ), ( 'border', 'u1', 4 )] )
+SHAPE_RECT, SHAPE_ELLIPSE = 0, 1
+# one instanced quad per character
+GLYPH_DTYPE = np.dtype( [( 'rect', '<f4', 4 ), ( 'uv', '<f4', 4 ), ( 'color', 'u1', 4 )] )
+EDGE_DTYPE = np.dtype( [( 'pos', '<f4', 2 )] )
+
+BLACK = ( 0, 0, 0, 255 )
+WHITE = ( 250, 250, 250, 255 )
+HALO = ( 100, 100, 100, 200 )
+
+commonShader = """
+#version 330
+
+uniform vec4 View; // pan x, pan y, zoom
+uniform vec2 Viewport;
+
+vec4 toClip( vec2 p ) {
+    vec2 s = p*View.z + View.xy;
+    return vec4( s.x/Viewport.x*2-1, 1-s.y/Viewport.y*2, 0, 1 );
+}
+"""
+
+vertexGridShader = """
+#version 330
+
+void main() {
+    gl_Position = vec4( (gl_VertexID&1)*2-1, (gl_VertexID>>1)*2-1, 0, 1 );
+}
+"""
+
+fragmentGridShader = """
+#version 330
+
+uniform vec4 View;
+uniform vec2 Viewport;
+out vec4 sg_FragColor;
+
+void main() {
+    vec2 s = vec2( gl_FragCoord.x, Viewport.y-gl_FragCoord.y );
+    vec2 origin = Viewport/2*View.z + View.xy;
+    float step = 50*View.z;
+    vec2 d = abs( s-origin );
+    sg_FragColor = vec4( 200, 200, 200, 255 )/255;
+    if( step >= 8 && any( lessThan( mod( s-origin+.5, step ), vec2( 1 ) ) ) )
+        sg_FragColor = vec4( 150, 150, 150, 255 )/255;
+    if( any( lessThan( d, vec2( .5 ) ) ) )
+        sg_FragColor = vec4( 100, 100, 100, 255 )/255;
+}
+"""
+
+vertexShapeShader = """
+layout(location = 0) in vec4 Rect;
+layout(location = 1) in float Kind;
+layout(location = 2) in float Outline;
+layout(location = 3) in vec4 Fill;
+layout(location = 4) in vec4 Border;
+
+out vec2 Local;
+flat out vec2 Size;
+flat out float ShapeKind;
+flat out float OutlineWidth;
+flat out vec4 FillColor;
+flat out vec4 BorderColor;
+
+void main() {
+    vec2 corner = vec2( gl_VertexID&1, gl_VertexID>>1 );
+    Local = corner*Rect.zw;
+    Size = Rect.zw;
+    ShapeKind = Kind;
+    OutlineWidth = Outline;
+    FillColor = Fill;
+    BorderColor = Border;
+    gl_Position = toClip( Rect.xy + Local );
+}
+"""
+
+fragmentShapeShader = """
+#version 330
+
+uniform vec4 View;
+
+in vec2 Local;
+flat in vec2 Size;
+flat in float ShapeKind;
+flat in float OutlineWidth;
+flat in vec4 FillColor;
+flat in vec4 BorderColor;
+out vec4 sg_FragColor;
+
+void main() {
+    // distance to the edge in screen pixels
+    float edge;
+    if( ShapeKind == 1 ) {
+        vec2 p = (Local/Size-.5)*2;
+        float r = length( p );
+        if( r > 1 ) discard;
+        edge = (1-r)*min( Size.x, Size.y )/2*View.z;
+    }
+    else {
+        vec2 d = min( Local, Size-Local );
+        edge = min( d.x, d.y )*View.z;
+    }
+    sg_FragColor = edge < OutlineWidth ? BorderColor : FillColor;
+}
+"""
+
+vertexGlyphShader = """
+layout(location = 0) in vec4 Rect;
+layout(location = 1) in vec4 UV;
+layout(location = 2) in vec4 Color;
+
+out vec2 TexCoord;
+flat out vec4 TextColor;
+
+void main() {
+    vec2 corner = vec2( gl_VertexID&1, gl_VertexID>>1 );
+    TexCoord = mix( UV.xy, UV.zw, corner );
+    TextColor = Color;
+    gl_Position = toClip( Rect.xy + corner*Rect.zw );
+}
+"""
+
+fragmentGlyphShader = """
+#version 330
+
+uniform sampler2D Atlas;
+
+in vec2 TexCoord;
+flat in vec4 TextColor;
+out vec4 sg_FragColor;
+
+void main() {
+    float coverage = texture( Atlas, TexCoord ).r;
+    if( coverage == 0 ) discard;
+    sg_FragColor = vec4( TextColor.rgb, TextColor.a*coverage );
+}
+"""
+
+vertexEdgeShader = """
+layout(location = 0) in vec2 Position;
+
+void main() {
+    gl_Position = toClip( Position );
+}
+"""
+
+fragmentEdgeShader = """
+#version 330
+
+out vec4 sg_FragColor;
+
+void main() {
+    sg_FragColor = vec4( 0, 0, 0, 1 );
+}
+"""
+
+class GlyphAtlas:
+    """Printable ASCII characters of a font rendered once into a single channel texture."""
+    def __init__( self, font, first=32, last=126 ):
+        self.first = first
+        self.count = last-first+1
+        dc = wx.MemoryDC( wx.Bitmap( 1, 1 ) )
+        dc.SetFont( font )
+        extents = [dc.GetTextExtent( chr( c ) ) for c in range( first, last+1 )]
+        self.advance = np.array( [w for w, h in extents], 'f' )
+        self.height = max( h for w, h in extents )
+
+        cellw, cellh = int( self.advance.max() )+2, self.height+2
+        columns = 16
+        rows = math.ceil( self.count/columns )
+        width, height = columns*cellw, rows*cellh
+        bitmap = wx.Bitmap( width, height, 24 )
+        dc.SelectObject( bitmap )
+        dc.SetBackground( wx.BLACK_BRUSH )
+        dc.Clear()
+        dc.SetTextForeground( wx.WHITE )
+        cells = np.arange( self.count )
+        x, y = cells%columns*cellw+1, cells//columns*cellh+1
+        for i, c in enumerate( range( first, last+1 ) ):
+            dc.DrawText( chr( c ), int( x[i] ), int( y[i] ) )
+        dc.SelectObject( wx.NullBitmap )
+
+        image = bitmap.ConvertToImage()
+        self.pixels = np.frombuffer( bytes( image.GetData() ), 'u1' ).reshape( height, width, 3 )[:, :, 0].copy()
+        self.size = ( width, height )
+        self.uv = np.stack( [x/width, y/height, ( x+self.advance )/width, ( y+self.height )/height], -1 ).astype( 'f' )
+        self.texture = None
+
+    def codes( self, text ):
+        codes = np.frombuffer( text.encode( 'ascii', 'replace' ), 'u1' ).astype( np.int64 ) - self.first
+        codes[( codes < 0 ) | ( codes >= self.count )] = ord( '?' ) - self.first
+        return codes
+
+    def measure( self, text ):
+        return float( self.advance[self.codes( text )].sum() )
+
+    def layout( self, texts, color=BLACK ):
+        """Glyph records of (text, x, y) runs."""
+        text = ''.join( t for t, _, _ in texts )
+        codes = self.codes( text )
+        glyphs = np.zeros( len( codes ), GLYPH_DTYPE )
+        if not len( codes ):
+            return glyphs
+        lengths = [len( t ) for t, _, _ in texts]
+        run = np.repeat( np.arange( len( texts ) ), lengths )
+        advance = self.advance[codes]
+        # pen position restarts at the beginning of every run
+        offset = np.cumsum( advance ) - advance
+        starts = np.cumsum( [0]+lengths[:-1] )
+        offset -= offset[np.minimum( starts, len( codes )-1 )][run]
+        origins = np.array( [( x, y ) for _, x, y in texts], 'f' )
+        glyphs['rect'][:, 0] = origins[run, 0] + offset
+        glyphs['rect'][:, 1] = origins[run, 1]
+        glyphs['rect'][:, 2] = advance
+        glyphs['rect'][:, 3] = self.height
+        glyphs['uv'] = self.uv[codes]
+        glyphs['color'] = color
+        return glyphs
+
+    def bind( self ):
+        if self.texture is None:
+            self.texture = glGenTextures( 1 )
+            glBindTexture( GL_TEXTURE_2D, self.texture )
+            glPixelStorei( GL_UNPACK_ALIGNMENT, 1 )
+            glTexImage2D( GL_TEXTURE_2D, 0, GL_R8, *self.size, 0, GL_RED, GL_UNSIGNED_BYTE, self.pixels )
+            glTexParameteri( GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR )
+            glTexParameteri( GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR )
+        glBindTexture( GL_TEXTURE_2D, self.texture )
+
+class SlotBuffer:
+    """Vertex buffer of records grouped by key.
+
+    Every key owns a contiguous range. Rewriting a key with the same number of
+    records updates it in place, so only the changed bytes are uploaded.
+    Freed ranges are zeroed (degenerate quads) and reclaimed by compacting once
+    they make up half of the buffer.
+    """
+    def __init__( self, dtype, capacity=1024 ):
+        self.dtype = dtype
+        self.data = np.zeros( capacity, dtype )
+        self.slots = {}
+        self.end = 0
+        self.waste = 0
+        self.vbo = vbo.VBO( self.data, usage=GL_DYNAMIC_DRAW )
+        self.dirty = None
+
+    def __len__( self ):
+        return self.end
+
+    def set( self, key, records ):
+        n = len( records )
+        slot = self.slots.get( key )
+        if not slot or slot[1] != n:
+            self.free( key )
+            slot = self.slots[key] = ( self.allocate( n ), n )
+        start = slot[0]
+        self.data[start:start+n] = records
+        self.markDirty( start, start+n )
+
+    def free( self, key ):
+        slot = self.slots.pop( key, None )
+        if slot:
+            start, n = slot
+            self.data[start:start+n] = 0
+            self.markDirty( start, start+n )
+            self.waste += n
+            if self.waste > max( 1024, self.end//2 ):
+                self.compact()
+
+    def clear( self ):
+        self.slots.clear()
+        self.data[:self.end] = 0
+        self.end = self.waste = 0
+        self.dirty = None
+
+    def allocate( self, n ):
+        if self.end+n > len( self.data ):
+            data = np.zeros( max( 2*len( self.data ), self.end+n ), self.dtype )
+            data[:self.end] = self.data[:self.end]
+            self.data = data
+            self.vbo.set_array( self.data )
+            self.dirty = None
+        start = self.end
+        self.end += n
+        return start
+
+    def compact( self ):
+        data = np.zeros( len( self.data ), self.dtype )
+        end = 0
+        for key, ( start, n ) in self.slots.items():
+            data[end:end+n] = self.data[start:start+n]
+            self.slots[key] = ( end, n )
+            end += n
+        self.data, self.end, self.waste = data, end, 0
+        self.vbo.set_array( self.data )
+        self.dirty = None
+
+    def markDirty( self, lo, hi ):
+        if self.dirty:
+            lo, hi = min( lo, self.dirty[0] ), max( hi, self.dirty[1] )
+        self.dirty = ( lo, hi )
+
+    def bind( self ):
+        """Bind the buffer, uploading the records changed since the last draw."""
+        # binding uploads the whole array after set_array, otherwise only the changed range is sent
+        uploaded = self.vbo.copied
+        self.vbo.bind()
+        if self.dirty and uploaded:
+            lo, hi = self.dirty
+            # as bytes, the record dtype is not accepted by the array handlers
+            glBufferSubData( GL_ARRAY_BUFFER, lo*self.data.itemsize, ( hi-lo )*self.data.itemsize, self.data[lo:hi].view( np.uint8 ) )
+        self.dirty = None
+
+def tessellate( p1, p2 ):
+    """Line segment vertices (E, 2*CURVE_SEGMENTS, 2) of the connection curves from input plugs p1 to output plugs p2."""
+    ctx = np.minimum( EDGE_CURVATURE, np.linalg.norm( p1-p2, axis=1 ) )
+    c1, c2 = p1.copy(), p2.copy()
+    c1[:, 0] -= ctx
+    c2[:, 0] += ctx
+    t = np.linspace( 0, 1, CURVE_SEGMENTS+1, dtype='f' )[None, :, None]
+    s = 1-t
+    points = s**3*p1[:, None] + 3*s*s*t*c1[:, None] + 3*s*t*t*c2[:, None] + t**3*p2[:, None]
+    return np.stack( [points[:, :-1], points[:, 1:]], 2 ).reshape( len( p1 ), -1, 2 ).astype( 'f' )
+
+class GLGraphCanvas( glcanvas.GLCanvas ):
+    """Graph editor view drawn with OpenGL.
+
+    Node boxes and plug circles are instanced quads, text comes from a glyph
+    atlas and connections are tessellated into one line buffer. Geometry is
+    only rebuilt for nodes marked changed, panning and zooming just update two
+    uniforms. Nodes can be selected, moved and deleted; connections are edited
+    in GraphWindow.
+    """
+    def __init__( self, parent, graph ):
+        attribList = (glcanvas.WX_GL_RGBA, glcanvas.WX_GL_DOUBLEBUFFER)
+        super().__init__( parent, attribList=attribList )
+        self.context = glcanvas.GLContext( self )
+        self.GLinitialized = False
+
+        self.graph = graph
+        self.panx = self.pany = 0
+        self.zoom = 1.0
+        self.lastx = self.lasty = 0
+        self.selected_nodes = set()
+        self.dragging = False
+        self.drag_start = {}
+
+        self.atlas = GlyphAtlas( self.GetFont() )
+        self.TXT4WIDTH = self.atlas.measure( 'TEXT' )
+        self.TXTHEIGHT = self.atlas.height
+
+        self.boxes = self.details = self.glyphs = self.edges = None
+        self.nodeIndex = GridIndex()
+        self.nodeRects = {}
+        self.pluglocation = {}
+        self.edgeSource = {}
+        self.edgesFrom = {}
+        self.dirty_nodes = set()
+        self.dirty_edges = set()
+
+        # frame statistics
+        self.frame_count = 0
+        self.frame_time = 0
+        self.frame_start = time.perf_counter()
+        self.profile = False
+
+        self.Bind( wx.EVT_ERASE_BACKGROUND, lambda event: None )
+        self.Bind( wx.EVT_SIZE, lambda event: self.Refresh( False ) )
+        self.Bind( wx.EVT_PAINT, self.OnPaint )
+        self.Bind( wx.EVT_MOUSEWHEEL, self.OnMouseWheel )
+        self.Bind( wx.EVT_MOTION, self.OnMouseMotion )
+        self.Bind( wx.EVT_LEFT_DOWN, self.OnLeftDown )
+        self.Bind( wx.EVT_LEFT_UP, self.OnLeftUp )
+        self.Bind( wx.EVT_KEY_DOWN, self.OnKeyDown )
+
+    def SetGraph( self, graph ):
+        self.graph = graph
+        self.selected_nodes.clear()
+        self.syncGeometry()
+
+    def syncGeometry( self ):
+        """Rebuild the geometry of every node, e.g. after the graph was replaced."""
+        for buffer in ( self.boxes, self.details, self.glyphs, self.edges ):
+            if buffer:
+                buffer.clear()
+        self.nodeIndex.clear()
+        self.nodeRects.clear()
+        self.pluglocation.clear()
+        self.edgeSource.clear()
+        self.edgesFrom.clear()
+        self.dirty_nodes = set( node for node in self.graph.nodes if node )
+        self.Refresh( False )
+
+    def updateNode( self, node ):
+        """Mark a node changed (moved, renamed, new values or selection)."""
+        self.dirty_nodes.add( node )
+        self.Refresh( False )
+
+    def graphEdited( self, operation, target ):
+        """Update the geometry after an edit made outside of the editor (undo, redo), target is a node or plug."""
+        if operation == 'remove':
+            self.removeNode( target )
+        elif operation in ( 'add', 'move' ):
+            self.updateNode( target )
+        elif operation != 'reset':
+            # values are drawn on the node
+            self.dirty_edges.add( target )
+            self.updateNode( target.parent )
+        self.Refresh( False )
+
+    def toGraph( self, x, y ):
+        return ( x-self.panx )/self.zoom, ( y-self.pany )/self.zoom
+
+    def initGL( self ):
+        self.gridshader = self.compile( vertexGridShader, fragmentGridShader )
+        self.shapeshader = self.compile( commonShader+vertexShapeShader, fragmentShapeShader )
+        self.glyphshader = self.compile( commonShader+vertexGlyphShader, fragmentGlyphShader )
+        self.edgeshader = self.compile( commonShader+vertexEdgeShader, fragmentEdgeShader )
+        self.boxes = SlotBuffer( SHAPE_DTYPE )
+        self.details = SlotBuffer( SHAPE_DTYPE )
+        self.glyphs = SlotBuffer( GLYPH_DTYPE )
+        self.edges = SlotBuffer( EDGE_DTYPE )
+        glEnable( GL_BLEND )
+        glBlendFunc( GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA )
+
+    def compile( self, vertexShader, fragmentShader ):
+        return shaders.compileProgram( shaders.compileShader( vertexShader, GL_VERTEX_SHADER ),
+                                       shaders.compileShader( fragmentShader, GL_FRAGMENT_SHADER ) )
+
+    def buildNode( self, node ):
+        """Write the boxes, plug circles and text of a node into the buffers."""
+        atlas = self.atlas
+        txtwidth, txtheight = atlas.measure( node.name ), self.TXTHEIGHT
+        outrows = [( plug, str( name ) ) for name, plug in node.outplugs.items() if plug.display]
+        inrows = [( plug, str( name ) ) for name, plug in node.inplugs.items() if plug.display]
+        widths = [atlas.measure( name ) for _, name in outrows+inrows]
+        txtwidth = max( [txtwidth]+widths )
+        width = txtwidth+4+15
+        height = txtheight+4 + len( widths )*( txtheight+4 )
+        locx, locy = node.location
+
+        boxes = []
+        if node in self.selected_nodes:
+            boxes.append( ( ( locx-3, locy-3, width+7, height+7 ), SHAPE_RECT, 0, HALO, HALO ) )
+        boxes.append( ( ( locx, locy, width, txtheight+4 ), SHAPE_RECT, 1, WHITE, BLACK ) )
+        boxes.append( ( ( locx, locy+txtheight+4, width, height-txtheight-4 ), SHAPE_RECT, 1, WHITE, BLACK ) )
+
+        details = []
+        texts = [( node.name, locx+2, locy+2 )]
+        if node.can_delete:
+            texts.append( ( 'X', locx+txtwidth+4+6, locy+2 ) )
+        plugs = {}
+        y = locy+txtheight+4
+        for ( plug, name ), w in zip( outrows, widths ):
+            y += 2
+            texts.append( ( name, locx+2 + ( txtwidth+11-w ), y ) )
+            if not plug.internal:
+                plugs[plug] = ( locx+2+txtwidth+6+10, y+txtheight/2 )
+            y += txtheight
+        for plug, name in inrows:
+            y += 2
+            valuex = locx+PLUG_VALUE_GAP
+            if isinstance( plug.value, ColorValue ):
+                details.append( ( ( valuex, y, self.TXT4WIDTH, txtheight ), SHAPE_RECT, 1, tuple( int( c ) for c in plug.value.GetColorInt() ), BLACK ) )
+            elif isinstance( plug.value, FloatValue ):
+                details.append( ( ( valuex, y, self.TXT4WIDTH, txtheight ), SHAPE_RECT, 1, WHITE, BLACK ) )
+                texts.append( ( plug.value.GetFloat(), valuex+3, y ) )
+            elif isinstance( plug.value, ( StringValue, ListValue ) ):
+                details.append( ( ( valuex, y, self.TXT4WIDTH*2, txtheight ), SHAPE_RECT, 1, WHITE, BLACK ) )
+                texts.append( ( str( plug.value.value ), valuex+3, y ) )
+            else:
+                texts.append( ( name, valuex, y ) )
+            if not plug.internal:
+                plugs[plug] = ( locx, y+txtheight/2 )
+            y += txtheight
+        r = PLUG_CIRCLE_RADIUS
+        for x, y in plugs.values():
+            details.append( ( ( x-r, y-r, 2*r, 2*r ), SHAPE_ELLIPSE, 1, WHITE, BLACK ) )
+
+        self.boxes.set( node, np.array( boxes, SHAPE_DTYPE ) )
+        self.details.set( node, np.array( details, SHAPE_DTYPE ) )
+        self.glyphs.set( node, atlas.layout( texts ) )
+
+        rect = ( locx, locy, width, height )
+        self.nodeRects[node] = rect
+        self.nodeIndex.update( node, rect )
+        for plug in list( node.inplugs.values() )+list( node.outplugs.values() ):
+            self.pluglocation.pop( plug, None )
+        self.pluglocation.update( plugs )
+
+        # connections ending or starting at the node
+        self.dirty_edges.update( node.inplugs.values() )
+        for plug in node.outplugs.values():
+            self.dirty_edges.update( self.edgesFrom.get( plug, () ) )
+
+    def removeNode( self, node ):
+        for buffer in ( self.boxes, self.details, self.glyphs ):
+            buffer.free( node )
+        self.nodeIndex.remove( node )
+        self.nodeRects.pop( node, None )
+        self.dirty_nodes.discard( node )
+        self.selected_nodes.discard( node )
+        for plug in node.inplugs.values():
+            self.pluglocation.pop( plug, None )
+            self.dirty_edges.add( plug )
+        for plug in node.outplugs.values():
+            self.pluglocation.pop( plug, None )
+            self.dirty_edges.update( self.edgesFrom.get( plug, () ) )
+
+    def buildEdges( self ):
+        """Tessellate the changed connections in one batch."""
+        edges = []
+        for plug in self.dirty_edges:
+            source = self.edgeSource.pop( plug, None )
+            if source is not None:
+                self.edgesFrom[source].discard( plug )
+            source = plug.value
+            if isinstance( source, Plug ) and source.parent and source.parent != plug.parent \
+               and plug in self.pluglocation and source in self.pluglocation:
+                self.edgeSource[plug] = source
+                self.edgesFrom.setdefault( source, set() ).add( plug )
+                edges.append( plug )
+            else:
+                self.edges.free( plug )
+        self.dirty_edges.clear()
+        if edges:
+            p1 = np.array( [self.pluglocation[plug] for plug in edges], 'f' )
+            p2 = np.array( [self.pluglocation[plug.value] for plug in edges], 'f' )
+            for plug, vertices in zip( edges, tessellate( p1, p2 ) ):
+                self.edges.set( plug, vertices.view( EDGE_DTYPE )[:, 0] )
+
+    def setView( self, program ):
+        width, height = self.GetClientSize()
+        glUseProgram( program )
+        glUniform4f( glGetUniformLocation( program, 'View' ), self.panx, self.pany, self.zoom, 0 )
+        glUniform2f( glGetUniformLocation( program, 'Viewport' ), width, height )
+
+    def drawInstanced( self, buffer, attributes ):
+        """One quad (triangle strip) per record of the buffer."""
+        buffer.bind()
+        stride = buffer.dtype.itemsize
+        for location, ( name, size, gltype, normalized ) in enumerate( attributes ):
+            glEnableVertexAttribArray( location )
+            glVertexAttribPointer( location, size, gltype, normalized, stride, buffer.vbo+buffer.dtype.fields[name][1] )
+            glVertexAttribDivisor( location, 1 )
+        glDrawArraysInstanced( GL_TRIANGLE_STRIP, 0, 4, len( buffer ) )
+        for location in range( len( attributes ) ):
+            glVertexAttribDivisor( location, 0 )
+            glDisableVertexAttribArray( location )
+        buffer.vbo.unbind()
+
+    def drawShapes( self, buffer ):
+        self.drawInstanced( buffer, [( 'rect', 4, GL_FLOAT, False ), ( 'kind', 1, GL_FLOAT, False ), ( 'outline', 1, GL_FLOAT, False ),
+                                     ( 'fill', 4, GL_UNSIGNED_BYTE, True ), ( 'border', 4, GL_UNSIGNED_BYTE, True )] )
+
+    def OnPaint( self, event ):
+        start = time.perf_counter()
+        wx.PaintDC( self )
+        self.SetCurrent( self.context )
+        if not self.GLinitialized:
+            self.initGL()
+            self.GLinitialized = True
+
+        for node in self.dirty_nodes:
+            self.buildNode( node )
+        self.dirty_nodes.clear()
+        if self.dirty_edges:
+            self.buildEdges()
+
+        width, height = self.GetClientSize()
+        glViewport( 0, 0, width, height )
+
+        self.setView( self.gridshader )
+        glDrawArrays( GL_TRIANGLE_STRIP, 0, 4 )
+
+        self.setView( self.shapeshader )
+        self.drawShapes( self.boxes )
+        if self.zoom >= LOD_ZOOM:
+            self.drawShapes( self.details )
+            self.setView( self.glyphshader )
+            glActiveTexture( GL_TEXTURE0 )
+            self.atlas.bind()
+            glUniform1i( glGetUniformLocation( self.glyphshader, 'Atlas' ), 0 )
+            self.drawInstanced( self.glyphs, [( 'rect', 4, GL_FLOAT, False ), ( 'uv', 4, GL_FLOAT, False ), ( 'color', 4, GL_UNSIGNED_BYTE, True )] )
+
+        self.setView( self.edgeshader )
+        self.edges.bind()
+        glEnableVertexAttribArray( 0 )
+        glVertexAttribPointer( 0, 2, GL_FLOAT, False, 0, self.edges.vbo )
+        glDrawArrays( GL_LINES, 0, len( self.edges ) )
+        glDisableVertexAttribArray( 0 )
+        self.edges.vbo.unbind()
+        glUseProgram( 0 )
+
+        self.SwapBuffers()
+
+        self.frame_count += 1
+        now = time.perf_counter()
+        self.frame_time += now-start
+        if self.profile and now-self.frame_start >= 1:
+            print( f'{len( self.nodeRects )} nodes: {self.frame_count/( now-self.frame_start ):.1f} frames/s, '
+                   f'{self.frame_time/self.frame_count*1000:.2f}ms per paint' )
+            self.frame_count = self.frame_time = 0
+            self.frame_start = now
+
+    def OnMouseWheel( self, event ):
+        """Zoom around the mouse position."""
+        x, y = event.GetPosition()
+        gx, gy = self.toGraph( x, y )
+        steps = event.GetWheelRotation() / ( event.GetWheelDelta() or 120 )
+        self.zoom = min( MAX_ZOOM, max( MIN_ZOOM, self.zoom * 1.15**steps ) )
+        self.panx, self.pany = x-gx*self.zoom, y-gy*self.zoom
+        self.Refresh( False )
+
+    def OnMouseMotion( self, event ):
+        x, y = event.GetPosition()
+        dx, dy = x-self.lastx, y-self.lasty
+        self.lastx, self.lasty = x, y
+        if event.Dragging() and event.MiddleIsDown():
+            self.panx += dx
+            self.pany += dy
+            self.Refresh( False )
+        elif event.Dragging() and event.LeftIsDown() and self.dragging:
+            for node in self.selected_nodes:
+                node.location[0] += dx/self.zoom
+                node.location[1] += dy/self.zoom
+                self.updateNode( node )
+
+    def OnLeftDown( self, event ):
+        self.SetFocus()
+        x, y = event.GetPosition()
+        self.lastx, self.lasty = x, y
+        nodes = self.nodeIndex.queryPoint( *self.toGraph( x, y ) )
+        node = nodes[0] if nodes else None
+        changed = set( self.selected_nodes )
+        if not wx.GetKeyState( wx.WXK_SHIFT ) and node not in self.selected_nodes:
+            self.selected_nodes.clear()
+        if node:
+            self.selected_nodes.add( node )
+        changed.symmetric_difference_update( self.selected_nodes )
+        for n in changed:
+            self.updateNode( n )
+        self.dragging = node is not None
+        self.drag_start = {n: list( n.location ) for n in self.selected_nodes}
+
+    def OnLeftUp( self, event ):
+        if self.dragging:
+            for node, start in self.drag_start.items():
+                if node.location != start:
+                    self.graph.moveNode( node, node.location, start )
+        self.dragging = False
+        self.drag_start = {}
+
+    def OnKeyDown( self, event ):
+        if event.GetKeyCode() == ord( 'D' ) and event.ControlDown():
+            # select downstream
+            for node in self.graph.downstream( self.selected_nodes ) - self.selected_nodes:
+                self.selected_nodes.add( node )
+                self.updateNode( node )
+        elif event.GetKeyCode() == wx.WXK_DELETE:
+            for node in list( self.selected_nodes ):
+                if node.can_delete:
+                    self.graph.removeNode( node )
+                    self.removeNode( node )
+            self.graph.requires_compilation = True
+            self.Refresh( False )
+
+if __name__ == '__main__':
+    # python glgraph.py 50000: frame times while panning across a generated graph
+    import sys
+    from shadergraph import ShaderGraph
+    from main import populateStressGraph
+
+    count = int( sys.argv[1] ) if len( sys.argv ) > 1 else 50000
+    app = wx.App()
+    frame = wx.Frame( None, title=f'GL graph canvas, {count} nodes', size=( 1000, 700 ) )
+    graph = ShaderGraph()
+    populateStressGraph( graph, count )
+    canvas = GLGraphCanvas( frame, graph )
+    canvas.profile = True
+    canvas.syncGeometry()
+    frame.Show()
+
+    timer = wx.Timer( frame )
+    def pan( event ):
+        canvas.panx -= 7
+        canvas.pany -= 3
+        canvas.Refresh( False )
+    frame.Bind( wx.EVT_TIMER, pan, timer )
+    timer.Start( 1 )
+    app.MainLoop()
@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+
+import io
+import json
+import pickle
+import struct
+import zlib
+import numpy as np
+
+from shadergraph import ShaderGraph, NodeFactory, Plug, node_classes
+from shadergraph import VertexShaderNode, FragmentShaderNode, InputMeshNode, VertexColorNode
+from shadergraph import Value, FloatValue, ColorValue, Vec3Value, Vec4Value, Mat4Value, StringValue, ListValue
+
+FORMAT_VERSION = 1
+MAGIC = b'GLSG'
+# header: magic, version, flags
+HEADER = struct.Struct( '<4sHH' )
+FLAG_ZLIB = 1
+# what parsing a damaged or foreign file can raise, reported by readGraph as ValueError
+PARSE_ERRORS = ( ValueError, KeyError, IndexError, TypeError, AttributeError, EOFError, OverflowError, struct.error, zlib.error, pickle.UnpicklingError )
+
+# nodes the factory does not offer, created by ShaderGraph.new
+BUILTIN_NODES = {
+    'Vertex Shader': VertexShaderNode,
+    'Fragment Shader': FragmentShaderNode,
+    'Input Mesh': InputMeshNode,
+    'Vertex Color': VertexColorNode,
+}
+
+NODE_FLAG_CAN_DELETE = 1
+NODE_FLAG_ACTIVE = 2
+
+NODE_RECORD = np.dtype( [( 'kind', '<u4' ), ( 'name', '<u4' ), ( 'x', '<f8' ), ( 'y', '<f8' ), ( 'flags', 'u1' )] )
+# numeric values point into the float pool, text values into the string table
+VALUE_RECORD = np.dtype( [( 'node', '<u4' ), ( 'plug', '<u4' ), ( 'type', 'u1' ), ( 'length', 'u1' ), ( 'data', '<u4' )] )
+EDGE_RECORD = np.dtype( [( 'node', '<u4' ), ( 'plug', '<u4' ), ( 'source', '<u4' ), ( 'source_plug', '<u4' )] )
+
+# value type name, class and the attribute holding the value
+VALUE_TYPES = [
+    ( 'float', FloatValue, 'value' ),
+    ( 'color', ColorValue, 'color' ),
+    ( 'vec3', Vec3Value, 'vector' ),
+    ( 'vec4', Vec4Value, 'vector' ),
+    ( 'mat4', Mat4Value, 'mat' ),
+    ( 'string', StringValue, 'value' ),
+    ( 'list', ListValue, 'value' ),
+    ( 'value', Value, 'value' ),
+    ( 'text', str, None ),
+]
+NUMERIC_TYPES = ( 'float', 'color', 'vec3', 'vec4', 'mat4' )
+VALUE_TYPE_IDS = {name: i for i, ( name, _, _ ) in enumerate( VALUE_TYPES )}
+
+def nodeKind( node ):
+    """Name the node is created by: its factory name, builtin name or custom node name."""
+    for name, cls in node_classes.items():
+        if type( node ) is cls:
+            return name
+    for name, cls in BUILTIN_NODES.items():
+        if type( node ) is cls:
+            return name
+    return node.name
+
+def newNode( kind ):
+    if kind in BUILTIN_NODES:
+        return BUILTIN_NODES[kind]()
+    node = NodeFactory.getNewNode( kind )
+    if node is None:
+        raise ValueError( f'unknown node kind {kind!r}' )
+    return node
+
+def encodeValue( value ):
+    """(type name, data) of a plug value; data is a list of floats or a string."""
+    for name, cls, attribute in VALUE_TYPES:
+        if type( value ) is cls:
+            if attribute is None:
+                return name, value
+            data = getattr( value, attribute )
+            if name == 'float':
+                return name, [float( data )]
+            if name in NUMERIC_TYPES:
+                return name, [float( v ) for v in data]
+            return name, str( data )
+    raise ValueError( f'cannot store plug values of type {type( value ).__name__}' )
+
+def decodeValue( name, data ):
+    _, cls, attribute = VALUE_TYPES[VALUE_TYPE_IDS[name]]
+    if attribute is None:
+        return data
+    value = cls()
+    if name == 'float':
+        data = data[0]
+    elif name in NUMERIC_TYPES:
+        data = tuple( data )
+    setattr( value, attribute, data )
+    return value
+
+def plugValues( node ):
+    """Encoded values of the input plugs of a node, for connected ones the value they return to when disconnected."""
+    return {name: list( encodeValue( plug.defaultValue if isinstance( plug.value, Plug ) else plug.value ) ) for name, plug in node.inplugs.items()}
+
+def graphDocument( graph ):
+    """Flat node table and edge list of a graph as plain Python data (the JSON form)."""
+    nodes = [node for node in graph.nodes if node]
+    index = {node: i for i, node in enumerate( nodes )}
+    table, edges = [], []
+    for i, node in enumerate( nodes ):
+        for name, plug in node.inplugs.items():
+            if isinstance( plug.value, Plug ) and plug.value.parent in index:
+                edges.append( [i, name, index[plug.value.parent], plug.value.name] )
+        table.append( {'kind': nodeKind( node ), 'name': node.name, 'location': [float( node.location[0] ), float( node.location[1] )],
+                       'can_delete': node.can_delete, 'active': node.active, 'values': plugValues( node )} )
+    return {'format': 'glsg', 'version': FORMAT_VERSION, 'nodes': table, 'edges': edges}
+
+def buildGraph( nodes, values, edges ):
+    """Create a ShaderGraph in one pass over the node table, then the values and edges.
+
+    nodes: (kind, name or None for the default, x, y, can_delete, active) rows
+    values: (node index, plug name, type name, data) rows
+    edges: (node index, plug name, source node index, source plug name) rows
+    """
+    graph = ShaderGraph()
+    graph.nodes.clear()
+    created = []
+    for kind, name, x, y, can_delete, active in nodes:
+        node = newNode( kind )
+        if name is not None:
+            node.name = name
+        node.location = [x, y]
+        node.can_delete = can_delete
+        node.active = active
+        created.append( node )
+        if kind == 'Vertex Shader':
+            graph.vsnode = node
+        elif kind == 'Fragment Shader':
+            graph.fsnode = node
+    for i, plug, name, data in values:
+        if plug in created[i].inplugs:
+            # also what the plug returns to when disconnected
+            value = created[i].inplugs[plug].defaultValue = decodeValue( name, data )
+            created[i].inplugs[plug].setValue( value )
+    for i, plug, source, sourceplug in edges:
+        created[i].inplugs[plug].setValue( created[source].outplugs[sourceplug] )
+    graph.nodes.extend( created )
+    graph.requires_compilation = True
+    return graph
+
+def documentTables( document ):
+    """(nodes, values, edges) rows of a graph document, as taken by buildGraph."""
+    if document.get( 'format' ) != 'glsg' or document.get( 'version', 0 ) > FORMAT_VERSION:
+        raise ValueError( 'not a supported shader graph document' )
+    nodes = [( n['kind'], n['name'], n['location'][0], n['location'][1], n['can_delete'], n.get( 'active', True ) ) for n in document['nodes']]
+    values = [( i, plug, name, data ) for i, n in enumerate( document['nodes'] ) for plug, ( name, data ) in n['values'].items()]
+    return nodes, values, document['edges']
+
+def documentGraph( document ):
+    return buildGraph( *documentTables( document ) )
+
+def encodeBinary( document, compress=True ):
+    """Binary form of a graph document: a string table, fixed size node, value and edge records and a float pool."""
+    strings, ids = [], {}
+    def string( s ):
+        if s not in ids:
+            ids[s] = len( strings )
+            strings.append( s )
+        return ids[s]
+
+    nodes = np.zeros( len( document['nodes'] ), NODE_RECORD )
+    values, floats = [], []
+    for i, n in enumerate( document['nodes'] ):
+        nodes[i] = ( string( n['kind'] ), string( n['name'] ), n['location'][0], n['location'][1],
+                     NODE_FLAG_CAN_DELETE*bool( n['can_delete'] ) | NODE_FLAG_ACTIVE*bool( n.get( 'active', True ) ) )
+        for plug, ( name, data ) in n['values'].items():
+            if name in NUMERIC_TYPES:
+                values.append( ( i, string( plug ), VALUE_TYPE_IDS[name], len( data ), len( floats ) ) )
+                floats.extend( data )
+            else:
+                values.append( ( i, string( plug ), VALUE_TYPE_IDS[name], 0, string( data ) ) )
+    values = np.array( values, VALUE_RECORD )
+    edges = np.array( [( i, string( plug ), source, string( sourceplug ) ) for i, plug, source, sourceplug in document['edges']], EDGE_RECORD )
+
+    encoded = [s.encode( 'utf-8' ) for s in strings]
+    body = [struct.pack( '<I', len( encoded ) ), np.array( [len( s ) for s in encoded], '<u4' ).tobytes(), b''.join( encoded )]
+    for table in ( nodes, values, np.array( floats, '<f8' ), edges ):
+        body += [struct.pack( '<I', len( table ) ), table.tobytes()]
+    body = b''.join( body )
+    flags = 0
+    if compress:
+        body = zlib.compress( body )
+        flags |= FLAG_ZLIB
+    return HEADER.pack( MAGIC, FORMAT_VERSION, flags ) + body
+
+def binaryTables( data ):
+    """(nodes, values, edges) rows of a binary graph, the records are read as NumPy views of the file contents."""
+    magic, version, flags = HEADER.unpack_from( data, 0 )
+    if magic != MAGIC or version > FORMAT_VERSION:
+        raise ValueError( 'not a supported binary shader graph' )
+    body = data[HEADER.size:]
+    if flags & FLAG_ZLIB:
+        body = zlib.decompress( body )
+
+    offset = 0
+    def table( dtype ):
+        nonlocal offset
+        count, = struct.unpack_from( '<I', body, offset )
+        records = np.frombuffer( body, dtype, count, offset+4 )
+        offset += 4 + records.nbytes
+        return records
+
+    lengths = table( np.dtype( '<u4' ) )
+    ends = np.cumsum( lengths ).tolist()
+    starts = [0]+ends[:-1]
+    strings = [bytes( body[offset+start:offset+end] ).decode( 'utf-8' ) for start, end in zip( starts, ends )]
+    offset += ends[-1] if ends else 0
+    nodes = table( NODE_RECORD )
+    values = table( VALUE_RECORD )
+    floats = table( np.dtype( '<f8' ) ).tolist()
+    edges = table( EDGE_RECORD )
+
+    rows = [( strings[kind], strings[name], x, y, bool( f & NODE_FLAG_CAN_DELETE ), bool( f & NODE_FLAG_ACTIVE ) )
+            for kind, name, x, y, f in nodes.tolist()]
+    valuerows = []
+    for node, plug, type, length, data in values.tolist():
+        name = VALUE_TYPES[type][0]
+        valuerows.append( ( node, strings[plug], name, floats[data:data+length] if name in NUMERIC_TYPES else strings[data] ) )
+    edgerows = [( node, strings[plug], source, strings[sourceplug] ) for node, plug, source, sourceplug in edges.tolist()]
+    return rows, valuerows, edgerows
+
+def decodeBinary( data ):
+    """Graph from its binary form."""
+    return buildGraph( *binaryTables( data ) )
+
+# graphs saved with pickle before FORMAT_VERSION 1: whole ShaderGraphs, or fragment shader only in the oldest ones
+# the current node and builtin classes by class name
+CLASS_KINDS = {cls.__name__: kind for kind, cls in list( node_classes.items() ) + list( BUILTIN_NODES.items() )}
+# node classes of the fragment shader only graphs that were renamed since
+LEGACY_NODES = {
+    'OperatorNode': 'Operator (II)',
+    'SubtractNode': 'Operator (II)',
+    'FunctionSingleNode': 'Function (I)',
+    'FunctionDoubleNode': 'Function (II)',
+    'SolidColorNode': 'Vec4 to Color',
+}
+# renamed plugs: (legacy class, plug) -> plug
+LEGACY_PLUGS = {
+    ( 'FunctionSingleNode', 'Value' ): 'Param',
+}
+# plug value classes by class name
+LEGACY_VALUES = {cls.__name__: name for name, cls, _ in VALUE_TYPES}
+
+class LegacyObject:
+    """Inert stand-in for the classes referenced by old pickles, only keeps their state."""
+    def __init__( self, *args ):
+        self.args = args
+
+    def __setstate__( self, state ):
+        self.__dict__.update( state )
+
+class LegacyFunction:
+    """Stand-in for a function looked up on a class, as uniform nodes pickle theirs; only keeps the names."""
+    def __init__( self, owner, name ):
+        self.owner = getattr( owner, '__name__', '' )
+        self.name = str( name )
+
+class LegacyUnpickler( pickle.Unpickler ):
+    """Unpickles old graphs without importing or calling anything but the stand-ins."""
+    classes = {}
+
+    def find_class( self, module, name ):
+        if ( module, name ) in ( ( 'copy_reg', '_reconstructor' ), ( 'copyreg', '_reconstructor' ) ):
+            return lambda cls, base, state: cls.__new__( cls )
+        if ( module, name ) in ( ( '__builtin__', 'object' ), ( 'builtins', 'object' ) ):
+            return object
+        if ( module, name ) in ( ( '__builtin__', 'getattr' ), ( 'builtins', 'getattr' ) ):
+            return LegacyFunction
+        if module in ( 'shadergraph', 'wx._core' ):
+            if name not in self.classes:
+                self.classes[name] = type( name, ( LegacyObject, ), {} )
+            return self.classes[name]
+        raise pickle.UnpicklingError( f'{module}.{name} is not allowed in a shader graph file' )
+
+def legacyKind( legacy ):
+    """Factory, builtin or custom node name of an unpickled node."""
+    cls = type( legacy ).__name__
+    uniform = getattr( legacy, 'uniform', None )
+    if uniform and isinstance( uniform[-1], LegacyFunction ):
+        # rebuilt from the class its uniform function belongs to
+        cls = uniform[-1].owner
+    return LEGACY_NODES.get( cls, CLASS_KINDS.get( cls ) )
+
+def legacyValues( legacy ):
+    """Encoded input plug values of an unpickled node, for connected ones the value they return to when disconnected."""
+    cls = type( legacy ).__name__
+    values = {}
+    for name, plug in legacy.inplugs.items():
+        name = LEGACY_PLUGS.get( ( cls, name ), name )
+        value = plug.value
+        if type( value ).__name__ == 'Plug':
+            value = getattr( plug, 'defaultValue', None )
+        kind = LEGACY_VALUES.get( type( value ).__name__ )
+        if kind is None or kind == 'value':
+            continue
+        _, _, attribute = VALUE_TYPES[VALUE_TYPE_IDS[kind]]
+        data = value if attribute is None else getattr( value, attribute )
+        if kind == 'float':
+            values[name] = [kind, [float( data )]]
+        elif kind in NUMERIC_TYPES:
+            values[name] = [kind, [float( v ) for v in data]]
+        else:
+            values[name] = [kind, str( data )]
+    if cls == 'SubtractNode':
+        values['Operator'] = ['list', '-']
+    elif cls == 'SolidColorNode':
+        for c, name in zip( legacy.outplugs['Color'].value.color, 'RGBA' ):
+            values[name] = ['float', [float( c )]]
+    return values
+
+def legacyDocument( data ):
+    """Convert a pickled graph node for node; fragment shader only graphs go onto the default vertex shader of ShaderGraph.new."""
+    old = LegacyUnpickler( io.BytesIO( data ) ).load()
+    if hasattr( old, 'vsnode' ):
+        nodes, edges = [], []
+    else:
+        document = graphDocument( ShaderGraph() )
+        # the default graph's fragment side is replaced by the old graph
+        keep = [i for i, n in enumerate( document['nodes'] ) if n['kind'] not in ( 'Fragment Shader', )]
+        remap = {old: new for new, old in enumerate( keep )}
+        nodes = [document['nodes'][i] for i in keep]
+        edges = [[remap[i], plug, remap[s], sp] for i, plug, s, sp in document['edges'] if i in remap and s in remap]
+
+    index = {}
+    for legacy in old.nodes:
+        kind = legacyKind( legacy )
+        location = getattr( legacy.location, 'args', legacy.location )
+        index[id( legacy )] = len( nodes )
+        # converted nodes keep the current default name, custom nodes are named by their kind
+        nodes.append( {'kind': kind or legacy.name, 'name': None if kind else legacy.name,
+                       'location': [float( location[0] ), float( location[1] )],
+                       'can_delete': legacy.can_delete, 'active': getattr( legacy, 'active', True ), 'values': legacyValues( legacy )} )
+
+    for legacy in old.nodes:
+        cls = type( legacy ).__name__
+        for name, plug in legacy.inplugs.items():
+            source = plug.value
+            if type( source ).__name__ == 'Plug' and id( source.parent ) in index:
+                name = LEGACY_PLUGS.get( ( cls, name ), name )
+                edges.append( [index[id( legacy )], name, index[id( source.parent )], source.name] )
+    return {'format': 'glsg', 'version': FORMAT_VERSION, 'nodes': nodes, 'edges': edges}
+
+def writeGraph( graph, filename, binary=None ):
+    """Save a graph, as JSON if the file name ends in .json unless `binary` says otherwise."""
+    if binary is None:
+        binary = not filename.lower().endswith( '.json' )
+    document = graphDocument( graph )
+    if binary:
+        with open( filename, 'wb' ) as f:
+            f.write( encodeBinary( document ) )
+    else:
+        with open( filename, 'w' ) as f:
+            json.dump( document, f, indent=1 )
+
+def dataTables( data ):
+    """(nodes, values, edges) rows of the contents of a binary, JSON or legacy pickled graph file."""
+    if data.startswith( MAGIC ):
+        return binaryTables( data )
+    if data.lstrip().startswith( b'{' ):
+        return documentTables( json.loads( data ) )
+    return documentTables( legacyDocument( data ) )
+
+def readGraph( filename ):
+    """Load a binary, JSON or legacy pickled graph, raising ValueError if the file holds none."""
+    with open( filename, 'rb' ) as f:
+        data = f.read()
+    try:
+        return buildGraph( *dataTables( data ) )
+    except PARSE_ERRORS as e:
+        raise ValueError( f'{filename} is not a readable shader graph: {type( e ).__name__}: {e}' ) from e
+
+if __name__ == '__main__':
+    import glob
+    import os
+    import time
+
+    # custom nodes as registered by glframe
+    NodeFactory.addCustomNode( 'Screen Size', [( 'Width', 'float', 'sg_ScreenSize.x' ), ( 'Height', 'float', 'sg_ScreenSize.y' )] )
+    NodeFactory.addCustomNode( 'Time', [( 'time', 'float', 'sg_Time' )] )
+    NodeFactory.addCustomNode( 'MVP Matrix', [( 'Matrix', 'mat4', 'MVP' )] )
+
+    def timed( function, repeat=5 ):
+        start = time.perf_counter()
+        for i in range( repeat ):
+            result = function()
+        return result, ( time.perf_counter()-start ) / repeat * 1000
+
+    graphs = []
+    for filename in sorted( glob.glob( os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), 'examples', '*.glsg' ) ) ):
+        graph = readGraph( filename )
+        graphs.append( ( os.path.basename( filename ), graph ) )
+
+    # chained nodes, like main.populateStressGraph
+    graph = ShaderGraph()
+    last = None
+    for i in range( 10000 ):
+        node = NodeFactory.getNewNode( ( 'Divide', 'Smooth Step', 'Operator (II)' )[i%3] )
+        node.location = [400 + ( i%40 )*150, ( i//40 )*120]
+        if last:
+            list( node.inplugs.values() )[-1].setValue( last.outplugs['Result'] )
+        graph.nodes.append( node )
+        last = node
+    graphs.append( ( '10000 generated nodes', graph ) )
+
+    for name, graph in graphs:
+        pickled = pickle.dumps( graph, 0 )
+        document = graphDocument( graph )
+        binary = encodeBinary( document )
+        text = json.dumps( document, indent=1 ).encode( 'utf-8' )
+        _, tpickle = timed( lambda: pickle.loads( pickled ) )
+        _, tbinary = timed( lambda: decodeBinary( binary ) )
+        _, tjson = timed( lambda: documentGraph( json.loads( text ) ) )
+        print( f'{name}: pickle {len( pickled )} bytes {tpickle:.2f}ms, '
+               f'binary {len( binary )} bytes {tbinary:.2f}ms, json {len( text )} bytes {tjson:.2f}ms' )
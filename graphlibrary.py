@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+
+import hashlib
+import os
+import re
+import sqlite3
+import zlib
+import numpy as np
+
+from graphio import dataTables, newNode, readGraph
+from shadergraph import UniformNode, custom_nodes
+
+INDEX_NAME = '.glsg-index.sqlite'
+GRAPH_EXTENSIONS = ( '.glsg', '.json' )
+INDEX_VERSION = 1
+
+THUMBNAIL_SIZE = ( 96, 64 )
+# node boxes as drawn by the graph editor, roughly
+THUMBNAIL_NODE_WIDTH = 110
+THUMBNAIL_PLUG_HEIGHT = 14
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS graphs (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    nodes INTEGER NOT NULL DEFAULT 0,
+    edges INTEGER NOT NULL DEFAULT 0,
+    uniforms TEXT NOT NULL DEFAULT '',
+    thumbnail BLOB,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS kinds (
+    path TEXT NOT NULL REFERENCES graphs( path ) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY ( path, kind )
+);
+CREATE INDEX IF NOT EXISTS kinds_kind ON kinds( kind );
+'''
+
+UNIFORM_DECLARATION = re.compile( r'\buniform\s+\w+\s+(\w+)' )
+
+kind_info = {}
+
+def kindInfo( kind ):
+    """(uniforms read, number of plug rows) of a node kind, instantiated once per kind."""
+    if kind not in kind_info:
+        try:
+            node = newNode( kind )
+        except ValueError:
+            node = None
+
+        uniforms = set()
+        rows = 1
+        if node:
+            uniforms.update( UNIFORM_DECLARATION.findall( node.getGlobalCode() or '' ) )
+            if isinstance( node, UniformNode ):
+                uniforms.add( node.name )
+            if kind in custom_nodes:
+                uniforms.update( variable.split( '.' )[0] for _, _, variable in custom_nodes[kind][1] )
+            rows = max( len( node.inplugs ), len( node.outplugs ), 1 )
+        kind_info[kind] = ( sorted( uniforms ), rows )
+    return kind_info[kind]
+
+def renderThumbnail( nodes, edges, size=THUMBNAIL_SIZE ):
+    """Grayscale overview of the node boxes and connections, as a (height, width) uint8 array."""
+    width, height = size
+    image = np.zeros( ( height, width ), np.uint8 )
+    if not nodes:
+        return image
+    boxes = np.array( [( x, y, THUMBNAIL_NODE_WIDTH, ( kindInfo( kind )[1]+1 )*THUMBNAIL_PLUG_HEIGHT )
+                       for kind, _, x, y, _, _ in nodes], 'f' )
+    low = boxes[:, :2].min( axis=0 )
+    high = ( boxes[:, :2]+boxes[:, 2:] ).max( axis=0 )
+    scale = min( ( width-2 ) / max( high[0]-low[0], 1 ), ( height-2 ) / max( high[1]-low[1], 1 ) )
+    boxes[:, :2] = ( boxes[:, :2]-low )*scale + 1
+    boxes[:, 2:] *= scale
+
+    # connections from the right edge of the source to the left edge of the target
+    for i, _, source, _ in edges:
+        x1, y1 = boxes[source, 0]+boxes[source, 2], boxes[source, 1]+boxes[source, 3]/2
+        x2, y2 = boxes[i, 0], boxes[i, 1]+boxes[i, 3]/2
+        steps = int( max( abs( x2-x1 ), abs( y2-y1 ) ) ) + 2
+        xs = np.linspace( x1, x2, steps ).astype( int ).clip( 0, width-1 )
+        ys = np.linspace( y1, y2, steps ).astype( int ).clip( 0, height-1 )
+        image[ys, xs] = 110
+    for x, y, w, h in boxes.tolist():
+        x1, y1 = int( x ), int( y )
+        x2, y2 = max( int( x+w ), x1+1 ), max( int( y+h ), y1+1 )
+        image[y1:y2, x1:x2] = 220
+    return image
+
+def graphMetadata( data ):
+    """Index record of a graph file's contents: node and edge counts, node kinds, uniforms and thumbnail."""
+    nodes, values, edges = dataTables( data )
+    kinds = {}
+    uniforms = set()
+    for kind, *_ in nodes:
+        kinds[kind] = kinds.get( kind, 0 ) + 1
+    for kind in kinds:
+        uniforms.update( kindInfo( kind )[0] )
+    image = renderThumbnail( nodes, edges )
+    return {'nodes': len( nodes ), 'edges': len( edges ), 'kinds': kinds, 'uniforms': ' '.join( sorted( uniforms ) ),
+            'thumbnail': zlib.compress( image.tobytes() )}
+
+class GraphLibrary:
+    """Searchable index of the graph files below a folder.
+
+    Metadata lives in an SQLite file in the folder and is refreshed only for
+    files whose modification time or size changed since the last update.
+    Searching and browsing read the index alone; a graph file is only parsed
+    when it is opened.
+    """
+    def __init__( self, folder, filename=None ):
+        self.folder = os.path.abspath( folder )
+        self.filename = filename or os.path.join( self.folder, INDEX_NAME )
+        self.db = sqlite3.connect( self.filename )
+        self.db.execute( 'PRAGMA foreign_keys = ON' )
+        if self.db.execute( 'PRAGMA user_version' ).fetchone()[0] != INDEX_VERSION:
+            self.db.executescript( 'DROP TABLE IF EXISTS kinds; DROP TABLE IF EXISTS graphs;' )
+            self.db.execute( f'PRAGMA user_version = {INDEX_VERSION}' )
+        self.db.executescript( SCHEMA )
+
+    def close( self ):
+        self.db.close()
+
+    def scan( self ):
+        """{relative path: (mtime, size)} of the graph files below the folder."""
+        found = {}
+        for root, folders, files in os.walk( self.folder ):
+            folders[:] = [f for f in folders if not f.startswith( '.' )]
+            for name in files:
+                if name.lower().endswith( GRAPH_EXTENSIONS ):
+                    path = os.path.join( root, name )
+                    stat = os.stat( path )
+                    found[os.path.relpath( path, self.folder )] = ( stat.st_mtime, stat.st_size )
+        return found
+
+    def update( self, progress=None ):
+        """Bring the index up to date, returns the number of (re)indexed and removed files.
+
+        progress( done, total ) is called after each file that had to be read.
+        """
+        found = self.scan()
+        known = {path: ( mtime, size, hash ) for path, mtime, size, hash in self.db.execute( 'SELECT path, mtime, size, hash FROM graphs' )}
+        changed = [path for path, stat in found.items() if path not in known or known[path][:2] != stat]
+        removed = [path for path in known if path not in found]
+
+        indexed = 0
+        with self.db:
+            self.db.executemany( 'DELETE FROM graphs WHERE path = ?', [( path, ) for path in removed] )
+            for done, path in enumerate( changed ):
+                mtime, size = found[path]
+                with open( os.path.join( self.folder, path ), 'rb' ) as f:
+                    data = f.read()
+                digest = hashlib.sha1( data ).hexdigest()
+                if path in known and known[path][2] == digest:
+                    # touched but unchanged
+                    self.db.execute( 'UPDATE graphs SET mtime = ?, size = ? WHERE path = ?', ( mtime, size, path ) )
+                else:
+                    self.index( path, mtime, size, digest, data )
+                    indexed += 1
+                if progress:
+                    progress( done+1, len( changed ) )
+        return indexed, len( removed )
+
+    def index( self, path, mtime, size, digest, data ):
+        try:
+            meta = graphMetadata( data )
+            error = None
+        except Exception as e:
+            # not a graph, or a damaged one: remembered until the file changes
+            meta = {'nodes': 0, 'edges': 0, 'kinds': {}, 'uniforms': '', 'thumbnail': None}
+            error = f'{type( e ).__name__}: {e}'
+        self.db.execute( 'DELETE FROM graphs WHERE path = ?', ( path, ) )
+        self.db.execute( 'INSERT INTO graphs VALUES ( ?, ?, ?, ?, ?, ?, ?, ?, ? )',
+                         ( path, mtime, size, digest, meta['nodes'], meta['edges'], meta['uniforms'], meta['thumbnail'], error ) )
+        self.db.executemany( 'INSERT INTO kinds VALUES ( ?, ?, ? )', [( path, kind, count ) for kind, count in meta['kinds'].items()] )
+
+    def search( self, text='', kinds=(), uniform=None, limit=None ):
+        """(path, nodes, edges, uniforms) of the readable graphs matching all criteria, by path.
+
+        text matches part of the path, kinds must all be used by the graph.
+        """
+        query = 'SELECT path, nodes, edges, uniforms FROM graphs WHERE error IS NULL'
+        args = []
+        if text:
+            query += " AND path LIKE ? ESCAPE '\\'"
+            args.append( '%' + re.sub( r'([%_\\])', r'\\\1', text ) + '%' )
+        for kind in kinds:
+            query += ' AND path IN ( SELECT path FROM kinds WHERE kind = ? )'
+            args.append( kind )
+        if uniform:
+            query += " AND ' ' || uniforms || ' ' LIKE ?"
+            args.append( f'% {uniform} %' )
+        query += ' ORDER BY path'
+        if limit:
+            query += f' LIMIT {int( limit )}'
+        return self.db.execute( query, args ).fetchall()
+
+    def getKinds( self ):
+        """(kind, number of graphs using it) over the library."""
+        return self.db.execute( 'SELECT kind, COUNT(*) FROM kinds GROUP BY kind ORDER BY kind' ).fetchall()
+
+    def getNodeCounts( self, path ):
+        return dict( self.db.execute( 'SELECT kind, count FROM kinds WHERE path = ?', ( path, ) ) )
+
+    def getThumbnail( self, path ):
+        """(height, width) uint8 grayscale thumbnail, or None."""
+        row = self.db.execute( 'SELECT thumbnail FROM graphs WHERE path = ?', ( path, ) ).fetchone()
+        if not row or row[0] is None:
+            return None
+        width, height = THUMBNAIL_SIZE
+        return np.frombuffer( zlib.decompress( row[0] ), np.uint8 ).reshape( height, width )
+
+    def getErrors( self ):
+        return self.db.execute( 'SELECT path, error FROM graphs WHERE error IS NOT NULL ORDER BY path' ).fetchall()
+
+    def load( self, path ):
+        return readGraph( os.path.join( self.folder, path ) )
+
+if __name__ == '__main__':
+    import glob
+    import shutil
+    import sys
+    import tempfile
+    import time
+    from shadergraph import NodeFactory
+
+    # custom nodes as registered by glframe
+    NodeFactory.addCustomNode( 'Screen Size', [( 'Width', 'float', 'sg_ScreenSize.x' ), ( 'Height', 'float', 'sg_ScreenSize.y' )] )
+    NodeFactory.addCustomNode( 'Time', [( 'time', 'float', 'sg_Time' )] )
+    NodeFactory.addCustomNode( 'MVP Matrix', [( 'Matrix', 'mat4', 'MVP' )] )
+
+    # python graphlibrary.py 2000: index a folder of 2000 copies of the examples
+    count = int( sys.argv[1] ) if len( sys.argv ) > 1 else 2000
+    examples = sorted( glob.glob( os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), 'examples', '*.glsg' ) ) )
+    with tempfile.TemporaryDirectory() as folder:
+        for i in range( count ):
+            shutil.copy( examples[i%len( examples )], os.path.join( folder, f'graph{i:05}.glsg' ) )
+
+        library = GraphLibrary( folder )
+        start = time.perf_counter()
+        indexed, _ = library.update()
+        print( f'initial index of {indexed} graphs: {time.perf_counter()-start:.2f}s' )
+
+        start = time.perf_counter()
+        library.update()
+        print( f'update, nothing changed: {( time.perf_counter()-start )*1000:.1f}ms' )
+
+        os.utime( os.path.join( folder, 'graph00000.glsg' ), ( time.time()+10, time.time()+10 ) )
+        start = time.perf_counter()
+        library.update()
+        print( f'update, one file touched: {( time.perf_counter()-start )*1000:.1f}ms' )
+
+        start = time.perf_counter()
+        results = library.search( kinds=['Plot Line'], uniform='sg_ScreenSize' )
+        print( f'search: {len( results )} graphs in {( time.perf_counter()-start )*1000:.1f}ms' )
+
+        start = time.perf_counter()
+        for path in list( library.scan() ):
+            graph = library.load( path )
+        print( f'opening every graph instead: {time.perf_counter()-start:.2f}s' )
+        library.close()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+
+import collections
+
+from shadergraph import Plug
+
+UNDO_DEPTH = 200
+
+class UndoHistory:
+    """Undo and redo of graph edits, kept as the operations the graph reported.
+
+    Every entry holds the edited node or plug with the state before and
+    after the edit, so memory grows with the number of edits and never with
+    the size of the graph. Undoing and redoing replay that state through the
+    graph's edit API, which keeps the autosave journal in step.
+
+    Edits are grouped per user action: with a schedule function such as
+    wx.CallAfter the group is closed once the current event is handled, so
+    deleting a selection or dragging several nodes is undone in one step.
+    """
+    def __init__( self, graph, depth=UNDO_DEPTH, schedule=None ):
+        self.graph = None
+        self.schedule = schedule
+        self.undos = collections.deque( maxlen=depth )
+        self.redos = []
+        self.group = None
+        self.applied = None
+        self.attach( graph )
+
+    def attach( self, graph ):
+        if self.graph:
+            self.graph.listeners.remove( self.record )
+        self.graph = graph
+        graph.listeners.append( self.record )
+        self.clear()
+
+    def detach( self ):
+        self.graph.listeners.remove( self.record )
+        self.graph = None
+
+    def clear( self ):
+        self.undos.clear()
+        self.redos.clear()
+        self.group = None
+
+    def setDepth( self, depth ):
+        self.undos = collections.deque( self.undos, maxlen=depth )
+
+    def canUndo( self ):
+        return bool( self.undos )
+
+    def canRedo( self ):
+        return bool( self.redos )
+
+    def record( self, operation, *args ):
+        if self.applied is not None:
+            # edits made by undo or redo themselves
+            self.applied.append( ( operation, args[0] if args else None ) )
+            return
+        if operation == 'reset':
+            self.clear()
+            return
+
+        if operation == 'add':
+            node, index = args
+            entry = ( 'add', node, index, None )
+        elif operation == 'remove':
+            node, dropped, index = args
+            entry = ( 'remove', node, index, dropped )
+        elif operation == 'move':
+            node, previous = args
+            entry = ( 'move', node, previous, list( node.location ) )
+        else:
+            plug, previous = args
+            entry = ( operation, plug, previous, plug.value )
+
+        if self.group is None:
+            self.group = []
+            self.undos.append( self.group )
+            if self.schedule:
+                self.schedule( self.closeGroup )
+        self.group.append( entry )
+        self.redos.clear()
+        if not self.schedule:
+            self.closeGroup()
+
+    def closeGroup( self ):
+        self.group = None
+
+    def apply( self, entries, undo ):
+        """Replay a group backwards to undo it or forwards to redo it, returns the (operation, node or plug) applied."""
+        graph = self.graph
+        self.applied = []
+        try:
+            for operation, target, before, after in ( reversed( entries ) if undo else entries ):
+                if operation == 'add':
+                    if undo:
+                        graph.removeNode( target )
+                    else:
+                        graph.addNode( target, before )
+                elif operation == 'remove':
+                    if undo:
+                        graph.addNode( target, before )
+                        for plug, source in after:
+                            graph.connect( plug, source )
+                    else:
+                        graph.removeNode( target )
+                elif operation == 'move':
+                    graph.moveNode( target, before if undo else after )
+                else:
+                    value = before if undo else after
+                    if isinstance( value, Plug ):
+                        graph.connect( target, value )
+                    elif operation == 'value':
+                        graph.setValue( target, value )
+                    elif isinstance( target.value, Plug ):
+                        # back to the unconnected value
+                        graph.disconnect( target )
+            return self.applied
+        finally:
+            self.applied = None
+
+    def undo( self ):
+        self.closeGroup()
+        if not self.undos:
+            return []
+        entries = self.undos.pop()
+        self.redos.append( entries )
+        return self.apply( entries, True )
+
+    def redo( self ):
+        self.closeGroup()
+        if not self.redos:
+            return []
+        entries = self.redos.pop()
+        self.undos.append( entries )
+        return self.apply( entries, False )
+
+if __name__ == '__main__':
+    import copy
+    import tracemalloc
+    from shadergraph import NodeFactory, ShaderGraph
+    from graphio import graphDocument
+
+    NodeFactory.addCustomNode( 'MVP Matrix', [( 'Matrix', 'mat4', 'MVP' )] )
+
+    # memory held by the history of 1000 edits, against one deep copy per edit
+    for count in ( 1000, 10000 ):
+        graph = ShaderGraph()
+        for i in range( count ):
+            node = NodeFactory.getNewNode( 'Divide' )
+            node.location = [i%100*150, i//100*120]
+            graph.nodes.append( node )
+        history = UndoHistory( graph, depth=2000 )
+        original = graphDocument( graph )
+        # built by the first connection, not part of the history
+        graph.getOrder()
+
+        tracemalloc.start()
+        pool = graph.nodes[-count:]
+        for i in range( 1000 ):
+            node = pool[i%len( pool )]
+            if i % 4 == 0:
+                graph.moveNode( node, [node.location[0]+10, node.location[1]] )
+            elif i % 4 == 1:
+                graph.connect( node.inplugs['Divisor'], pool[( i+1 )%len( pool )].outplugs['Result'] )
+            elif i % 4 == 2:
+                value = copy.copy( node.inplugs['Divident'].defaultValue )
+                value.SetFloat( i )
+                graph.setValue( node.inplugs['Divident'], value )
+            else:
+                graph.addNode( NodeFactory.getNewNode( 'Smooth Step' ) )
+                graph.removeNode( node )
+                pool.remove( node )
+        history_bytes, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        tracemalloc.start()
+        snapshot = copy.deepcopy( graph.nodes )
+        snapshot_bytes, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del snapshot
+
+        while history.canUndo():
+            history.undo()
+        assert graphDocument( graph ) == original
+        print( f'{count} nodes: {history_bytes/1024:.0f}KB for 1000 undoable edits, '
+               f'{snapshot_bytes/1024:.0f}KB for a single snapshot of the graph' )
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+import queue
+import threading
+
+from graphio import FORMAT_VERSION, buildGraph, dataTables, encodeBinary, encodeValue, decodeValue, graphDocument, newNode, nodeKind, plugValues
+from shadergraph import Plug
+
+AUTOSAVE_FOLDER = os.path.join( os.path.expanduser( '~' ), '.glshadergraph', 'autosave' )
+# journal length before it is compacted into a snapshot, at least the node count
+COMPACT_MIN_OPS = 500
+
+def autosaveName( pathname=None ):
+    """Base name of the autosave files of a graph file, or of the unsaved graph."""
+    if pathname is None:
+        return os.path.join( AUTOSAVE_FOLDER, 'untitled' )
+    digest = hashlib.sha1( os.path.abspath( pathname ).encode( 'utf-8' ) ).hexdigest()[:12]
+    return os.path.join( AUTOSAVE_FOLDER, f'{os.path.basename( pathname )}-{digest}' )
+
+class DocumentMirror:
+    """Graph document kept up to date with the journaled edits, on the writer thread.
+
+    Entries name nodes by the ids the UI thread hands out. The journal file
+    names them by their index in the last snapshot, nodes added since taking
+    the next free index, so the mirror translates every entry it applies.
+    """
+    def __init__( self, document ):
+        self.nodes = dict( enumerate( document['nodes'] ) )
+        self.edges = {( i, plug ): ( source, sourceplug ) for i, plug, source, sourceplug in document['edges']}
+        self.fileids = {i: i for i in self.nodes}
+        self.nextid = len( self.nodes )
+        self.ops = 0
+
+    def apply( self, entry ):
+        """Apply a journal entry, returns it as written to the file."""
+        operation, id, *args = entry
+        self.ops += 1
+        if operation == 'add':
+            kind, name, x, y, values, can_delete, active, inputs = args
+            self.nodes[id] = {'kind': kind, 'name': name, 'location': [float( x ), float( y )],
+                              'can_delete': can_delete, 'active': active, 'values': values}
+            self.fileids[id] = self.nextid
+            self.nextid += 1
+            for plug, source, sourceplug in inputs:
+                self.edges[( id, plug )] = ( source, sourceplug )
+            return ['add', self.fileids[id], kind, name, x, y, values, can_delete, active,
+                    [[plug, self.fileids[source], sourceplug] for plug, source, sourceplug in inputs]]
+        fileid = self.fileids[id]
+        if operation == 'remove':
+            # the consumers of the node went back to their own values
+            for consumer, plug, type, data in args[0]:
+                self.edges.pop( ( consumer, plug ), None )
+                self.nodes[consumer]['values'][plug] = [type, data]
+            del self.nodes[id]
+            del self.fileids[id]
+            return ['remove', fileid]
+        if operation == 'move':
+            self.nodes[id]['location'] = [float( args[0] ), float( args[1] )]
+        elif operation == 'connect':
+            plug, source, sourceplug = args
+            self.edges[( id, plug )] = ( source, sourceplug )
+            return ['connect', fileid, plug, self.fileids[source], sourceplug]
+        elif operation in ( 'disconnect', 'value' ):
+            plug, type, data = args
+            self.edges.pop( ( id, plug ), None )
+            self.nodes[id]['values'][plug] = [type, data]
+        return [operation, fileid, *args]
+
+    def compact( self ):
+        """Snapshot document of the mirrored graph; journal ids restart as indices into it."""
+        index = {id: i for i, id in enumerate( self.nodes )}
+        edges = []
+        for ( id, plug ), ( source, sourceplug ) in list( self.edges.items() ):
+            if id in index and source in index:
+                edges.append( [index[id], plug, index[source], sourceplug] )
+            else:
+                # into a removed node
+                del self.edges[( id, plug )]
+        self.fileids = index
+        self.nextid = len( index )
+        self.ops = 0
+        return {'format': 'glsg', 'version': FORMAT_VERSION, 'nodes': list( self.nodes.values() ), 'edges': edges}
+
+class GraphJournal:
+    """Autosave of a graph as its last snapshot plus an append-only journal of edits.
+
+    Edits reported by the graph are turned into small JSON lines on the UI
+    thread and written by a background thread, so recording one costs the
+    same whatever the size of the graph. The writer keeps a DocumentMirror
+    of the graph and, once the journal outgrows the graph, compacts it into
+    a snapshot of the mirror and restarts the journal. The UI thread only
+    builds a snapshot itself when the journal is attached to a graph or
+    loses track of it, which pauses it for graphDocument of the whole graph
+    (about 0.4s at 50000 nodes).
+    """
+    def __init__( self, graph, basename ):
+        self.graph = None
+        self.basename = basename
+        self.snapshotname = basename+'.snapshot'
+        self.journalname = basename+'.journal'
+        self.ids = {}
+        self.nextid = 0
+        # edits since the autosave was started, i.e. since the graph was opened or saved
+        self.edits = 0
+
+        self.queue = queue.Queue()
+        self.thread = threading.Thread( target=self.writer, daemon=True )
+        self.thread.start()
+        self.attach( graph )
+
+    def attach( self, graph ):
+        if self.graph:
+            self.graph.listeners.remove( self.record )
+        self.graph = graph
+        graph.listeners.append( self.record )
+        self.snapshot()
+
+    def snapshot( self ):
+        """Queue a snapshot of the graph; node ids restart as indices into it.
+
+        Also resynchronizes the journal with nodes put into graph.nodes directly.
+        """
+        document = graphDocument( self.graph )
+        self.ids = {node: i for i, node in enumerate( node for node in self.graph.nodes if node )}
+        self.nextid = len( self.ids )
+        self.queue.put( ( 'snapshot', document ) )
+
+    def record( self, operation, *args ):
+        ids = self.ids
+        if operation == 'reset':
+            self.snapshot()
+            return
+        self.edits += 1
+        if operation == 'add':
+            node = args[0]
+            ids[node] = self.nextid
+            self.nextid += 1
+            values = plugValues( node )
+            # a node added back by undo still holds its connections
+            inputs = [[name, ids[plug.value.parent], plug.value.name] for name, plug in node.inplugs.items()
+                      if isinstance( plug.value, Plug ) and plug.value.parent in ids]
+            entry = ['add', ids[node], nodeKind( node ), node.name, node.location[0], node.location[1], values, node.can_delete, node.active, inputs]
+        elif operation in ( 'remove', 'move' ):
+            node = args[0]
+            if node not in ids:
+                return self.snapshot()
+            if operation == 'remove':
+                dropped = args[1]
+                if any( plug.parent not in ids for plug, _ in dropped ):
+                    return self.snapshot()
+                # the graph drops the connections into the node itself
+                consumers = [[ids[plug.parent], plug.name] + list( encodeValue( plug.value ) ) for plug, _ in dropped]
+                entry = ['remove', ids.pop( node ), consumers]
+            else:
+                entry = ['move', ids[node], node.location[0], node.location[1]]
+        else:
+            plug = args[0]
+            node = plug.parent
+            source = plug.value.parent if operation == 'connect' else node
+            if node not in ids or source not in ids:
+                return self.snapshot()
+            if operation == 'connect':
+                entry = ['connect', ids[node], plug.name, ids[source], plug.value.name]
+            elif operation == 'disconnect':
+                entry = ['disconnect', ids[node], plug.name] + list( encodeValue( plug.value ) )
+            elif node.inplugs.get( plug.name ) is plug:
+                entry = ['value', ids[node], plug.name] + list( encodeValue( plug.value ) )
+            else:
+                entry = ['output', ids[node], plug.name] + list( encodeValue( plug.value ) )
+        self.queue.put( ( 'op', entry ) )
+
+    def writeSnapshot( self, document, journal ):
+        """Replace the snapshot file, returns the restarted journal."""
+        os.makedirs( os.path.dirname( self.snapshotname ) or '.', exist_ok=True )
+        with open( self.snapshotname+'.tmp', 'wb' ) as f:
+            f.write( encodeBinary( document ) )
+            f.flush()
+            os.fsync( f.fileno() )
+        os.replace( self.snapshotname+'.tmp', self.snapshotname )
+        # the snapshot covers everything journaled so far
+        if journal:
+            journal.close()
+        return open( self.journalname, 'w' )
+
+    def writer( self ):
+        journal = None
+        mirror = None
+        while True:
+            kind, item = self.queue.get()
+            if kind == 'close':
+                break
+            if kind == 'snapshot':
+                mirror = DocumentMirror( item )
+                journal = self.writeSnapshot( item, journal )
+            elif kind == 'op':
+                journal.write( json.dumps( mirror.apply( item ), separators=( ',', ':' ) ) + '\n' )
+                # at least the node count, so that snapshots cost a constant amount per edit on average
+                if mirror.ops >= max( COMPACT_MIN_OPS, len( mirror.nodes ) ):
+                    journal = self.writeSnapshot( mirror.compact(), journal )
+            elif kind == 'discard':
+                if journal:
+                    journal.close()
+                    journal = None
+                for name in ( self.snapshotname, self.journalname ):
+                    if os.path.exists( name ):
+                        os.remove( name )
+            # write out once the burst of edits is over
+            if journal and ( kind == 'flush' or self.queue.empty() ):
+                journal.flush()
+                os.fsync( journal.fileno() )
+            if kind == 'flush':
+                item.set()
+        if journal:
+            journal.close()
+
+    def flush( self ):
+        """Wait for everything queued to be written."""
+        done = threading.Event()
+        self.queue.put( ( 'flush', done ) )
+        done.wait()
+
+    def discard( self ):
+        """Stop recording and delete the autosave, after the graph was saved or closed cleanly."""
+        self.graph.listeners.remove( self.record )
+        self.queue.put( ( 'discard', None ) )
+        self.close()
+
+    def close( self ):
+        self.queue.put( ( 'close', None ) )
+        self.thread.join()
+
+def hasAutosave( basename ):
+    return os.path.exists( basename+'.snapshot' )
+
+def recoverGraph( basename ):
+    """Graph of the last snapshot with the journaled edits replayed over it.
+
+    A line cut short by a crash ends the replay. Nodes added back by undo
+    are appended, so they may end up drawn above their old neighbours.
+    """
+    with open( basename+'.snapshot', 'rb' ) as f:
+        graph = buildGraph( *dataTables( f.read() ) )
+    nodes = {i: node for i, node in enumerate( node for node in graph.nodes if node )}
+    if not os.path.exists( basename+'.journal' ):
+        return graph
+    with open( basename+'.journal' ) as f:
+        for line in f:
+            try:
+                entry = json.loads( line )
+            except ValueError:
+                break
+            operation, id, *args = entry
+            if operation == 'add':
+                kind, name, x, y, values, *rest = args
+                node = nodes[id] = newNode( kind )
+                node.name = name
+                node.location = [x, y]
+                for plug, ( type, data ) in values.items():
+                    if plug in node.inplugs:
+                        node.inplugs[plug].value = node.inplugs[plug].defaultValue = decodeValue( type, data )
+                graph.addNode( node )
+                # older journals did not record flags and connections
+                if rest:
+                    node.can_delete, node.active, inputs = rest
+                    for plug, source, sourceplug in inputs:
+                        graph.connect( node.inplugs[plug], nodes[source].outplugs[sourceplug] )
+            elif operation == 'remove':
+                graph.removeNode( nodes.pop( id ) )
+            elif operation == 'move':
+                graph.moveNode( nodes[id], args )
+            elif operation == 'connect':
+                plug, source, sourceplug = args
+                graph.connect( nodes[id].inplugs[plug], nodes[source].outplugs[sourceplug] )
+            elif operation == 'disconnect':
+                graph.disconnect( nodes[id].inplugs[args[0]] )
+            elif operation in ( 'value', 'output' ):
+                plug, type, data = args
+                plugs = nodes[id].inplugs if operation == 'value' else nodes[id].outplugs
+                graph.setValue( plugs[plug], decodeValue( type, data ) )
+    return graph
+
+if __name__ == '__main__':
+    import copy
+    import gc
+    import pickle
+    import tempfile
+    import time
+    from shadergraph import NodeFactory, ShaderGraph
+
+    NodeFactory.addCustomNode( 'MVP Matrix', [( 'Matrix', 'mat4', 'MVP' )] )
+
+    # longest full garbage collection, which stops every thread and bounds the worst edit
+    collections = []
+    def collected( phase, info ):
+        if info['generation'] == 2:
+            collections.append( time.perf_counter() if phase == 'start' else time.perf_counter()-collections.pop() )
+    gc.callbacks.append( collected )
+
+    # UI thread time per edit, against re-pickling the whole graph after each one;
+    # twice as many edits as nodes, so the journal is compacted on the way
+    with tempfile.TemporaryDirectory() as folder:
+        for count in ( 1000, 10000, 50000 ):
+            graph = ShaderGraph()
+            for i in range( count ):
+                node = NodeFactory.getNewNode( 'Divide' )
+                node.location = [i%100*150, i//100*120]
+                graph.nodes.append( node )
+            graph.getOrder()
+            start = time.perf_counter()
+            autosave = GraphJournal( graph, os.path.join( folder, f'graph{count}' ) )
+            attached = time.perf_counter()-start
+
+            edits = 2*count
+            nodes = list( graph.nodes )[-count:]
+            worst = 0
+            collections.clear()
+            start = time.perf_counter()
+            for i in range( edits ):
+                edit = time.perf_counter()
+                k = count-1-i%count
+                node = nodes[k]
+                if i % 3 == 0 or k == count-1:
+                    graph.moveNode( node, [node.location[0]+1, node.location[1]] )
+                elif i % 3 == 1:
+                    value = copy.copy( node.inplugs['Divident'].defaultValue )
+                    value.SetFloat( i )
+                    graph.setValue( node.inplugs['Divident'], value )
+                else:
+                    # from the next node in the list, which never makes a cycle
+                    graph.connect( node.inplugs['Divisor'], nodes[k+1].outplugs['Result'] )
+                worst = max( worst, time.perf_counter()-edit )
+            journaled = ( time.perf_counter()-start ) / edits
+            autosave.flush()
+            collection = max( collections, default=0 )
+
+            start = time.perf_counter()
+            pickle.dumps( graph, 0 )
+            pickled = time.perf_counter()-start
+
+            start = time.perf_counter()
+            recovered = recoverGraph( autosave.basename )
+            recovery = time.perf_counter()-start
+            assert graphDocument( recovered ) == graphDocument( graph )
+            autosave.discard()
+            print( f'{count} nodes: {journaled*1e6:.1f}us per journaled edit, worst {worst*1000:.2f}ms over {edits} edits and '
+                   f'{edits // max( COMPACT_MIN_OPS, count )} compactions (longest garbage collection {collection*1000:.0f}ms), {attached*1000:.0f}ms to attach, '
+                   f'{pickled*1000:.0f}ms to pickle the graph, recovery {recovery*1000:.0f}ms' )
@@ -1,13 +1,24 @@
+import copy
 import math
-import pickle
+import numpy as np
+import os
 import pyrr
 import random
+import sys
+import time
 import wx
 
 from shadergraph import NodeFactory, ShaderGraph
 from shadergraph import Plug, ColorValue, FloatValue, StringValue, ListValue
 
 from glframe import GLFrame
+from glgraph import GLGraphCanvas
+from graphio import readGraph, writeGraph
+from graphlibrary import GraphLibrary, THUMBNAIL_SIZE
+from history import UndoHistory
+from journal import GraphJournal, autosaveName, hasAutosave, recoverGraph
+from spatialindex import GridIndex
+from typecheck import checkTypes, recheckTypes
 
 from OpenGL.GL import *
 UNIFORM_FUNCTION = [None, glUniform1f, glUniform2f, glUniform3f, glUniform4f]
@@ -15,18 +26,70 @@ UNIFORM_FUNCTION = [None, glUniform1f, glUniform2f, glUniform3f, glUniform4f]
 PLUG_CIRCLE_RADIUS = 4
 PLUG_CIRCLE_SIZE = PLUG_CIRCLE_RADIUS * 2
 
+# print average GraphWindow paint times
+PROFILE_PAINT = False
+
+# edit the graph on an OpenGL canvas (glgraph.GLGraphCanvas) instead of GraphWindow
+GL_GRAPH_CANVAS = False
+
+# graph canvas zoom range; below LOD_ZOOM nodes are drawn as plain boxes
+MIN_ZOOM = 0.05
+MAX_ZOOM = 4.0
+LOD_ZOOM = 0.5
+# horizontal reach of the connection curves' control points
+EDGE_CURVATURE = 50
+
+# binary graphs by default, JSON when saved with a .json extension
+GRAPH_WILDCARD = "GL Shader Graph files (*.glsg)|*.glsg|GL Shader Graph JSON files (*.json)|*.json"
+
 __author__ = 'Bhupendra Aole'
 __version__ = '0.1.0'
 
+def frange(start, stop, step):
+    while start < stop:
+        yield start
+        start += step
+        
+class NodeLayout:
+    """Measured geometry of a node, relative to its location."""
+    def __init__(self, key, txtwidth, txtheight, outrows, inrows):
+        self.key = key
+        self.txtwidth = txtwidth
+        self.txtheight = txtheight
+        self.width = txtwidth+4+15
+        self.height = txtheight+4 + (len(outrows)+len(inrows)) * (txtheight+4)
+        # (plug, name, y, text width, text height) of displayed plugs
+        self.outrows = outrows
+        self.inrows = inrows
+        
 class GraphWindow( wx.Panel ):
     def __init__(self, parent, graph):
         super().__init__(parent, wx.ID_ANY)
         
         self.graph = graph
+        graph.listeners.append(self.OnGraphChanged)
+        # plug -> message of the type mismatches, checked once per event handled, and the nodes checked
+        self.type_errors = {}
+        self.type_checked = set()
+        self.types_pending = False
+        # node rectangles and plug centers in graph coordinates (screen minus pan)
         self.nodeRects = {}
         self.pluglocation = {}
+        self.nodePlugs = {}
+        self.nodeIndex = GridIndex()
+        self.plugIndex = GridIndex()
+        # connections, keyed by their input plug
+        self.edgeIndex = GridIndex()
+        self.edgesFrom = {}
+        self.edgeSource = {}
+        # input plug -> (x1, y1, x2, y2, control point offset) of its curve
+        self.edgeGeometry = {}
+        # lower values are drawn on top
+        self.zorder = {}
+        self.zcounter = 0
         self.lastx = self.lasty = 0
         self.panx = self.pany = 0
+        self.zoom = 1.0
         self.origMouseDownPosition = (0,0)
         self.selection_rect = wx.Rect() #[0,0,0,0]
         self.popupCoords = (0,0)
@@ -36,6 +99,8 @@ class GraphWindow( wx.Panel ):
         self.rect_selected_nodes = []
         self.selected_plug = None
         self.selected_plug2 = None
+        # the dragged wire would close a cycle on the hovered plug
+        self.wire_rejected = False
         
         self.BLACK_BRUSH = wx.Brush(wx.Colour(0,0,0))
         self.TGRAY_BRUSH_100 = wx.Brush(wx.Colour(100,100,100, 200))
@@ -53,10 +118,25 @@ class GraphWindow( wx.Panel ):
         self.GRAY_PEN_200 = wx.Pen(wx.Colour(200,200,200))
         self.RED_PEN = wx.Pen(wx.Colour(255,0,0))
         self.ERROR_PEN = wx.Pen(wx.Colour(200,100,100),10)
+        self.TYPE_ERROR_PEN = wx.Pen(wx.Colour(255,0,0),3)
         
         self.PLUGVALUEGAP = 6
         self.TXT4WIDTH, self.TXTHEIGHT = 0,0
         
+        # node -> NodeLayout
+        self.layouts = {}
+        # repaint statistics, see PROFILE_PAINT
+        self.paint_count = self.paint_area = self.paint_time = 0
+        self.paint_start = time.perf_counter()
+        self.nodes_drawn = self.edges_drawn = 0
+        
+        # retained bitmaps: the grid, and everything but the dragged nodes while dragging
+        self.background = None
+        self.background_key = None
+        self.static_layer = None
+        self.dragging = False
+        self.drag_start = {}
+        
         self.SetBackgroundStyle(wx.BG_STYLE_PAINT)
         
         self.InitUI()
@@ -68,12 +148,23 @@ class GraphWindow( wx.Panel ):
         self.Bind(wx.EVT_LEFT_UP, self.OnLeftUp)
         self.Bind(wx.EVT_MIDDLE_DOWN, self.OnMiddleDown)
         self.Bind(wx.EVT_MOTION, self.OnMouseMotion)
+        self.Bind(wx.EVT_MOUSEWHEEL, self.OnMouseWheel)
         self.Bind(wx.EVT_PAINT, self.OnPaint)
         self.Bind(wx.EVT_RIGHT_DOWN, self.OnRightDown)
         self.Bind(wx.EVT_SIZE, self.OnSize)
 
         self.font = self.GetFont()
         
+        # text measurements outside of paint events
+        self.measure_dc = wx.MemoryDC(wx.Bitmap(1, 1))
+        self.measure_gc = wx.GraphicsContext.Create(self.measure_dc)
+        self.measure_gc.SetFont(self.font, wx.Colour(0,0,0))
+        self.font_key = self.font.GetNativeFontInfoDesc()
+        self.TXT4WIDTH, self.TXTHEIGHT = self.measure_gc.GetTextExtent('TEXT')
+        
+        self.syncGeometry()
+        self.updateTypeErrors()
+        
         self.listbox = wx.ListCtrl(self, size=(100,-1), style=wx.LC_REPORT|wx.LC_NO_HEADER|wx.LC_SINGLE_SEL|wx.LC_HRULES)
         self.hideListBox()
         self.listbox.AppendColumn('Available')
@@ -86,22 +177,232 @@ class GraphWindow( wx.Panel ):
             self.Bind( wx.EVT_MENU, self.OnAddNode, pm )
         
     def SetGraph(self, graph):
+        if self.OnGraphChanged in self.graph.listeners:
+            self.graph.listeners.remove(self.OnGraphChanged)
         self.graph = graph
+        graph.listeners.append(self.OnGraphChanged)
+        self.type_errors = {}
+        self.type_checked = set()
+        self.OnGraphChanged('reset')
+        self.layouts.clear()
+        self.syncGeometry()
+        self.Refresh()
+        
+    def syncGeometry(self):
+        """Rebuild node and plug geometry of the whole graph."""
+        self.nodeRects.clear()
+        self.pluglocation.clear()
+        self.nodePlugs.clear()
+        self.nodeIndex.clear()
+        self.plugIndex.clear()
+        self.edgeIndex.clear()
+        self.edgesFrom.clear()
+        self.edgeSource.clear()
+        self.edgeGeometry.clear()
+        self.zorder.clear()
+        for node in self.graph.nodes:
+            if node:
+                self.updateNodeGeometry(node)
+        for node in self.graph.nodes:
+            if node:
+                for plug in node.inplugs.values():
+                    self.updateEdge(plug)
+        
+    def updateNodeGeometry(self, node):
+        """Place a node and its plugs in the spatial indices after it moved or its layout changed."""
+        layout = self.getLayout(node)
+        locx, locy = node.location
+        rect = (locx, locy, layout.width, layout.height)
+        self.nodeRects[node] = rect
+        if node not in self.zorder:
+            # nodes are appended to graph.nodes, so they go below all others
+            self.zorder[node] = self.zcounter
+            self.zcounter += 1
+        self.nodeIndex.update(node, rect)
+        
+        plugs = {}
+        for plug, name, y, w, h in layout.outrows:
+            if not plug.internal:
+                plugs[plug] = (locx+2+layout.txtwidth+6+10, locy+y+h/2)
+        for plug, name, y, w, h in layout.inrows:
+            plugs[plug] = (locx, locy+y+h/2)
+            
+        for plug in self.nodePlugs.get(node, {}).keys() - plugs.keys():
+            self.plugIndex.remove(plug)
+            del self.pluglocation[plug]
+        for plug, (x, y) in plugs.items():
+            self.pluglocation[plug] = (x, y)
+            self.plugIndex.update(plug, (x-PLUG_CIRCLE_RADIUS, y-PLUG_CIRCLE_RADIUS, PLUG_CIRCLE_SIZE, PLUG_CIRCLE_SIZE))
+        self.nodePlugs[node] = plugs
+        
+        # connections ending or starting at the node
+        for plug in node.inplugs.values():
+            self.updateEdge(plug)
+        for plug in node.outplugs.values():
+            for inplug in list(self.edgesFrom.get(plug, ())):
+                self.updateEdge(inplug)
+        
+    def removeNodeGeometry(self, node):
+        for plug in node.inplugs.values():
+            self.removeEdge(plug)
+        for plug in node.outplugs.values():
+            for inplug in list(self.edgesFrom.get(plug, ())):
+                self.updateEdge(inplug)
+        for plug in self.nodePlugs.pop(node, {}):
+            self.plugIndex.remove(plug)
+            del self.pluglocation[plug]
+        self.nodeIndex.remove(node)
+        self.nodeRects.pop(node, None)
+        self.zorder.pop(node, None)
+        self.layouts.pop(node, None)
+        
+    def updateEdge(self, plug):
+        """Index the connection into an input plug after either end moved or the plug was (dis)connected."""
+        self.removeEdge(plug)
+        source = plug.value
+        if not plug.display or plug.internal or not isinstance(plug, Plug) or not isinstance(source, Plug):
+            return
+        if not source.parent or source.parent == plug.parent:
+            return
+        if plug not in self.pluglocation or source not in self.pluglocation:
+            return
+        x1, y1 = self.pluglocation[plug]
+        x2, y2 = self.pluglocation[source]
+        # the curve stays within its end points widened by its control points
+        ctx = min(EDGE_CURVATURE, math.sqrt((x1-x2)**2+(y1-y2)**2))
+        x, y = min(x1, x2)-ctx-PLUG_CIRCLE_RADIUS, min(y1, y2)-PLUG_CIRCLE_RADIUS
+        self.edgeIndex.update(plug, (x, y, abs(x1-x2)+2*(ctx+PLUG_CIRCLE_RADIUS), abs(y1-y2)+PLUG_CIRCLE_SIZE))
+        self.edgeGeometry[plug] = (x1, y1, x2, y2, ctx)
+        self.edgeSource[plug] = source
+        self.edgesFrom.setdefault(source, set()).add(plug)
+        
+    def removeEdge(self, plug):
+        source = self.edgeSource.pop(plug, None)
+        if source is not None:
+            self.edgeIndex.remove(plug)
+            del self.edgeGeometry[plug]
+            targets = self.edgesFrom[source]
+            targets.discard(plug)
+            if not targets:
+                del self.edgesFrom[source]
+        
+    def graphEdited(self, operation, target):
+        """Update the geometry after an edit made outside of the editor (undo, redo), target is a node or plug."""
+        if operation == 'remove':
+            self.removeNodeGeometry(target)
+            self.selected_nodes = [node for node in self.selected_nodes if node is not target]
+            self.hovered_node = self.selected_plug = self.selected_plug2 = None
+        elif operation in ('add', 'move'):
+            self.updateNodeGeometry(target)
+        elif operation != 'reset':
+            self.updateEdge(target)
         self.Refresh()
         
+    def OnGraphChanged(self, operation, *args):
+        # value edits come from dialogs and the list box, which repaint nothing themselves
+        if operation in ('value', 'connect', 'disconnect'):
+            self.refreshNode(args[0].parent)
+        if operation == 'value' and not isinstance(args[1], Plug):
+            # the shaders use the same nodes, only the edited node and those it feeds need checking
+            if not self.types_pending:
+                for node in recheckTypes(self.graph, self.type_errors, [args[0].parent], self.type_checked):
+                    self.refreshNode(node)
+                self.SetToolTip(self.typeErrorTip())
+        elif operation != 'move' and not self.types_pending:
+            self.types_pending = True
+            wx.CallAfter(self.updateTypeErrors)
+            
+    def updateTypeErrors(self):
+        """Check the types of the graph and redraw the nodes whose mismatches changed."""
+        self.types_pending = False
+        self.type_checked = set()
+        errors = checkTypes(self.graph, self.type_checked)
+        changed = {plug.parent for plug in errors.keys() ^ self.type_errors.keys()}
+        self.type_errors = errors
+        for node in changed:
+            self.refreshNode(node)
+        self.SetToolTip(self.typeErrorTip())
+        
+    def typeErrorTip(self):
+        """Mismatches of the hovered plug, or of all plugs of the hovered node."""
+        if self.selected_plug:
+            return self.type_errors.get(self.selected_plug, '')
+        if self.hovered_node:
+            return '\n'.join(message for plug, message in self.type_errors.items() if plug.parent is self.hovered_node)
+        return ''
+        
+    def toGraph(self, x, y):
+        """Screen to graph coordinates."""
+        return (x-self.panx)/self.zoom, (y-self.pany)/self.zoom
+        
+    def toScreen(self, x, y):
+        return x*self.zoom+self.panx, y*self.zoom+self.pany
+        
+    def getViewRect(self):
+        """Visible area in graph coordinates."""
+        w, h = self.GetClientSize()
+        x, y = self.toGraph(0, 0)
+        return (x, y, w/self.zoom, h/self.zoom)
+        
+    def findPlug(self, x, y):
+        """Plug whose circle is under the screen position."""
+        if self.zoom < LOD_ZOOM:
+            # plugs are not drawn
+            return None
+        plugs = self.plugIndex.queryPoint(*self.toGraph(x, y))
+        return plugs[0] if plugs else None
+        
+    def findNode(self, x, y):
+        """Topmost node under the screen position."""
+        nodes = self.nodeIndex.queryPoint(*self.toGraph(x, y))
+        return min(nodes, key=self.zorder.get) if nodes else None
+        
+    def getLayout(self, node):
+        """Cached layout of a node, measured again only when its name, plugs or the font change."""
+        key = (node.name, self.font_key,
+               tuple((name, plug.display) for name, plug in node.outplugs.items()),
+               tuple((name, plug.display) for name, plug in node.inplugs.items()))
+        layout = self.layouts.get(node)
+        if layout and layout.key == key:
+            return layout
+        remeasured = layout is not None
+            
+        gc = self.measure_gc
+        txtwidth, txtheight = gc.GetTextExtent(node.name)
+        rows = []
+        for plugs in (node.outplugs, node.inplugs):
+            rows.append([])
+            for name, plug in plugs.items():
+                if not plug.display:
+                    continue
+                w, h = gc.GetTextExtent(str(name))
+                txtwidth = max(txtwidth, w)
+                rows[-1].append([plug, str(name), 0, w, h])
+                
+        y = txtheight+4
+        for row in rows[0]+rows[1]:
+            y += 2
+            row[2] = y
+            y += txtheight
+        
+        layout = NodeLayout(key, txtwidth, txtheight, *[[tuple(row) for row in r] for r in rows])
+        self.layouts[node] = layout
+        if remeasured:
+            self.updateNodeGeometry(node)
+        return layout
+        
     def OnEraseBackground(self, event):
         pass
         
-    def OnPaint(self, event):
-        dc = wx.AutoBufferedPaintDC(self)
-        dc.Clear()
-        
+    def getBackground(self, w, h):
+        """Grid bitmap of the window, drawn again only after a resize, pan or zoom."""
+        key = (w, h, self.panx, self.pany, self.zoom, self.graph.in_error)
+        if self.background_key == key:
+            return self.background
+            
+        self.background = wx.Bitmap(max(w, 1), max(h, 1))
+        dc = wx.MemoryDC(self.background)
         gc = wx.GraphicsContext.Create(dc)
-        gc.SetFont(self.font, wx.Colour(0,0,0))
-        
-        # paint background
-        w, h = gc.GetSize()
-        w, h = int(w), int(h)
         
         gridsize = 50
         # draw border
@@ -112,177 +413,303 @@ class GraphWindow( wx.Panel ):
         gc.DrawRectangle(0,0,w,h)
         
         # draw secondary axis lines
-        gc.SetPen(self.GRAY_PEN_150)
-        for x in range(int(w/2+self.panx)%gridsize,w-1,gridsize):
-            gc.StrokeLine(x, 0, x, h)
-        for y in range(int(h/2+self.pany)%gridsize,h-1,gridsize):
-            gc.StrokeLine(0, y, w, y)
+        zoom = self.zoom
+        originx, originy = self.toScreen(w/2, h/2)
+        step = gridsize*zoom
+        if step >= 8:
+            gc.SetPen(self.GRAY_PEN_150)
+            for x in frange(originx%step, w-1, step):
+                gc.StrokeLine(x, 0, x, h)
+            for y in frange(originy%step, h-1, step):
+                gc.StrokeLine(0, y, w, y)
         # draw main axis lines (horizontal and vertical)
         gc.SetPen(self.GRAY_PEN_100)
-        gc.StrokeLine(0, h/2+self.pany, w, h/2+self.pany)
-        gc.StrokeLine(w/2+self.panx, 0, w/2+self.panx, h)
+        gc.StrokeLine(0, originy, w, originy)
+        gc.StrokeLine(originx, 0, originx, h)
         
-        self.TXT4WIDTH, self.TXTHEIGHT = gc.GetTextExtent('TEXT')
+        del gc
+        dc.SelectObject(wx.NullBitmap)
+        self.background_key = key
+        return self.background
         
-        if self.graph:
-            # reversed for correctly mouse picking top (z order) node.
-            for node in reversed(self.graph.nodes):
-                locx, locy = node.location[0]+self.panx, node.location[1]+self.pany
-                gc.SetPen(self.BLACK_PEN)
-                gc.SetBrush(wx.NullBrush)
-                
-                # get max name length
-                nodename = node.name
-                txtwidth, txtheight = gc.GetTextExtent(nodename)
-                
-                plugcount = 0
-                for key, plug in {**node.outplugs, **node.inplugs}.items():
-                    if not plug.display:
-                        continue
+    def getStaticLayer(self, w, h):
+        """Background and every node except the dragged ones, kept for the duration of a drag."""
+        if self.static_layer is None:
+            self.static_layer = wx.Bitmap(max(w, 1), max(h, 1))
+            dc = wx.MemoryDC(self.static_layer)
+            gc = wx.GraphicsContext.Create(dc)
+            gc.SetFont(self.font, wx.Colour(0,0,0))
+            gc.DrawBitmap(self.getBackground(w, h), 0, 0, w, h)
+            self.paintScene(gc, (0, 0, w, h), 'static')
+            del gc
+            dc.SelectObject(wx.NullBitmap)
+        return self.static_layer
+        
+    def OnPaint(self, event):
+        start = time.perf_counter()
+        dc = wx.AutoBufferedPaintDC(self)
+        gc = wx.GraphicsContext.Create(dc)
+        gc.SetFont(self.font, wx.Colour(0,0,0))
+        
+        w, h = self.GetClientSize()
+        box = self.GetUpdateRegion().GetBox()
+        if box.IsEmpty():
+            box = wx.Rect(0, 0, w, h)
+        area = (box.x, box.y, box.width, box.height)
+        gc.Clip(*area)
+        
+        if self.dragging:
+            # retained bitmap of everything that stays still, plus the moving nodes
+            gc.DrawBitmap(self.getStaticLayer(w, h), 0, 0, w, h)
+            self.paintScene(gc, area, 'moving')
+        else:
+            gc.DrawBitmap(self.getBackground(w, h), 0, 0, w, h)
+            self.paintScene(gc, area)
                         
-                    plugcount += 1
-                    name = str(key)
-                    w, h = gc.GetTextExtent(name)
-                    if w > txtwidth:
-                        txtwidth = w
+        # hovered plug
+        if self.selected_plug and wx.GetMouseState().LeftIsDown():
+            wire = self.getWire()
+            if wire:
+                x1, y1, x2, y2, ctx = wire
+                gc.SetPen(self.RED_PEN if self.wire_rejected else self.BLACK_PEN)
+                path = gc.CreatePath()
+                path.MoveToPoint(x1, y1)
+                path.AddCurveToPoint(x1+ctx, y1, x2-ctx, y2, x2, y2)
+                gc.StrokePath(path)
+    
+        # selection rect
+        if self.selection_rect.width>0 and self.selection_rect.height>0:
+            x,y,w,h = self.selection_rect
+            gc.SetPen(self.SELECTION_PEN)
+            gc.SetBrush(wx.NullBrush)
+            gc.DrawRectangle(x, y, w, h)
                 
-                bodyh = plugcount * (txtheight+4)
-                # draw Selection indication
-                if node in self.selected_nodes+self.rect_selected_nodes:
-                    gc.SetPen(wx.NullPen)
-                    gc.SetBrush(self.TGRAY_BRUSH_100)
-                    gc.DrawRoundedRectangle(locx-3, locy-3, txtwidth+4+15+7, txtheight+4+bodyh+7, 3)
-                    
-                gc.SetPen(self.BLACK_PEN)
-                # print name
-                gc.SetBrush(self.GRAY_BRUSH_250)
-                gc.DrawRoundedRectangle(locx, locy, txtwidth+4+15, txtheight+4, 3)
+        self.paint_count += 1
+        self.paint_area += box.width*box.height
+        now = time.perf_counter()
+        self.paint_time += now-start
+        if PROFILE_PAINT and now-self.paint_start >= 1:
+            elapsed = now-self.paint_start
+            print(f'{len(self.graph.nodes)} nodes: {self.paint_count/elapsed:.1f} repaints/s, '
+                  f'{self.paint_area/elapsed/1e6:.2f} Mpixels/s, {self.paint_time/max(self.paint_count, 1)*1000:.2f}ms per paint, '
+                  f'last drew {self.nodes_drawn} nodes and {self.edges_drawn} connections')
+            self.paint_count = self.paint_area = self.paint_time = 0
+            self.paint_start = now
+            
+    def paintScene(self, gc, area, part=None):
+        """Draw the nodes and connections overlapping a screen area.
+        
+        part 'static' leaves out the dragged nodes and their connections, 'moving' draws only those.
+        """
+        x, y, w, h = area
+        gx, gy = self.toGraph(x, y)
+        rect = (gx, gy, w/self.zoom, h/self.zoom)
+        # bottom to top
+        nodes = sorted(self.nodeIndex.queryRect(rect), key=self.zorder.get, reverse=True)
+        edges = self.edgeIndex.queryRect(rect)
+        if part:
+            moving = set(self.selected_nodes)
+            keep = part == 'moving'
+            nodes = [node for node in nodes if (node in moving) == keep]
+            edges = [plug for plug in edges if (plug.parent in moving or plug.value.parent in moving) == keep]
+        self.nodes_drawn, self.edges_drawn = len(nodes), len(edges)
+        
+        gc.PushState()
+        gc.Translate(self.panx, self.pany)
+        gc.Scale(self.zoom, self.zoom)
+        if self.zoom < LOD_ZOOM:
+            self.drawNodesSimplified(gc, nodes, edges)
+        else:
+            self.drawNodes(gc, nodes, edges)
+        gc.PopState()
+        
+    def getConnection(self):
+        """(input plug, output plug) the dragged wire connects, None unless it joins an input to an output."""
+        if not self.selected_plug or not self.selected_plug2:
+            return None
+        pin, pout = self.selected_plug, self.selected_plug2
+        if pin not in pin.parent.inplugs.values():
+            pin, pout = pout, pin
+        if pin in pin.parent.inplugs.values() and pout in pout.parent.outplugs.values():
+            return pin, pout
+        return None
+        
+    def getWire(self):
+        """Screen end points and curvature of the connection being dragged, None if too short."""
+        x1, y1 = self.toScreen(*self.pluglocation[self.selected_plug])
+        x2, y2 = self.lastx, self.lasty
+        if abs(x1-x2)<=PLUG_CIRCLE_RADIUS and abs(y1-y2)<=PLUG_CIRCLE_RADIUS:
+            return None
+        if self.selected_plug.inParam:
+            x1, x2 = x2, x1
+            y1, y2 = y2, y1
+        ctx = min(EDGE_CURVATURE*self.zoom, math.sqrt((x1-x2)**2+(y1-y2)**2))
+        return x1, y1, x2, y2, ctx
+        
+    def refreshScreenRect(self, x, y, w, h, pad=2):
+        self.RefreshRect(wx.Rect(int(x)-pad, int(y)-pad, int(w)+2*pad+1, int(h)+2*pad+1), eraseBackground=False)
+        
+    def refreshGraphRect(self, rect, pad=4):
+        """Invalidate a rectangle given in graph coordinates."""
+        x, y, w, h = rect
+        sx, sy = self.toScreen(x-pad, y-pad)
+        self.refreshScreenRect(sx, sy, (w+2*pad)*self.zoom, (h+2*pad)*self.zoom)
+        
+    def refreshNode(self, node):
+        """Invalidate a node with its selection outline and connections."""
+        if node in self.nodeRects:
+            self.refreshGraphRect(self.nodeRects[node])
+        for plug in node.inplugs.values():
+            if plug in self.edgeSource:
+                self.refreshGraphRect(self.edgeIndex.rects[plug])
+        for plug in node.outplugs.values():
+            for inplug in self.edgesFrom.get(plug, ()):
+                self.refreshGraphRect(self.edgeIndex.rects[inplug])
                 
-                gc.DrawText(nodename, locx+2, locy+2)
-                if node.can_delete:
-                    gc.DrawText('X', locx+txtwidth+4+6, locy+2)
+    def refreshPlug(self, plug):
+        if plug in self.pluglocation:
+            x, y = self.pluglocation[plug]
+            self.refreshGraphRect((x-PLUG_CIRCLE_RADIUS, y-PLUG_CIRCLE_RADIUS, PLUG_CIRCLE_SIZE, PLUG_CIRCLE_SIZE), 2)
             
-                # print body
-                gc.DrawRoundedRectangle(locx, locy+txtheight+4, txtwidth+4+15, bodyh, 3)
-
-                #if node not in self.nodeRects:
-                self.nodeRects[node] = wx.Rect(locx, locy, txtwidth+4+15, txtheight+4+bodyh)
+    def refreshWire(self):
+        if self.selected_plug and self.selected_plug in self.pluglocation:
+            wire = self.getWire()
+            if wire:
+                x1, y1, x2, y2, ctx = wire
+                self.refreshScreenRect(min(x1, x2)-ctx, min(y1, y2), abs(x1-x2)+2*ctx, abs(y1-y2))
                 
-                y = locy+txtheight+4
-                # out plugs
-                for key, plug in node.outplugs.items():
-                    if not plug.display:
-                        continue
-                        
-                    y += 2
-                    name = str(key)
-                    w, h = gc.GetTextExtent(name)
-                    
-                    gc.SetPen(self.BLACK_PEN)
-                    gc.DrawText(name, locx+2 + (txtwidth+11-w), y)
-                    
-                    if not plug.internal:
-                        if plug==self.selected_plug or plug==self.selected_plug2:
-                            gc.SetPen(self.RED_PEN)
-                            
-                        gc.DrawEllipse(locx+2+txtwidth+6+10-PLUG_CIRCLE_RADIUS, y+h/2-PLUG_CIRCLE_RADIUS, PLUG_CIRCLE_SIZE,PLUG_CIRCLE_SIZE)
-                        self.pluglocation[plug] = (locx+2+txtwidth+6+10, y+h/2)
-                    y += txtheight
-                    
-                # in plugs
-                for key, plug in node.inplugs.items():
-                    if not plug.display:
-                        continue
-                        
-                    y += 2
-                    name = str(key)
-                    w, h = gc.GetTextExtent(name)
-                    
-                    gc.SetPen(self.BLACK_PEN)
-                    # draw plug inputs
-                    if isinstance(plug.value, ColorValue):
-                        COLOR_BRUSH = wx.Brush(wx.Colour(*plug.value.GetColorInt()))
-                        gc.SetBrush(COLOR_BRUSH)
-                        gc.DrawRoundedRectangle(locx+self.PLUGVALUEGAP, y, self.TXT4WIDTH, self.TXTHEIGHT, 3)
-                        gc.SetBrush(wx.NullBrush)
-                    elif isinstance(plug.value, FloatValue):
-                        gc.DrawRectangle(locx+self.PLUGVALUEGAP, y, self.TXT4WIDTH, self.TXTHEIGHT)
-                        gc.DrawText(plug.value.GetFloat(), locx+self.PLUGVALUEGAP+3, y)
-                    elif isinstance(plug.value, StringValue):
-                        gc.DrawRectangle(locx+self.PLUGVALUEGAP, y, self.TXT4WIDTH*2, self.TXTHEIGHT)
-                        gc.DrawText(plug.value.value, locx+self.PLUGVALUEGAP+3, y)
-                    elif isinstance(plug.value, ListValue):
-                        gc.DrawRectangle(locx+self.PLUGVALUEGAP, y, self.TXT4WIDTH*2, self.TXTHEIGHT)
-                        gc.DrawText(plug.value.value, locx+self.PLUGVALUEGAP+3, y)
-                    else:
-                        gc.DrawText(name, locx+self.PLUGVALUEGAP, y)
-                    
-                    if not plug.internal:
-                        gc.SetBrush(self.GRAY_BRUSH_250)
-                        # draw plug circle
-                        if plug==self.selected_plug or plug==self.selected_plug2:
-                            gc.SetPen(self.RED_PEN)
-                       
-                        gc.DrawEllipse(locx-PLUG_CIRCLE_RADIUS, y+h/2-PLUG_CIRCLE_RADIUS, PLUG_CIRCLE_SIZE,PLUG_CIRCLE_SIZE)
-                        
-                    self.pluglocation[plug] = (locx, y+h/2)
-                        
-                    y += txtheight
-                    
-            # draw connections
+    def Refresh(self, eraseBackground=True, rect=None):
+        # anything needing a full repaint invalidates the drag layer too
+        self.static_layer = None
+        super().Refresh(eraseBackground, rect)
+        
+    def drawNodes(self, gc, nodes, edges):
+        """Draw nodes and connections in graph coordinates."""
+        selected = set(self.selected_nodes+self.rect_selected_nodes)
+        for node in nodes:
+            locx, locy = node.location
+            layout = self.getLayout(node)
+            txtwidth, txtheight = layout.txtwidth, layout.txtheight
+            bodyh = layout.height - (txtheight+4)
+            
             gc.SetPen(self.BLACK_PEN)
-            for node in self.graph.nodes:
-                for plug in node.inplugs.values():
-                    if not plug.display or plug.internal:
-                        continue
-                        
-                    x1, y1 = self.pluglocation[plug]
-                    if isinstance(plug, Plug) and plug.value.parent and plug.value.parent!= node:
-                        path = gc.CreatePath()
-                        x2, y2 = self.pluglocation[plug.value]
-                        path.MoveToPoint(x1, y1)
-                        ctx = min(50, math.sqrt((x1-x2)**2+(y1-y2)**2))
-                        path.AddCurveToPoint(x1-ctx, y1, x2+ctx, y2, x2, y2)
-                        gc.StrokePath(path)
-                        
-                        gc.SetBrush(self.BLACK_BRUSH)
-                        if plug == self.selected_plug or plug == self.selected_plug2:
-                            gc.SetBrush(self.RED_BRUSH)
-                        gc.DrawEllipse(x1-PLUG_CIRCLE_RADIUS, y1-PLUG_CIRCLE_RADIUS, PLUG_CIRCLE_SIZE,PLUG_CIRCLE_SIZE)
-                        
-                        gc.SetBrush(self.BLACK_BRUSH)
-                        if plug.value == self.selected_plug or plug.value == self.selected_plug2:
-                            gc.SetBrush(self.RED_BRUSH)
-                        gc.DrawEllipse(x2-PLUG_CIRCLE_RADIUS, y2-PLUG_CIRCLE_RADIUS, PLUG_CIRCLE_SIZE,PLUG_CIRCLE_SIZE)
-                        
-            # hovered plug
-            if self.selected_plug and wx.GetMouseState().LeftIsDown():
-                x1, y1 = self.pluglocation[self.selected_plug]
-                x2, y2 = self.ScreenToClient(wx.GetMousePosition())
+            gc.SetBrush(wx.NullBrush)
+            
+            # draw Selection indication
+            if node in selected:
+                gc.SetPen(wx.NullPen)
+                gc.SetBrush(self.TGRAY_BRUSH_100)
+                gc.DrawRoundedRectangle(locx-3, locy-3, layout.width+7, layout.height+7, 3)
+                
+            gc.SetPen(self.BLACK_PEN)
+            # print name
+            gc.SetBrush(self.GRAY_BRUSH_250)
+            gc.DrawRoundedRectangle(locx, locy, layout.width, txtheight+4, 3)
+            
+            gc.DrawText(node.name, locx+2, locy+2)
+            if node.can_delete:
+                gc.DrawText('X', locx+txtwidth+4+6, locy+2)
+        
+            # print body
+            gc.DrawRoundedRectangle(locx, locy+txtheight+4, layout.width, bodyh, 3)
+            
+            # out plugs
+            for plug, name, y, w, h in layout.outrows:
+                y += locy
+                gc.SetPen(self.BLACK_PEN)
+                gc.DrawText(name, locx+2 + (txtwidth+11-w), y)
                 
-                if abs(x1-x2)>PLUG_CIRCLE_RADIUS or abs(y1-y2)>PLUG_CIRCLE_RADIUS:
-                    if self.selected_plug.inParam:
-                        x1, x2 = x2, x1
-                        y1, y2 = y2, y1
+                if not plug.internal:
+                    if plug==self.selected_plug or plug==self.selected_plug2:
+                        gc.SetPen(self.RED_PEN)
+                    if plug in self.type_errors:
+                        gc.SetPen(self.TYPE_ERROR_PEN)
                         
-                    path = gc.CreatePath()
-                    path.MoveToPoint(x1, y1)
-                    ctx = min(50, math.sqrt((x1-x2)**2+(y1-y2)**2))
-                    path.AddCurveToPoint(x1+ctx, y1, x2-ctx, y2, x2, y2)
-                    gc.StrokePath(path)
-        
-            # selection rect
-            if self.selection_rect.width>0 and self.selection_rect.height>0:
-                x,y,w,h = self.selection_rect
-                gc.SetPen(self.SELECTION_PEN)
-                gc.SetBrush(wx.NullBrush)
-                gc.DrawRectangle(x, y, w, h)
+                    gc.DrawEllipse(locx+2+txtwidth+6+10-PLUG_CIRCLE_RADIUS, y+h/2-PLUG_CIRCLE_RADIUS, PLUG_CIRCLE_SIZE,PLUG_CIRCLE_SIZE)
+                
+            # in plugs
+            for plug, name, y, w, h in layout.inrows:
+                y += locy
+                # mismatched types outline the value and the plug circle
+                gc.SetPen(self.TYPE_ERROR_PEN if plug in self.type_errors else self.BLACK_PEN)
+                # draw plug inputs
+                if isinstance(plug.value, ColorValue):
+                    COLOR_BRUSH = wx.Brush(wx.Colour(*plug.value.GetColorInt()))
+                    gc.SetBrush(COLOR_BRUSH)
+                    gc.DrawRoundedRectangle(locx+self.PLUGVALUEGAP, y, self.TXT4WIDTH, self.TXTHEIGHT, 3)
+                    gc.SetBrush(wx.NullBrush)
+                elif isinstance(plug.value, FloatValue):
+                    gc.DrawRectangle(locx+self.PLUGVALUEGAP, y, self.TXT4WIDTH, self.TXTHEIGHT)
+                    gc.DrawText(plug.value.GetFloat(), locx+self.PLUGVALUEGAP+3, y)
+                elif isinstance(plug.value, StringValue):
+                    gc.DrawRectangle(locx+self.PLUGVALUEGAP, y, self.TXT4WIDTH*2, self.TXTHEIGHT)
+                    gc.DrawText(plug.value.value, locx+self.PLUGVALUEGAP+3, y)
+                elif isinstance(plug.value, ListValue):
+                    gc.DrawRectangle(locx+self.PLUGVALUEGAP, y, self.TXT4WIDTH*2, self.TXTHEIGHT)
+                    gc.DrawText(plug.value.value, locx+self.PLUGVALUEGAP+3, y)
+                else:
+                    gc.DrawText(name, locx+self.PLUGVALUEGAP, y)
+                
+                if not plug.internal:
+                    gc.SetBrush(self.GRAY_BRUSH_250)
+                    # draw plug circle
+                    if plug==self.selected_plug or plug==self.selected_plug2:
+                        gc.SetPen(self.RED_PEN)
+                   
+                    gc.DrawEllipse(locx-PLUG_CIRCLE_RADIUS, y+h/2-PLUG_CIRCLE_RADIUS, PLUG_CIRCLE_SIZE,PLUG_CIRCLE_SIZE)
+                
+        self.drawEdges(gc, edges)
+            
+    def drawEdges(self, gc, edges):
+        """Connections from their cached curves: one path for all plain wires and end points, one for highlighted ones."""
+        highlighted = (self.selected_plug, self.selected_plug2)
+        wires, ends = gc.CreatePath(), gc.CreatePath()
+        hotwires, hotends = gc.CreatePath(), gc.CreatePath()
+        geometry = self.edgeGeometry
+        for plug in edges:
+            x1, y1, x2, y2, ctx = geometry[plug]
+            hot1, hot2 = plug in highlighted, plug.value in highlighted
+            path = hotwires if hot1 or hot2 else wires
+            path.MoveToPoint(x1, y1)
+            path.AddCurveToPoint(x1-ctx, y1, x2+ctx, y2, x2, y2)
+            (hotends if hot1 else ends).AddCircle(x1, y1, PLUG_CIRCLE_RADIUS)
+            (hotends if hot2 else ends).AddCircle(x2, y2, PLUG_CIRCLE_RADIUS)
+            
+        gc.SetPen(self.BLACK_PEN)
+        gc.StrokePath(wires)
+        gc.SetBrush(self.BLACK_BRUSH)
+        gc.DrawPath(ends)
+        gc.SetPen(self.RED_PEN)
+        gc.StrokePath(hotwires)
+        gc.SetPen(self.BLACK_PEN)
+        gc.SetBrush(self.RED_BRUSH)
+        gc.DrawPath(hotends)
+            
+    def drawNodesSimplified(self, gc, nodes, edges):
+        """Zoomed out: nodes as plain boxes and connections as straight lines, each in a single path."""
+        selected = set(self.selected_nodes+self.rect_selected_nodes)
+        lines = gc.CreatePath()
+        for plug in edges:
+            lines.MoveToPoint(*self.pluglocation[plug])
+            lines.AddLineToPoint(*self.pluglocation[plug.value])
+        boxes = gc.CreatePath()
+        selectedboxes = gc.CreatePath()
+        for node in nodes:
+            (selectedboxes if node in selected else boxes).AddRectangle(*self.nodeRects[node])
+            
+        gc.SetPen(self.BLACK_PEN)
+        gc.StrokePath(lines)
+        gc.SetBrush(self.GRAY_BRUSH_250)
+        gc.DrawPath(boxes)
+        gc.SetBrush(self.GRAY_BRUSH_100)
+        gc.DrawPath(selectedboxes)
                 
     def OnAddNode(self, event):
         node = NodeFactory.getNewNode(event.GetEventObject().GetLabelText(event.GetId()))
         node.location = self.popupCoords
         self.selected_nodes = [node]
-        self.graph.nodes.append(node)
+        self.graph.addNode(node)
+        self.updateNodeGeometry(node)
         self.graph.requires_compilation = True
         self.Refresh()
         
@@ -298,32 +725,47 @@ class GraphWindow( wx.Panel ):
         if self.hovered_node:
             self.selected_nodes = [self.hovered_node]
             
-        self.popupCoords = event.GetPosition() - (self.panx, self.pany)
+        self.popupCoords = list(self.toGraph(*event.GetPosition()))
         self.PopupMenu( self.popupMenu, event.GetPosition() )
 
     def OnMouseMotion(self, event):
         x, y = event.GetPosition()
         dx, dy = x-self.lastx, y-self.lasty
+        if event.Dragging() and event.LeftIsDown() and self.selected_plug:
+            self.refreshWire()
         self.lastx, self.lasty = x, y
         
         if event.Dragging():
             if event.MiddleIsDown():
                 self.panx += dx
                 self.pany += dy
+                self.Refresh()
             elif event.LeftIsDown():
                 if self.selected_plug: # find 2nd plug
+                    old = self.selected_plug2
                     self.selected_plug2 = None
-                    for plug, loc in self.pluglocation.items():
-                        lx, ly = loc
-                        if x>=lx-PLUG_CIRCLE_RADIUS and x<=lx+PLUG_CIRCLE_RADIUS and y>=ly-PLUG_CIRCLE_RADIUS and y<=ly+PLUG_CIRCLE_RADIUS:
-                            if self.selected_plug != plug:
-                                self.selected_plug2 = plug
-                            break
+                    plug = self.findPlug(x, y)
+                    if plug and self.selected_plug != plug:
+                        self.selected_plug2 = plug
+                    if old != self.selected_plug2:
+                        connection = self.getConnection()
+                        self.wire_rejected = bool(connection) and not self.graph.canConnect(*connection)
+                        self.refreshPlug(old)
+                        self.refreshPlug(self.selected_plug2)
+                    self.refreshWire()
                 elif self.selected_nodes and self.hovered_node and (not self.selection_rect.width>0 or not self.selection_rect.height>0): # move node
+                    if not self.dragging:
+                        self.dragging = True
+                        self.static_layer = None
+                        self.drag_start = {node: list(node.location) for node in self.selected_nodes}
                     for node in self.selected_nodes:
-                        node.location[0] += dx
-                        node.location[1] += dy
+                        self.refreshNode(node)
+                        node.location[0] += dx/self.zoom
+                        node.location[1] += dy/self.zoom
+                        self.updateNodeGeometry(node)
+                        self.refreshNode(node)
                 else: # selection rect
+                    self.refreshScreenRect(*self.selection_rect)
                     x1, y1 = x, y
                     x2, y2 = self.origMouseDownPosition
                     if x2<x1:
@@ -331,31 +773,41 @@ class GraphWindow( wx.Panel ):
                     if y2<y1:
                         y1,y2=y2,y1
                     self.selection_rect = wx.Rect(x1,y1,x2-x1,y2-y1)
+                    self.refreshScreenRect(*self.selection_rect)
                     
+                    previous = set(self.selected_nodes+self.rect_selected_nodes)
                     self.rect_selected_nodes.clear()
                     if not wx.GetKeyState(wx.WXK_SHIFT):
                         self.selected_nodes.clear()
-                    for node, rect in self.nodeRects.items():
-                        if rect.Intersects(self.selection_rect):
-                            if node not in self.rect_selected_nodes:
-                                self.rect_selected_nodes.append(node)
+                    gx, gy = self.toGraph(x1, y1)
+                    for node in self.nodeIndex.queryRect((gx, gy, (x2-x1)/self.zoom, (y2-y1)/self.zoom)):
+                        self.rect_selected_nodes.append(node)
+                    for node in previous.symmetric_difference(self.selected_nodes+self.rect_selected_nodes):
+                        self.refreshGraphRect(self.nodeRects[node])
                     
         else: # find node/ 1st plug
+            old = self.selected_plug
             self.hovered_node = None
             self.selected_plug = None
             self.selected_plug2 = None
-            found = False
-            for plug, loc in self.pluglocation.items():
-                lx, ly = loc
-                if x>=lx-PLUG_CIRCLE_RADIUS and x<=lx+PLUG_CIRCLE_RADIUS and y>=ly-PLUG_CIRCLE_RADIUS and y<=ly+PLUG_CIRCLE_RADIUS:
-                    self.selected_plug = plug
-                    found = True
-                    break
-            if not found: # if no plug found
-                for node, rect in self.nodeRects.items():
-                    if rect.Contains(x,y):
-                        self.hovered_node = node
-                        break
+            self.selected_plug = self.findPlug(x, y)
+            if not self.selected_plug: # if no plug found
+                self.hovered_node = self.findNode(x, y)
+            # only the highlighted plug circles change
+            if old != self.selected_plug:
+                self.refreshPlug(old)
+                self.refreshPlug(self.selected_plug)
+            if self.type_errors:
+                self.SetToolTip(self.typeErrorTip())
+        
+    def OnMouseWheel(self, event):
+        """Zoom around the mouse position."""
+        x, y = event.GetPosition()
+        gx, gy = self.toGraph(x, y)
+        steps = event.GetWheelRotation() / (event.GetWheelDelta() or 120)
+        self.zoom = min(MAX_ZOOM, max(MIN_ZOOM, self.zoom * 1.15**steps))
+        self.panx, self.pany = x-gx*self.zoom, y-gy*self.zoom
+        self.hideListBox()
         self.Refresh()
         
     def hideListBox( self ):
@@ -369,8 +821,7 @@ class GraphWindow( wx.Panel ):
         if plug:
             value = plug.getList()[currentItem]
             if value != plug.value.GetValue():
-                plug.value.SetValue(value)
-                self.graph.requires_compilation = True
+                self.graph.setValue(plug, type(plug.value)(value))
         
     def triggerPlugInput( self, plug ):
         if not plug.editable:
@@ -382,24 +833,25 @@ class GraphWindow( wx.Panel ):
             dialog = wx.ColourDialog(self, data)
             if dialog.ShowModal() == wx.ID_OK:
                 retColor = dialog.GetColourData().GetColour()
-                plug.value.SetColorInt(*retColor.Get(False))
-                self.graph.requires_compilation = True
+                value = copy.copy(plug.value)
+                value.SetColorInt(*retColor.Get(False))
+                self.graph.setValue(plug, value)
         elif isinstance(plug.value, FloatValue):
             dialog = wx.TextEntryDialog(self, 'Enter Value', caption='Enter Value',value=plug.value.GetFloat())
             if dialog.ShowModal() == wx.ID_OK:
-                plug.value.SetFloat(dialog.GetValue())
-                self.graph.requires_compilation = True
+                value = copy.copy(plug.value)
+                value.SetFloat(dialog.GetValue())
+                self.graph.setValue(plug, value)
         elif isinstance(plug.value, StringValue):
             dialog = wx.TextEntryDialog(self, 'Enter Value', caption='Enter Value',value=plug.value.GetValue())
             if dialog.ShowModal() == wx.ID_OK:
-                plug.value.SetValue(dialog.GetValue())
-                self.graph.requires_compilation = True
+                self.graph.setValue(plug, type(plug.value)(dialog.GetValue()))
         elif isinstance(plug.value, ListValue):
             self.listbox.DeleteAllItems()
             listitems = plug.getList()
             if listitems:
                 setattr(self.listbox, 'plug', plug)
-                x, y = self.pluglocation[plug]
+                x, y = self.toScreen(*self.pluglocation[plug])
                 tosel = 0
                 for idx, li in enumerate(listitems):
                     if li == plug.value.value:
@@ -407,7 +859,7 @@ class GraphWindow( wx.Panel ):
                     self.listbox.InsertItem(idx, li)
                 self.listbox.Select(tosel)
                 self.listbox.Focus(tosel)
-                self.listbox.SetPosition((x+self.PLUGVALUEGAP+1,y-self.TXTHEIGHT/2+1))
+                self.listbox.SetPosition((int(x+(self.PLUGVALUEGAP+1)*self.zoom),int(y-(self.TXTHEIGHT/2-1)*self.zoom)))
                 #self.listbox.SetSize((self.TXT4WIDTH*3, 200))
                 self.listbox.SetColumnWidth(0, -1)
                 self.listbox.Show(True)
@@ -415,27 +867,28 @@ class GraphWindow( wx.Panel ):
     def OnLeftUp(self, event):
         x, y = event.GetPosition()
         self.selection_rect = wx.Rect()
+        if self.dragging:
+            self.dragging = False
+            for node, start in self.drag_start.items():
+                if node.location != start:
+                    self.graph.moveNode(node, node.location, start)
+            self.drag_start = {}
         
         for node in self.rect_selected_nodes:
             if node not in self.selected_nodes:
                 self.selected_nodes.append(node)
         self.rect_selected_nodes.clear()
         
-        if self.selected_plug and self.selected_plug2:
-            pin = self.selected_plug
-            pout = self.selected_plug2
-            if pin not in pin.parent.inplugs.values():
-                pin, pout = pout, pin
-            if pin in pin.parent.inplugs.values() and pout in pout.parent.outplugs.values():
-                pin.setValue(pout)
-                self.graph.requires_compilation = True
+        connection = self.getConnection()
+        if connection and not self.wire_rejected:
+            self.graph.connect(*connection)
+            self.updateEdge(connection[0])
+        self.wire_rejected = False
             
         # activate plug input
-        if not self.selected_plug and self.hovered_node:
-            for plug, loc in self.pluglocation.items():
-                if plug.parent != self.hovered_node:
-                    continue
-                lx, ly = loc
+        if not self.selected_plug and self.hovered_node and self.zoom >= LOD_ZOOM:
+            x, y = self.toGraph(x, y)
+            for plug, (lx, ly) in self.nodePlugs.get(self.hovered_node, {}).items():
                 # input plugs on the left side
                 if plug.inParam and x>=lx+self.PLUGVALUEGAP and x<=lx+self.PLUGVALUEGAP+self.TXT4WIDTH and y>=ly-self.TXTHEIGHT/2 and y<=ly+self.TXTHEIGHT/2:
                     self.triggerPlugInput(plug)
@@ -464,14 +917,15 @@ class GraphWindow( wx.Panel ):
             if self.hovered_node not in self.selected_nodes:
                 self.selected_nodes.append(self.hovered_node)
             if not self.selected_plug:
-                rect = self.nodeRects[self.hovered_node]
+                rx, ry, rw, rh = self.nodeRects[self.hovered_node]
+                gx, gy = self.toGraph(x, y)
                 # check if X is clicked
-                if self.hovered_node.can_delete and x>(rect.x+rect.width)-20 and y<rect.y+20:
+                if self.hovered_node.can_delete and self.zoom >= LOD_ZOOM and gx>(rx+rw)-20 and gy<ry+20:
                     self.removeNode(self.hovered_node)
         
         elif self.selected_plug and ctrldown and self.selected_plug.inParam:
-            self.selected_plug.setDefaultValue()
-            self.graph.requires_compilation = True
+            self.graph.disconnect(self.selected_plug)
+            self.updateEdge(self.selected_plug)
         elif self.selected_plug:
             self.selected_nodes = [self.selected_plug.parent]
             
@@ -482,6 +936,15 @@ class GraphWindow( wx.Panel ):
         keycode = event.GetKeyCode()
         if keycode == wx.WXK_DELETE:
             self.deleteSelectedNode()
+        elif keycode == ord('D') and event.ControlDown():
+            self.selectDownstream()
+        
+    def selectDownstream(self):
+        """Add the nodes depending on the selection to it."""
+        added = self.graph.downstream(self.selected_nodes) - set(self.selected_nodes)
+        self.selected_nodes.extend(added)
+        for node in added:
+            self.refreshNode(node)
         
     def deleteSelectedNode(self):
         for node in self.selected_nodes:
@@ -492,7 +955,7 @@ class GraphWindow( wx.Panel ):
             return
             
         self.graph.removeNode(node)
-        del self.nodeRects[node]
+        self.removeNodeGeometry(node)
         self.hovered_node = None
         self.selected_nodes = []
         self.selected_plug = self.selected_plug2 = None
@@ -504,8 +967,17 @@ class Window( wx.Frame ):
         super().__init__( *args, **kwargs )
         
         self.graph = ShaderGraph()
+        self.journal = None
+        # edits are grouped per event handled
+        self.history = UndoHistory(self.graph, schedule=wx.CallAfter)
         
         self.initUI()
+        self.Bind(wx.EVT_CLOSE, self.OnClose)
+        
+        graph = self.recover(None)
+        if graph:
+            self.setGraph(graph)
+        self.startJournal(None, graph is not None)
     
     def initUI( self ):
         # MENU
@@ -517,6 +989,9 @@ class Window( wx.Frame ):
         fitem = fmenu.Append( wx.ID_OPEN, '&Open\tCtrl+O', 'Open file' )
         self.Bind( wx.EVT_MENU, self.OnOpen, fitem )
         
+        fitem = fmenu.Append( wx.ID_ANY, 'Open from &Library...\tCtrl+L', 'Search a folder of graphs' )
+        self.Bind( wx.EVT_MENU, self.OnOpenLibrary, fitem )
+        
         fitem = fmenu.Append( wx.ID_SAVEAS, 'Save &As', 'Save file as' )
         self.Bind( wx.EVT_MENU, self.OnSaveAs, fitem )
         
@@ -524,11 +999,23 @@ class Window( wx.Frame ):
         fitem = fmenu.Append( wx.ID_EXIT, 'E&xit\tCtrl+Q', 'Exit Application' )
         self.Bind(wx.EVT_MENU, self.OnQuit, fitem)
         
+        emenu = wx.Menu()
+        
+        fitem = emenu.Append( wx.ID_UNDO, '&Undo\tCtrl+Z', 'Undo the last edit' )
+        self.Bind( wx.EVT_MENU, self.OnUndo, fitem )
+        
+        fitem = emenu.Append( wx.ID_REDO, '&Redo\tCtrl+Y', 'Redo the last undone edit' )
+        self.Bind( wx.EVT_MENU, self.OnRedo, fitem )
+        
         mbar = wx.MenuBar()
         mbar.Append( fmenu, '&File' )
+        mbar.Append( emenu, '&Edit' )
         
         self.SetMenuBar( mbar )
         
+        # STATUS BAR (preview resolution scale)
+        self.CreateStatusBar()
+        
         # BACK PANEL
         backPanel = wx.Panel(self, wx.ID_ANY)
         
@@ -540,7 +1027,11 @@ class Window( wx.Frame ):
         tabs.Bind( wx.EVT_NOTEBOOK_PAGE_CHANGED, self.OnTabChanged )
         
         # GRAPH PANEL
-        self.graphPanel = GraphWindow( tabs, self.glwindow.GetGraph() )
+        if GL_GRAPH_CANVAS:
+            self.graphPanel = GLGraphCanvas( tabs, self.glwindow.GetGraph() )
+            self.graphPanel.profile = PROFILE_PAINT
+        else:
+            self.graphPanel = GraphWindow( tabs, self.glwindow.GetGraph() )
         tabs.InsertPage( 0, self.graphPanel, 'Shader Graph' )
         
         # CODE PANEL
@@ -568,32 +1059,100 @@ class Window( wx.Frame ):
         
     def OnQuit( self, event ):
         self.Close()
+        
+    def OnClose( self, event ):
+        # unsaved edits stay in the autosave, to be offered at the next start
+        if self.journal.edits:
+            self.journal.close()
+        else:
+            self.journal.discard()
+        event.Skip()
+    
+    def startJournal( self, pathname, modified=False ):
+        """Autosave edits of the current graph, saved as pathname or not saved yet."""
+        if self.journal:
+            self.journal.discard()
+        self.filename = pathname
+        self.journal = GraphJournal(self.graph, autosaveName(pathname))
+        if modified:
+            self.journal.edits = 1
+        
+    def recover( self, pathname ):
+        """Graph from the autosave left by a crash or by closing without saving, if the user wants it back.
+        
+        Must be called before the autosave of pathname is restarted."""
+        basename = autosaveName(pathname)
+        if not hasAutosave(basename) or (self.journal and self.journal.basename == basename):
+            return None
+        name = os.path.basename(pathname) if pathname else 'the unsaved graph'
+        if wx.MessageBox("Recover the unsaved changes to %s?" % name, "Autosave",
+                         wx.YES_NO | wx.ICON_QUESTION, self) != wx.YES:
+            return None
+        try:
+            return recoverGraph(basename)
+        except (IOError, ValueError, KeyError):
+            wx.LogError("Cannot recover the autosave of %s." % name)
+            return None
+            
+    def OnUndo( self, event ):
+        for operation, target in self.history.undo():
+            self.graphPanel.graphEdited(operation, target)
+        
+    def OnRedo( self, event ):
+        for operation, target in self.history.redo():
+            self.graphPanel.graphEdited(operation, target)
+        
+    def setGraph( self, graph ):
+        self.graph = graph
+        self.history.attach(graph)
+        self.glwindow.SetGraph(self.graph)
+        self.graphPanel.SetGraph(self.graph)
+        self.OnTabChanged(None)
     
     def OnNew( self, event ):
         self.graph.new()
         self.graph.requires_compilation = True
+        self.graphPanel.SetGraph(self.graph)
+        self.startJournal(None)
         
     def OnOpen( self, event ):
-        with wx.FileDialog(self, "Save GL Shader Graph file", wildcard="GL Shader Graph files (*.glsg)|*.glsg",
+        with wx.FileDialog(self, "Open GL Shader Graph file", wildcard=GRAPH_WILDCARD,
                            style=wx.FD_OPEN | wx.FD_FILE_MUST_EXIST) as fileDialog:
 
             if fileDialog.ShowModal() == wx.ID_CANCEL:
                 return     # the user changed their mind
 
             # Proceed loading the file chosen by the user
-            pathname = fileDialog.GetPath()
-            try:
-                with open(pathname, 'rb') as f:
-                    self.graph = pickle.load(f)
-                    self.glwindow.SetGraph(self.graph)
-                    self.graphPanel.SetGraph(self.graph)
-                    self.OnTabChanged(None)
-                    self.graph.updateVariableCount()
-            except IOError:
-                wx.LogError("Cannot open file '%s'." % newfile)
+            self.openGraph(fileDialog.GetPath())
+    
+    def OnOpenLibrary( self, event ):
+        with wx.DirDialog(self, "Choose a folder of GL Shader Graph files", style=wx.DD_DIR_MUST_EXIST) as dirDialog:
+            if dirDialog.ShowModal() == wx.ID_CANCEL:
+                return
+            folder = dirDialog.GetPath()
+        
+        library = GraphLibrary(folder)
+        # only new and modified files are read
+        with wx.ProgressDialog("Graph Library", "Indexing "+folder, parent=self) as progress:
+            library.update(lambda done, total: progress.Update(done*100//total))
+        
+        with LibraryDialog(self, library) as dialog:
+            if dialog.ShowModal() == wx.ID_OK and dialog.path:
+                self.openGraph(os.path.join(library.folder, dialog.path))
+        library.close()
+    
+    def openGraph( self, pathname ):
+        try:
+            graph = readGraph(pathname)
+        except (IOError, ValueError):
+            wx.LogError("Cannot open file '%s'." % pathname)
+            return
+        recovered = self.recover(pathname)
+        self.setGraph(recovered or graph)
+        self.startJournal(pathname, recovered is not None)
             
     def OnSaveAs( self, event ):
-        with wx.FileDialog(self, "Save GL Shader Graph file", wildcard="GL Shader Graph files (*.glsg)|*.glsg",
+        with wx.FileDialog(self, "Save GL Shader Graph file", wildcard=GRAPH_WILDCARD,
                            style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT) as fileDialog:
 
             if fileDialog.ShowModal() == wx.ID_CANCEL:
@@ -602,17 +1161,151 @@ class Window( wx.Frame ):
             # save the current contents in the file
             pathname = fileDialog.GetPath()
             try:
-                with open(pathname, 'wb') as f:
-                    pickle.dump(self.graph, f, 0)
+                writeGraph(self.graph, pathname)
             except IOError:
                 wx.LogError("Cannot save current data in file '%s'." % pathname)
+                return
+            self.startJournal(pathname)
+        
+class ResultList( wx.ListCtrl ):
+    """Virtual list, rows are fetched from the dialog's search results on demand."""
+    def __init__( self, parent ):
+        super().__init__( parent, style=wx.LC_REPORT | wx.LC_VIRTUAL | wx.LC_SINGLE_SEL )
+        self.results = []
+    
+    def setResults( self, results ):
+        self.results = results
+        self.SetItemCount( len( results ) )
+        self.Refresh()
+    
+    def OnGetItemText( self, item, column ):
+        return str( self.results[item][column] )
+        
+class LibraryDialog( wx.Dialog ):
+    """Search and preview the graphs of a GraphLibrary from its index."""
+    def __init__( self, parent, library ):
+        super().__init__( parent, title='Graph Library - '+library.folder, size=(640, 420),
+                          style=wx.DEFAULT_DIALOG_STYLE | wx.RESIZE_BORDER )
+        self.library = library
+        self.path = None
+        
+        self.search = wx.SearchCtrl( self )
+        self.search.ShowCancelButton( True )
+        self.search.Bind( wx.EVT_TEXT, self.OnSearch )
+        
+        self.kinds = ['All nodes'] + [kind for kind, _ in library.getKinds()]
+        self.kindChoice = wx.Choice( self, choices=self.kinds )
+        self.kindChoice.SetSelection( 0 )
+        self.kindChoice.Bind( wx.EVT_CHOICE, self.OnSearch )
+        
+        self.list = ResultList( self )
+        for column, ( title, width ) in enumerate( ( ('Graph', 240), ('Nodes', 60), ('Edges', 60), ('Uniforms', 200) ) ):
+            self.list.InsertColumn( column, title, width=width )
+        self.list.Bind( wx.EVT_LIST_ITEM_SELECTED, self.OnSelected )
+        self.list.Bind( wx.EVT_LIST_ITEM_ACTIVATED, lambda event: self.EndModal( wx.ID_OK ) )
+        
+        width, height = THUMBNAIL_SIZE
+        self.preview = wx.StaticBitmap( self, size=(width*2, height*2) )
+        self.details = wx.StaticText( self )
+        
+        top = wx.BoxSizer( wx.HORIZONTAL )
+        top.Add( self.search, 1, wx.EXPAND | wx.RIGHT, 5 )
+        top.Add( self.kindChoice, 0 )
+        side = wx.BoxSizer( wx.VERTICAL )
+        side.Add( self.preview, 0, wx.BOTTOM, 5 )
+        side.Add( self.details, 1, wx.EXPAND )
+        middle = wx.BoxSizer( wx.HORIZONTAL )
+        middle.Add( self.list, 1, wx.EXPAND | wx.RIGHT, 5 )
+        middle.Add( side, 0, wx.EXPAND )
+        sizer = wx.BoxSizer( wx.VERTICAL )
+        sizer.Add( top, 0, wx.EXPAND | wx.ALL, 5 )
+        sizer.Add( middle, 1, wx.EXPAND | wx.LEFT | wx.RIGHT, 5 )
+        sizer.Add( self.CreateButtonSizer( wx.OK | wx.CANCEL ), 0, wx.EXPAND | wx.ALL, 5 )
+        self.SetSizer( sizer )
+        
+        self.OnSearch( None )
+    
+    def OnSearch( self, event ):
+        selection = self.kindChoice.GetSelection()
+        kinds = [self.kinds[selection]] if selection > 0 else []
+        self.list.setResults( self.library.search( self.search.GetValue(), kinds ) )
+        self.path = None
+    
+    def OnSelected( self, event ):
+        self.path = self.list.results[event.GetIndex()][0]
+        thumbnail = self.library.getThumbnail( self.path )
+        if thumbnail is not None:
+            height, width = thumbnail.shape
+            rgb = np.repeat( thumbnail[:, :, None], 3, axis=2 )
+            image = wx.Image( width, height, rgb.tobytes() ).Scale( width*2, height*2 )
+            self.preview.SetBitmap( wx.Bitmap( image ) )
+        counts = self.library.getNodeCounts( self.path )
+        self.details.SetLabel( '\n'.join( f'{count} x {kind}' for kind, count in sorted( counts.items() ) ) )
+        self.Layout()
+        
+def populateStressGraph( graph, count ):
+    """Add `count` chained nodes on a grid, for profiling the editor."""
+    last = None
+    for i in range( count ):
+        node = NodeFactory.getNewNode( ('Divide', 'Smooth Step', 'Operator (II)')[i%3] )
+        node.location = [400 + (i%40)*150, (i//40)*120]
+        if last:
+            list(node.inplugs.values())[-1].setValue( last.outplugs['Result'] )
+        graph.nodes.append( node )
+        last = node
+        
+def benchmarkEdges( panel, frames=10 ):
+    """Time drawing all connections of the panel one path per wire, and batched from the cached curves."""
+    edges = list( panel.edgeGeometry )
+    bitmap = wx.Bitmap( 1000, 1000 )
+    dc = wx.MemoryDC( bitmap )
+    gc = wx.GraphicsContext.Create( dc )
+    
+    def unbatched( gc, edges ):
+        gc.SetPen( panel.BLACK_PEN )
+        gc.SetBrush( panel.BLACK_BRUSH )
+        for plug in edges:
+            x1, y1 = panel.pluglocation[plug]
+            x2, y2 = panel.pluglocation[plug.value]
+            path = gc.CreatePath()
+            path.MoveToPoint( x1, y1 )
+            ctx = min( EDGE_CURVATURE, math.sqrt( (x1-x2)**2+(y1-y2)**2 ) )
+            path.AddCurveToPoint( x1-ctx, y1, x2+ctx, y2, x2, y2 )
+            gc.StrokePath( path )
+            gc.DrawEllipse( x1-PLUG_CIRCLE_RADIUS, y1-PLUG_CIRCLE_RADIUS, PLUG_CIRCLE_SIZE, PLUG_CIRCLE_SIZE )
+            gc.DrawEllipse( x2-PLUG_CIRCLE_RADIUS, y2-PLUG_CIRCLE_RADIUS, PLUG_CIRCLE_SIZE, PLUG_CIRCLE_SIZE )
+            
+    for name, draw in ( ( 'path per connection', unbatched ), ( 'batched', panel.drawEdges ) ):
+        start = time.perf_counter()
+        for i in range( frames ):
+            draw( gc, edges )
+        elapsed = ( time.perf_counter()-start ) / frames
+        print( f'{len( edges )} connections, {name}: {elapsed*1000:.1f}ms per frame' )
+    del gc
+    dc.SelectObject( wx.NullBitmap )
         
 class Application( wx.App ):
-    def run( self ):
+    def run( self, stress=0, bench_edges=False ):
         frame = Window(None, wx.ID_ANY, 'OpenGL Shader Graph', size=(1000,450))
+        if stress:
+            populateStressGraph( frame.graph, stress )
+            frame.graphPanel.syncGeometry()
+        if bench_edges:
+            benchmarkEdges( frame.graphPanel )
+            frame.Close()
+            return
         frame.Show()
 
         self.MainLoop()
         self.Destroy()
         
-Application().run()
+if __name__ == '__main__':
+    # python main.py --stress 1000: paint times of a generated 1000 node graph
+    # python main.py --gl-canvas: OpenGL graph editor
+    # python main.py --stress 10000 --bench-edges: connection draw times
+    stress = 0
+    if '--stress' in sys.argv:
+        stress = int( sys.argv[sys.argv.index( '--stress' )+1] )
+        PROFILE_PAINT = True
+    GL_GRAPH_CANVAS = '--gl-canvas' in sys.argv
+    Application().run( stress, '--bench-edges' in sys.argv )
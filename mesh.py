@@ -0,0 +1,403 @@
+import itertools
+import math
+import numpy as np
+
+# LOD chain generation
+LOD_RATIO = 0.5             # triangle count of each level relative to the previous one
+LOD_MIN_TRIANGLES = 256     # stop simplifying below this many triangles
+LOD_MAX_LEVELS = 8
+# LOD selection: triangles worth drawing per covered pixel
+LOD_TRIANGLES_PER_PIXEL = 0.5
+
+# weight of the planes holding boundary and seam edges in place, relative to the triangle planes
+BOUNDARY_WEIGHT = 1000.0
+
+# triangles per spatial chunk used for frustum culling
+CHUNK_TRIANGLES = 1024
+
+# vertex layouts, see packVertices
+POSITION_FORMATS = ('float', 'half', 'quantized')
+NORMAL_FORMATS = ('float', 'int2101010', 'octahedral')
+
+def fanTriangles( indices, counts ):
+    """Fan triangulate polygons stored back to back in `indices`, `counts` giving their sizes, into an (F,3) array."""
+    counts = np.asarray( counts, np.int64 )
+    starts = np.cumsum( counts ) - counts
+    fans = np.maximum( counts-2, 0 )
+    first = np.repeat( starts, fans )
+    # corner i+1 of triangle i within its polygon
+    corner = np.arange( len( first ) ) - np.repeat( np.cumsum( fans ) - fans, fans ) + 1
+    indices = np.asarray( indices, np.int64 )
+    return np.stack( [indices[first], indices[first+corner], indices[first+corner+1]], -1 ).reshape( -1, 3 )
+
+def triangulate( polygons ):
+    """Fan triangulate a list of polygons (lists of indices) into an (F,3) array."""
+    counts = np.fromiter( map( len, polygons ), np.int64, len( polygons ) )
+    indices = np.fromiter( itertools.chain.from_iterable( polygons ), np.int64, counts.sum() )
+    return fanTriangles( indices, counts )
+
+def flatten( positions, normals, vfaces, nfaces ):
+    """Interleaved position/normal rows (3 per triangle), the layout GLFrame uploads."""
+    data = np.empty( ( vfaces.size, 6 ), 'f' )
+    data[:, :3] = positions[vfaces.reshape( -1 )]
+    data[:, 3:] = normals[nfaces.reshape( -1 )]
+    return data
+
+def smoothNormals( positions, vfaces, angle=None ):
+    """Area weighted vertex normals, returned with the matching (F,3) normal indices.
+
+    With `angle` (degrees) corners only average faces whose normals are within
+    that angle of their own face, so sharper creases stay hard edges.
+    """
+    v0, v1, v2 = positions[vfaces[:, 0]], positions[vfaces[:, 1]], positions[vfaces[:, 2]]
+    # cross product length is twice the area, which gives the weighting for free
+    fn = np.cross( v1-v0, v2-v0 ).astype( np.float64 )
+    
+    if angle is None:
+        normals = np.empty( ( len( positions ), 3 ) )
+        corners = vfaces.reshape( -1 )
+        for c in range( 3 ):
+            normals[:, c] = np.bincount( corners, np.repeat( fn[:, c], 3 ), len( positions ) )
+        return normalize( normals ), vfaces
+    
+    # pair every corner with every corner sharing its vertex
+    corners = vfaces.reshape( -1 )
+    order = np.argsort( corners, kind='stable' )
+    counts = np.bincount( corners, minlength=len( positions ) )
+    starts = np.concatenate( ( [0], np.cumsum( counts )[:-1] ) )
+    
+    ccount = counts[corners[order]]
+    first = np.repeat( order, ccount )
+    offset = np.arange( ccount.sum() ) - np.repeat( np.cumsum( ccount ) - ccount, ccount )
+    second = order[np.repeat( starts[corners[order]], ccount ) + offset]
+    
+    unit = normalize( fn )
+    ffirst, fsecond = first // 3, second // 3
+    within = np.einsum( 'ij,ij->i', unit[ffirst], unit[fsecond] ) >= math.cos( math.radians( angle ) )
+    
+    normals = np.empty( ( len( corners ), 3 ) )
+    for c in range( 3 ):
+        normals[:, c] = np.bincount( first[within], fn[fsecond[within], c], len( corners ) )
+    return normalize( normals ), np.arange( len( corners ) ).reshape( -1, 3 )
+
+def normalize( vectors ):
+    length = np.linalg.norm( vectors, axis=1 )
+    return ( vectors / np.where( length > 0, length, 1 )[:, None] ).astype( 'f' )
+
+def packInt2101010( normals ):
+    """Signed normalized x, y, z in 10 bits each (GL_INT_2_10_10_10_REV, w = 0)."""
+    q = np.round( np.clip( normals, -1, 1 ) * 511 ).astype( np.int32 ) & 0x3FF
+    return ( q[:, 0] | ( q[:, 1] << 10 ) | ( q[:, 2] << 20 ) ).astype( np.uint32 )
+
+def unpackInt2101010( packed ):
+    packed = packed.astype( np.int32 )
+    q = np.stack( [( packed >> shift ) & 0x3FF for shift in ( 0, 10, 20 )], -1 )
+    q = np.where( q >= 512, q - 1024, q )
+    return np.maximum( q / 511, -1 )
+
+def octEncode( normals ):
+    """Octahedral encoding of unit vectors into two signed normalized shorts, zero vectors as +z."""
+    n = normals / np.maximum( np.abs( normals ).sum( axis=1 ), 1e-20 )[:, None]
+    xy = n[:, :2]
+    fold = ( 1 - np.abs( xy[:, ::-1] ) ) * np.where( xy >= 0, 1, -1 )
+    xy = np.where( n[:, 2:] < 0, fold, xy )
+    return np.round( np.clip( xy, -1, 1 ) * 32767 ).astype( np.int16 )
+
+def octDecode( encoded ):
+    xy = np.maximum( encoded / 32767, -1 )
+    z = 1 - np.abs( xy ).sum( axis=1 )
+    t = np.maximum( -z, 0 )[:, None]
+    xy = xy - np.where( xy >= 0, t, -t )
+    return normalize( np.concatenate( ( xy, z[:, None] ), axis=1 ) )
+
+def packVertices( data, position='float', normal='float', bounds=None ):
+    """Pack interleaved position/normal rows into a compact vertex layout.
+
+    Returns the packed array, its attributes as (location, size, type,
+    normalized, offset) tuples with GL type names, and the maximum position
+    (relative to the bounding box diagonal) and normal (degrees) errors.
+    """
+    positions, normals = data[:, :3], data[:, 3:]
+    if bounds is None:
+        bounds = positions.min( axis=0 ), positions.max( axis=0 )
+    lo, hi = bounds
+    size = np.maximum( hi-lo, 1e-30 )
+    
+    if position == 'half':
+        pfield, pattrib = ( np.float16, 3 ), ( 3, 'GL_HALF_FLOAT', False )
+        pdata = positions.astype( np.float16 )
+        decoded = pdata.astype( 'f' )
+    elif position == 'quantized':
+        pfield, pattrib = ( np.uint16, 3 ), ( 3, 'GL_UNSIGNED_SHORT', True )
+        pdata = np.round( ( positions-lo ) / size * 65535 ).astype( np.uint16 )
+        decoded = lo + pdata / 65535 * size
+    else:
+        pfield, pattrib = ( np.float32, 3 ), ( 3, 'GL_FLOAT', False )
+        pdata = decoded = positions
+        
+    if normal == 'int2101010':
+        nfield, nattrib = ( np.uint32, 1 ), ( 4, 'GL_INT_2_10_10_10_REV', True )
+        ndata = packInt2101010( normals )
+        ndecoded = unpackInt2101010( ndata )
+    elif normal == 'octahedral':
+        nfield, nattrib = ( np.int16, 2 ), ( 2, 'GL_SHORT', True )
+        ndata = octEncode( normals )
+        ndecoded = octDecode( ndata )
+    else:
+        nfield, nattrib = ( np.float32, 3 ), ( 3, 'GL_FLOAT', False )
+        ndata = ndecoded = normals
+    
+    # keep every attribute 4 byte aligned
+    poffset = 0
+    noffset = ( np.dtype( pfield ).itemsize + 3 ) // 4 * 4
+    stride = noffset + ( np.dtype( nfield ).itemsize + 3 ) // 4 * 4
+    dtype = np.dtype( {'names':['p', 'n'], 'formats':[pfield, nfield], 'offsets':[poffset, noffset], 'itemsize':stride} )
+    packed = np.zeros( len( data ), dtype )
+    packed['p'] = pdata.reshape( packed['p'].shape )
+    packed['n'] = ndata.reshape( packed['n'].shape )
+    
+    diagonal = max( float( np.linalg.norm( hi-lo ) ), 1e-30 )
+    position_error = float( np.abs( decoded-positions ).max( initial=0 ) ) / diagonal
+    cos = np.einsum( 'ij,ij->i', normalize( ndecoded ), normalize( normals ) )
+    # zero normals have no direction to lose
+    cos = cos[np.abs( normals ).max( axis=1 ) > 0]
+    normal_error = float( np.degrees( np.arccos( np.clip( cos, -1, 1 ) ) ).max( initial=0 ) )
+    
+    attributes = [(0, *pattrib, poffset), (1, *nattrib, noffset)]
+    return packed, attributes, position_error, normal_error
+
+def boundingSphere( positions ):
+    lo, hi = positions.min( axis=0 ), positions.max( axis=0 )
+    center = ( lo + hi ) / 2
+    radius = float( np.sqrt( ( ( positions - center )**2 ).sum( axis=1 ).max() ) )
+    return center, radius
+
+def faceQuadrics( positions, faces ):
+    """Area weighted plane quadrics (F,4,4) of triangles."""
+    v0, v1, v2 = positions[faces[:, 0]], positions[faces[:, 1]], positions[faces[:, 2]]
+    n = np.cross( v1-v0, v2-v0 )
+    area2 = np.linalg.norm( n, axis=1 )
+    n /= np.where( area2 > 0, area2, 1 )[:, None]
+    p = np.empty( ( len( faces ), 4 ) )
+    p[:, :3] = n
+    p[:, 3] = -np.einsum( 'ij,ij->i', n, v0 )
+    return p[:, :, None] * p[:, None, :] * ( area2 / 2 )[:, None, None]
+
+def boundaryQuadrics( positions, faces ):
+    """Quadrics (E,4,4) of planes through the edges used by one triangle only, perpendicular to it, and the edges (E,2).
+
+    Open borders and unwelded seams have such edges; the planes keep their
+    vertices on the border, weighted by the squared edge length.
+    """
+    e = np.concatenate( ( faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]] ) )
+    owner = np.tile( np.arange( len( faces ) ), 3 )
+    s = np.sort( e, axis=1 )
+    _, inverse, counts = np.unique( s[:, 0] * len( positions ) + s[:, 1], return_inverse=True, return_counts=True )
+    border = counts[inverse.reshape( -1 )] == 1
+    e, owner = e[border], owner[border]
+
+    v0, v1, v2 = positions[faces[owner, 0]], positions[faces[owner, 1]], positions[faces[owner, 2]]
+    d = positions[e[:, 1]] - positions[e[:, 0]]
+    n = np.cross( d, np.cross( v1-v0, v2-v0 ) )
+    length = np.linalg.norm( n, axis=1 )
+    n /= np.where( length > 0, length, 1 )[:, None]
+    p = np.empty( ( len( e ), 4 ) )
+    p[:, :3] = n
+    p[:, 3] = -np.einsum( 'ij,ij->i', n, positions[e[:, 0]] )
+    return p[:, :, None] * p[:, None, :] * ( BOUNDARY_WEIGHT * np.einsum( 'ij,ij->i', d, d ) )[:, None, None], e
+
+def vertexQuadrics( positions, faces ):
+    fq = faceQuadrics( positions, faces ).reshape( -1, 16 )
+    q = np.zeros( ( len( positions ), 16 ) )
+    for k in range( 3 ):
+        for c in range( 16 ):
+            q[:, c] += np.bincount( faces[:, k], fq[:, c], len( positions ) )
+    bq, edges = boundaryQuadrics( positions, faces )
+    bq = bq.reshape( -1, 16 )
+    for k in range( 2 ):
+        for c in range( 16 ):
+            q[:, c] += np.bincount( edges[:, k], bq[:, c], len( positions ) )
+    return q.reshape( -1, 4, 4 )
+
+def quadricError( q, points ):
+    h = np.empty( ( len( points ), 4 ) )
+    h[:, :3] = points
+    h[:, 3] = 1
+    return np.einsum( 'nj,nj->n', np.einsum( 'nij,ni->nj', q, h ), h )
+
+def uniqueEdges( faces, count ):
+    e = np.concatenate( ( faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]] ) )
+    e.sort( axis=1 )
+    keys = e[:, 0] * count + e[:, 1]
+    keys.sort()
+    keys = keys[np.concatenate( ( [True], keys[1:] != keys[:-1] ) )]
+    return keys // count, keys % count
+
+def simplify( positions, vfaces, nfaces, target ):
+    """Quadric error edge collapse down to about `target` triangles.
+
+    Each pass collapses a vertex disjoint set of the cheapest edges at once:
+    an edge is taken when it is the cheapest edge of both its endpoints.
+    Corner normal indices are kept, so surviving corners keep their normals.
+    Boundary quadrics keep open borders and unwelded seams from shrinking.
+    """
+    positions = positions.astype( np.float64 )
+    vcount = len( positions )
+    q = vertexQuadrics( positions, vfaces )
+
+    while len( vfaces ) > target:
+        a, b = uniqueEdges( vfaces, vcount )
+        if not len( a ):
+            break
+
+        # best of the two endpoints and the midpoint
+        qe = q[a] + q[b]
+        candidates = ( positions[a], positions[b], ( positions[a]+positions[b] ) / 2 )
+        errors = np.stack( [quadricError( qe, c ) for c in candidates] )
+        best = errors.argmin( axis=0 )
+        cost = errors[best, np.arange( len( a ) )]
+        newpos = np.choose( best[:, None], candidates )
+
+        # cheapest edge per vertex, ties broken by rank
+        rank = np.empty( len( a ), np.int64 )
+        rank[np.argsort( cost, kind='stable' )] = np.arange( len( a ) )
+        vbest = np.full( vcount, len( a ), np.int64 )
+        np.minimum.at( vbest, a, rank )
+        np.minimum.at( vbest, b, rank )
+        selected = np.nonzero( ( vbest[a] == rank ) & ( vbest[b] == rank ) )[0]
+
+        # each collapse removes about two triangles
+        needed = max( 1, ( len( vfaces ) - target ) // 2 )
+        selected = selected[np.argsort( rank[selected] )[:needed]]
+        if not len( selected ):
+            break
+
+        sa, sb = a[selected], b[selected]
+        positions[sa] = newpos[selected]
+        q[sa] += q[sb]
+        remap = np.arange( vcount )
+        remap[sb] = sa
+        vfaces = remap[vfaces]
+
+        keep = ( vfaces[:, 0] != vfaces[:, 1] ) & ( vfaces[:, 1] != vfaces[:, 2] ) & ( vfaces[:, 2] != vfaces[:, 0] )
+        vfaces, nfaces = vfaces[keep], nfaces[keep]
+
+    return positions.astype( 'f' ), vfaces, nfaces
+
+def iterLODChain( positions, normals, vfaces, nfaces, ratio=LOD_RATIO, min_triangles=LOD_MIN_TRIANGLES, max_levels=LOD_MAX_LEVELS ):
+    """Interleaved vertex arrays from the full resolution mesh down, each yielded as soon as it is simplified."""
+    yield flatten( positions, normals, vfaces, nfaces )
+    for level in range( 1, max_levels ):
+        target = int( len( vfaces ) * ratio )
+        if target < min_triangles:
+            break
+        previous = len( vfaces )
+        positions, vfaces, nfaces = simplify( positions, vfaces, nfaces, target )
+        # simplification stalled
+        if len( vfaces ) > previous * ( 1+ratio ) / 2:
+            break
+        yield flatten( positions, normals, vfaces, nfaces )
+
+def buildLODChain( positions, normals, vfaces, nfaces, ratio=LOD_RATIO, min_triangles=LOD_MIN_TRIANGLES, max_levels=LOD_MAX_LEVELS ):
+    """List of interleaved vertex arrays, level 0 being the full resolution mesh."""
+    return list( iterLODChain( positions, normals, vfaces, nfaces, ratio, min_triangles, max_levels ) )
+
+def mortonCodes( points, bits=10 ):
+    """Z-order curve keys of points quantized to `bits` per axis within their bounds."""
+    lo, hi = points.min( axis=0 ), points.max( axis=0 )
+    q = ( ( points-lo ) / np.maximum( hi-lo, 1e-30 ) * ( ( 1 << bits )-1 ) ).astype( np.int64 )
+    codes = np.zeros( len( points ), np.int64 )
+    for bit in range( bits ):
+        for axis in range( 3 ):
+            codes |= ( ( q[:, axis] >> bit ) & 1 ) << ( 3*bit + axis )
+    return codes
+
+def buildChunks( data, triangles_per_chunk=CHUNK_TRIANGLES ):
+    """Reorder interleaved triangles into spatially coherent chunks.
+
+    Returns the reordered rows, the first row and row count of every chunk
+    and the bounding spheres (centers, radii) and boxes (lo, hi) of the chunks.
+    """
+    triangles = data.reshape( -1, 3, data.shape[1] )
+    order = np.argsort( mortonCodes( triangles[:, :, :3].mean( axis=1 ) ), kind='stable' )
+    data = triangles[order].reshape( -1, data.shape[1] )
+    
+    firsts = np.arange( 0, len( data ), triangles_per_chunk*3, dtype=np.int32 )
+    counts = np.diff( np.append( firsts, len( data ) ) ).astype( np.int32 )
+    
+    positions = data[:, :3]
+    lo = np.minimum.reduceat( positions, firsts )
+    hi = np.maximum.reduceat( positions, firsts )
+    centers = ( lo+hi ) / 2
+    distances = np.linalg.norm( positions - np.repeat( centers, counts, axis=0 ), axis=1 )
+    radii = np.maximum.reduceat( distances, firsts )
+    return data, firsts, counts, centers, radii, lo, hi
+
+def frustumPlanes( mvp ):
+    """The six (normalized) clip planes of a row-major model-view-projection matrix."""
+    m = np.asarray( mvp, np.float64 )
+    planes = np.array( [m[3]+m[0], m[3]-m[0], m[3]+m[1], m[3]-m[1], m[3]+m[2], m[3]-m[2]] )
+    return planes / np.linalg.norm( planes[:, :3], axis=1 )[:, None]
+
+def visibleChunks( mvp, centers, radii, lo, hi ):
+    """Boolean mask of the chunks whose bounding sphere and box touch the frustum."""
+    planes = frustumPlanes( mvp )
+    normals, offsets = planes[:, :3], planes[:, 3]
+    spheres = ( centers @ normals.T + offsets >= -radii[:, None] ).all( axis=1 )
+    # box corner furthest along each plane normal
+    corners = np.where( normals[None, :, :] >= 0, hi[:, None, :], lo[:, None, :] )
+    boxes = ( np.einsum( 'cpi,pi->cp', corners, normals ) + offsets >= 0 ).all( axis=1 )
+    return spheres & boxes
+
+def projectedRadius( mvp, center, radius, height ):
+    """Approximate screen space radius, in pixels, of a bounding sphere."""
+    w = mvp[3, :3] @ center + mvp[3, 3]
+    if w <= radius:
+        return math.inf
+    # scale of the projection's y axis
+    sy = np.linalg.norm( mvp[1, :3] )
+    return radius * sy / w * height / 2
+
+def selectLOD( triangle_counts, pixel_radius, density=LOD_TRIANGLES_PER_PIXEL ):
+    """Coarsest level that still has enough triangles for the covered pixels."""
+    target = math.pi * pixel_radius**2 * density
+    for level in range( len( triangle_counts )-1, 0, -1 ):
+        if triangle_counts[level] >= target:
+            return level
+    return 0
+
+def sphere( n ):
+    """UV sphere test mesh with n x n vertices and about 2n^2 triangles."""
+    theta, phi = np.meshgrid( np.linspace( 0, math.pi, n ), np.linspace( 0, 2*math.pi, n ), indexing='ij' )
+    positions = np.stack( ( np.sin( theta )*np.cos( phi ), np.sin( theta )*np.sin( phi ), np.cos( theta ) ), -1 ).reshape( -1, 3 ).astype( 'f' )
+    i = ( np.arange( n-1 )[:, None] * n + np.arange( n-1 )[None, :] ).reshape( -1 )
+    vfaces = np.concatenate( ( np.stack( ( i, i+n, i+1 ), -1 ), np.stack( ( i+1, i+n, i+n+1 ), -1 ) ) )
+    return positions, vfaces
+
+if __name__ == '__main__':
+    import time
+
+    positions, vfaces = sphere( 400 )
+    
+    start = time.perf_counter()
+    normals, nfaces = smoothNormals( positions, vfaces )
+    print( f'{len( vfaces )} triangles, smooth normals in {time.perf_counter()-start:.2f}s' )
+    start = time.perf_counter()
+    smoothNormals( positions, vfaces, 60 )
+    print( f'{len( vfaces )} triangles, smooth normals (60 degree crease) in {time.perf_counter()-start:.2f}s' )
+    
+    start = time.perf_counter()
+    lods = buildLODChain( positions, normals, vfaces, nfaces )
+    print( f'{len( vfaces )} triangles, LOD chain built in {time.perf_counter()-start:.2f}s' )
+    for level, data in enumerate( lods ):
+        print( level, len( data ) // 3 )
+    
+    start = time.perf_counter()
+    data, firsts, counts, centers, radii, lo, hi = buildChunks( lods[0] )
+    print( f'{len( firsts )} chunks built in {time.perf_counter()-start:.2f}s' )
+    
+    import utils
+    mvp = utils.translate( utils.perspective( 45.0, 4/3, 0.1, 100 ), 0.5, 0, -1.5 )
+    start = time.perf_counter()
+    visible = visibleChunks( mvp, centers, radii, lo, hi )
+    print( f'{visible.sum()} of {len( visible )} chunks visible, culled in {( time.perf_counter()-start )*1000:.2f}ms' )
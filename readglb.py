@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+import json
+import struct
+import numpy as np
+
+import mesh
+
+GLB_MAGIC = b'glTF'
+GLB_JSON = 0x4E4F534A
+GLB_BIN = 0x004E4942
+
+COMPONENT_TYPES = {5120: 'i1', 5121: 'u1', 5122: '<i2', 5123: '<u2', 5125: '<u4', 5126: '<f4'}
+ACCESSOR_SIZES = {'SCALAR': 1, 'VEC2': 2, 'VEC3': 3, 'VEC4': 4}
+MODE_TRIANGLES = 4
+
+class GlbMesh:
+    """Binary glTF (.glb) mesh.
+
+    Accessors are read as NumPy views straight into the memory mapped binary
+    chunk. All triangle primitives of all meshes are merged; node transforms
+    are not applied.
+    """
+    def __init__( self, filename, smooth_angle=None ):
+        self.smooth_angle = smooth_angle
+        self.lods = None
+
+        data = np.memmap( filename, np.uint8, mode='r' )
+        magic, version, length = struct.unpack_from( '<4sII', data, 0 )
+        if magic != GLB_MAGIC or version != 2:
+            raise ValueError( f'{filename} is not a glTF 2.0 binary file' )
+
+        self.gltf, self.bin = None, None
+        offset = 12
+        while offset < length:
+            chunklength, chunktype = struct.unpack_from( '<II', data, offset )
+            chunk = data[offset+8:offset+8+chunklength]
+            if chunktype == GLB_JSON:
+                self.gltf = json.loads( chunk.tobytes() )
+            elif chunktype == GLB_BIN and self.bin is None:
+                self.bin = chunk
+            offset += 8 + chunklength
+        if self.gltf is None:
+            raise ValueError( f'{filename} has no JSON chunk' )
+
+        self.primitives = []
+        for m in self.gltf.get( 'meshes', [] ):
+            for primitive in m['primitives']:
+                if primitive.get( 'mode', MODE_TRIANGLES ) != MODE_TRIANGLES:
+                    continue
+                attributes = primitive['attributes']
+                positions = self.accessor( attributes['POSITION'] )
+                normals = self.accessor( attributes['NORMAL'] ) if 'NORMAL' in attributes else None
+                if 'indices' in primitive:
+                    indices = self.accessor( primitive['indices'] )
+                else:
+                    indices = np.arange( len( positions ) )
+                self.primitives.append( ( positions, normals, indices ) )
+
+    def accessor( self, index ):
+        """Zero copy view of an accessor's elements."""
+        accessor = self.gltf['accessors'][index]
+        if 'sparse' in accessor or 'bufferView' not in accessor:
+            raise ValueError( 'sparse glTF accessors are not supported' )
+        view = self.gltf['bufferViews'][accessor['bufferView']]
+        if view.get( 'buffer', 0 ) != 0:
+            raise ValueError( 'external glTF buffers are not supported' )
+        if self.bin is None:
+            raise ValueError( 'glTF binary file has no BIN chunk for its accessors' )
+
+        dtype = np.dtype( COMPONENT_TYPES[accessor['componentType']] )
+        size = ACCESSOR_SIZES[accessor['type']]
+        stride = view.get( 'byteStride', dtype.itemsize*size )
+        offset = view.get( 'byteOffset', 0 ) + accessor.get( 'byteOffset', 0 )
+        count = accessor['count']
+        elements = np.ndarray( ( count, size ), dtype, self.bin, offset, ( stride, dtype.itemsize ) )
+        return elements[:, 0] if size == 1 else elements
+
+    def getArrays( self ):
+        """Positions, normals and (F,3) vertex and normal index arrays of the triangulated faces."""
+        if len( self.primitives ) == 1:
+            positions, normals, indices = self.primitives[0]
+            vfaces = indices.reshape( -1, 3 ).astype( np.int64 )
+        else:
+            # merge primitives, offsetting their indices
+            starts = np.cumsum( [0] + [len( p ) for p, _, _ in self.primitives] )
+            positions = np.concatenate( [p for p, _, _ in self.primitives] )
+            normals = None if any( n is None for _, n, _ in self.primitives ) else np.concatenate( [n for _, n, _ in self.primitives] )
+            vfaces = np.concatenate( [i.reshape( -1, 3 ).astype( np.int64 ) + s for ( _, _, i ), s in zip( self.primitives, starts )] )
+        positions = positions.astype( 'f' )
+        if normals is None:
+            normals, nfaces = mesh.smoothNormals( positions, vfaces, self.smooth_angle )
+            return positions, normals, vfaces, nfaces
+        return positions, normals.astype( 'f' ), vfaces, vfaces
+
+    def getVerticesAndNormalsFlat( self ):
+        return mesh.flatten( *self.getArrays() )
+
+    def getLODs( self ):
+        """Interleaved vertex/normal arrays from full resolution down, built once and cached."""
+        if self.lods is None:
+            self.lods = mesh.buildLODChain( *self.getArrays() )
+        return self.lods
+
+def writeGlb( filename, positions, normals, vfaces ):
+    """Write a single triangle primitive with positions, normals and 32 bit indices."""
+    positions = np.ascontiguousarray( positions, '<f4' )
+    normals = np.ascontiguousarray( normals, '<f4' )
+    indices = np.ascontiguousarray( vfaces, '<u4' )
+    binary = positions.tobytes() + normals.tobytes() + indices.tobytes()
+    gltf = {
+        'asset': {'version': '2.0'},
+        'buffers': [{'byteLength': len( binary )}],
+        'bufferViews': [
+            {'buffer': 0, 'byteOffset': 0, 'byteLength': positions.nbytes},
+            {'buffer': 0, 'byteOffset': positions.nbytes, 'byteLength': normals.nbytes},
+            {'buffer': 0, 'byteOffset': positions.nbytes+normals.nbytes, 'byteLength': indices.nbytes},
+        ],
+        'accessors': [
+            {'bufferView': 0, 'componentType': 5126, 'count': len( positions ), 'type': 'VEC3',
+             'min': positions.min( axis=0 ).tolist(), 'max': positions.max( axis=0 ).tolist()},
+            {'bufferView': 1, 'componentType': 5126, 'count': len( normals ), 'type': 'VEC3'},
+            {'bufferView': 2, 'componentType': 5125, 'count': indices.size, 'type': 'SCALAR'},
+        ],
+        'meshes': [{'primitives': [{'attributes': {'POSITION': 0, 'NORMAL': 1}, 'indices': 2}]}],
+    }
+    text = json.dumps( gltf ).encode( 'utf-8' )
+    text += b' ' * ( -len( text ) % 4 )
+    binary += b'\0' * ( -len( binary ) % 4 )
+    with open( filename, 'wb' ) as f:
+        f.write( struct.pack( '<4sII', GLB_MAGIC, 2, 12 + 8+len( text ) + 8+len( binary ) ) )
+        f.write( struct.pack( '<II', len( text ), GLB_JSON ) + text )
+        f.write( struct.pack( '<II', len( binary ), GLB_BIN ) + binary )
+
+if __name__ == '__main__':
+    import os
+    import tempfile
+    import time
+    from readobj import Obj3D, writeObj
+
+    # load time of the same mesh as text OBJ and binary glTF
+    positions, vfaces = mesh.sphere( 708 )
+    normals, _ = mesh.smoothNormals( positions, vfaces )
+    millions = len( vfaces ) / 1e6
+    with tempfile.TemporaryDirectory() as folder:
+        objname = os.path.join( folder, 'bench.obj' )
+        writeObj( objname, positions, normals, vfaces )
+        glbname = os.path.join( folder, 'bench.glb' )
+        writeGlb( glbname, positions, normals, vfaces )
+
+        for name, loader in ( ( objname, Obj3D ), ( glbname, GlbMesh ) ):
+            start = time.perf_counter()
+            data = loader( name ).getVerticesAndNormalsFlat()
+            elapsed = time.perf_counter()-start
+            print( f'{os.path.basename( name )}: {elapsed/millions:.2f}s per million triangles' )
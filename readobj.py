@@ -1,15 +1,20 @@
 #!/usr/bin/env python3
 
 import sys
+import numpy as np
+
+import mesh
 
 __author__ = 'Bhupendra Aole'
 __version__ = '0.1.0'
 
 class Obj3D:
-    def __init__( self, filename ):
+    def __init__( self, filename, smooth_angle=None ):
+        self.smooth_angle = smooth_angle
         self.vertices = []
         self.normals = []
         self.faces = []
+        self.lods = None
 
         f = open( filename )
         line=f.readline()
@@ -31,12 +36,26 @@ class Obj3D:
                     cs = line[2:].split()
                     face = []
                     for i in cs:
+                        # v, v/vt, v//vn or v/vt/vn
                         c = i.split('/')
-                        face.append( ( int( c[0] )-1, int( c[2] )-1 ) )
+                        vn = None
+                        if len( c )>2 and c[2]:
+                            vn = self.index( c[2], self.normals )
+                        face.append( ( self.index( c[0], self.vertices ), vn ) )
                     self.faces.append( face )
                     
             # read next line
             line=f.readline()
+        f.close()
+        
+        # generate normals if any face corner has none
+        self.has_normals = all( c[1] is not None for face in self.faces for c in face )
+        self.generated_normals = None
+        
+    def index( self, token, elements ):
+        # OBJ indices are 1 based, negative ones count back from the last element
+        i = int( token )
+        return i-1 if i>0 else len( elements )+i
 
     def getVerticesFlat( self ):
         v = []
@@ -46,12 +65,40 @@ class Obj3D:
         return v
         
     def getVerticesAndNormalsFlat( self ):
+        if not self.has_normals:
+            return mesh.flatten( *self.getArrays() ).tolist()
         v = []
         for f in self.faces:
             for i in range( 3 ):
                 v.append( self.vertices[f[i][0]] + self.normals[f[i][1]] )
         return v
         
+    def getArrays( self ):
+        """Positions, normals and (F,3) vertex and normal index arrays of the triangulated faces."""
+        positions = np.array( self.vertices, 'f' ).reshape( -1, 3 )
+        vfaces = mesh.triangulate( [[c[0] for c in f] for f in self.faces] )
+        if not self.has_normals:
+            if self.generated_normals is None:
+                self.generated_normals = mesh.smoothNormals( positions, vfaces, self.smooth_angle )
+            normals, nfaces = self.generated_normals
+            return positions, normals, vfaces, nfaces
+        normals = np.array( self.normals, 'f' ).reshape( -1, 3 )
+        nfaces = mesh.triangulate( [[c[1] for c in f] for f in self.faces] )
+        return positions, normals, vfaces, nfaces
+        
+    def getLODs( self ):
+        """Interleaved vertex/normal arrays from full resolution down, built once and cached."""
+        if self.lods is None:
+            self.lods = mesh.buildLODChain( *self.getArrays() )
+        return self.lods
+        
+def writeObj( filename, positions, normals, vfaces ):
+    """Write triangles with per vertex normals."""
+    with open( filename, 'w' ) as f:
+        f.writelines( f'v {x} {y} {z}\n' for x, y, z in positions )
+        f.writelines( f'vn {x} {y} {z}\n' for x, y, z in normals )
+        f.writelines( f'f {a+1}//{a+1} {b+1}//{b+1} {c+1}//{c+1}\n' for a, b, c in vfaces )
+        
 if __name__ == '__main__':
     obj = Obj3D( 'cube2.obj' )
 
@@ -69,4 +116,5 @@ if __name__ == '__main__':
         
     print( obj.getVerticesFlat() )
     print( obj.getVerticesAndNormalsFlat() )
+    print( [len( lod ) // 3 for lod in obj.getLODs()] )
     
\ No newline at end of file
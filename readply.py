@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+import mesh
+
+PLY_TYPES = {
+    'char': 'i1', 'int8': 'i1', 'uchar': 'u1', 'uint8': 'u1',
+    'short': 'i2', 'int16': 'i2', 'ushort': 'u2', 'uint16': 'u2',
+    'int': 'i4', 'int32': 'i4', 'uint': 'u4', 'uint32': 'u4',
+    'float': 'f4', 'float32': 'f4', 'double': 'f8', 'float64': 'f8',
+}
+
+class PlyMesh:
+    """Binary PLY mesh.
+
+    Fixed size elements are memory mapped and read through NumPy views; faces
+    are read the same way when every face has the same number of corners.
+    Mixed polygons are found by a Python loop over the faces, each record
+    starting after the corners counted by the one before, and are returned
+    as the corner indices back to back with the corner counts.
+    """
+    def __init__( self, filename, smooth_angle=None ):
+        self.smooth_angle = smooth_angle
+        self.lods = None
+
+        with open( filename, 'rb' ) as f:
+            if f.readline().strip() != b'ply':
+                raise ValueError( f'{filename} is not a PLY file' )
+            elements = []
+            while True:
+                line = f.readline()
+                if not line:
+                    raise ValueError( f'{filename}: missing end_header' )
+                words = line.decode( 'ascii' ).split()
+                if not words or words[0] in ( 'comment', 'obj_info' ):
+                    continue
+                if words[0] == 'format':
+                    if words[1] == 'binary_little_endian':
+                        order = '<'
+                    elif words[1] == 'binary_big_endian':
+                        order = '>'
+                    else:
+                        raise ValueError( f'{filename}: only binary PLY files are supported' )
+                elif words[0] == 'element':
+                    elements.append( ( words[1], int( words[2] ), [] ) )
+                elif words[0] == 'property':
+                    elements[-1][2].append( words[1:] )
+                elif words[0] == 'end_header':
+                    break
+            offset = f.tell()
+
+        data = np.memmap( filename, np.uint8, mode='r' )
+        self.vertices = self.faces = None
+        for name, count, properties in elements:
+            if any( p[0] == 'list' for p in properties ):
+                records, offset = self.readListElement( data, offset, count, properties, order )
+            else:
+                dtype = np.dtype( [( p[1], order+PLY_TYPES[p[0]] ) for p in properties] )
+                records = np.frombuffer( data, dtype, count, offset )
+                offset += dtype.itemsize * count
+            if name == 'vertex':
+                self.vertices = records
+            elif name == 'face':
+                self.faces = records
+
+        if self.vertices is None or self.faces is None:
+            raise ValueError( f'{filename}: needs vertex and face elements' )
+
+    def readListElement( self, data, offset, count, properties, order ):
+        # only a single list property (the face corner indices) is supported
+        if len( properties ) != 1:
+            raise ValueError( 'PLY list elements with several properties are not supported' )
+        _, counttype, itemtype, name = properties[0]
+        counttype = np.dtype( order+PLY_TYPES[counttype] )
+        itemtype = np.dtype( order+PLY_TYPES[itemtype] )
+        if not count:
+            return np.zeros( ( 0, 3 ), itemtype ), offset
+
+        # uniform corner count: one strided view over all records
+        corners = int( np.frombuffer( data, counttype, 1, offset )[0] )
+        dtype = np.dtype( [( 'n', counttype ), ( name, itemtype, ( corners, ) )] )
+        if offset + dtype.itemsize*count <= len( data ):
+            records = np.frombuffer( data, dtype, count, offset )
+            if ( records['n'] == corners ).all():
+                return records[name], offset + dtype.itemsize*count
+
+        # mixed polygons: finding each record from the count of the one before is sequential,
+        # so that walk is a Python loop, one step per face; only gathering the corners is done with NumPy
+        raw = memoryview( data )[offset:]
+        size, step = counttype.itemsize, itemtype.itemsize
+        if size == 1:
+            read = raw.__getitem__
+        else:
+            byteorder = 'little' if order == '<' else 'big'
+            read = lambda position: int.from_bytes( raw[position:position+size], byteorder )
+        starts = []
+        position = 0
+        try:
+            for i in range( count ):
+                starts.append( position )
+                position += size + read( position )*step
+        except IndexError:
+            position = len( raw )+1
+        if position > len( raw ):
+            raise ValueError( 'PLY face list runs past the end of the file' )
+        starts = np.array( starts, np.int64 )
+        counts = ( np.diff( starts, append=position ) - size ) // step
+
+        # byte offset of every corner, the polygons back to back
+        first = np.repeat( starts + size, counts )
+        corner = np.arange( len( first ) ) - np.repeat( np.cumsum( counts ) - counts, counts )
+        items = np.ndarray( ( max( len( raw )-step+1, 0 ), ), itemtype, data, offset, ( 1, ) )
+        return ( items[first + corner*step], counts ), offset + position
+
+    def getArrays( self ):
+        """Positions, normals and (F,3) vertex and normal index arrays of the triangulated faces."""
+        names = self.vertices.dtype.names
+        positions = np.stack( [self.vertices[c] for c in 'xyz'], -1 ).astype( 'f' )
+        if isinstance( self.faces, np.ndarray ):
+            faces = self.faces.astype( np.int64 )
+            vfaces = faces[:, [0, 1, 2]] if faces.shape[1] == 3 else np.concatenate( [faces[:, [0, i, i+1]] for i in range( 1, faces.shape[1]-1 )] )
+        else:
+            vfaces = mesh.fanTriangles( *self.faces )
+        if all( c in names for c in ( 'nx', 'ny', 'nz' ) ):
+            normals = np.stack( [self.vertices[c] for c in ( 'nx', 'ny', 'nz' )], -1 ).astype( 'f' )
+            return positions, normals, vfaces, vfaces
+        normals, nfaces = mesh.smoothNormals( positions, vfaces, self.smooth_angle )
+        return positions, normals, vfaces, nfaces
+
+    def getVerticesAndNormalsFlat( self ):
+        return mesh.flatten( *self.getArrays() )
+
+    def getLODs( self ):
+        """Interleaved vertex/normal arrays from full resolution down, built once and cached."""
+        if self.lods is None:
+            self.lods = mesh.buildLODChain( *self.getArrays() )
+        return self.lods
+
+def writePly( filename, positions, normals, vfaces ):
+    """Write a little endian binary PLY with per vertex normals and triangles."""
+    vertices = np.empty( len( positions ), [( c, '<f4' ) for c in ( 'x', 'y', 'z', 'nx', 'ny', 'nz' )] )
+    for i, c in enumerate( 'xyz' ):
+        vertices[c] = positions[:, i]
+        vertices['n'+c] = normals[:, i]
+    faces = np.empty( len( vfaces ), [( 'n', 'u1' ), ( 'v', '<i4', ( 3, ) )] )
+    faces['n'] = 3
+    faces['v'] = vfaces
+
+    header = 'ply\nformat binary_little_endian 1.0\n'
+    header += f'element vertex {len( vertices )}\n'
+    header += ''.join( f'property float {c}\n' for c in vertices.dtype.names )
+    header += f'element face {len( faces )}\nproperty list uchar int vertex_indices\nend_header\n'
+    with open( filename, 'wb' ) as f:
+        f.write( header.encode( 'ascii' ) )
+        f.write( vertices.tobytes() )
+        f.write( faces.tobytes() )
+
+if __name__ == '__main__':
+    import os
+    import tempfile
+    import time
+    from readobj import Obj3D, writeObj
+
+    # load time of the same mesh as text OBJ and binary PLY
+    positions, vfaces = mesh.sphere( 708 )
+    normals, _ = mesh.smoothNormals( positions, vfaces )
+    millions = len( vfaces ) / 1e6
+    with tempfile.TemporaryDirectory() as folder:
+        objname = os.path.join( folder, 'bench.obj' )
+        writeObj( objname, positions, normals, vfaces )
+        plyname = os.path.join( folder, 'bench.ply' )
+        writePly( plyname, positions, normals, vfaces )
+
+        for name, loader in ( ( objname, Obj3D ), ( plyname, PlyMesh ) ):
+            start = time.perf_counter()
+            data = loader( name ).getVerticesAndNormalsFlat()
+            elapsed = time.perf_counter()-start
+            print( f'{os.path.basename( name )}: {elapsed/millions:.2f}s per million triangles' )
@@ -1,12 +1,38 @@
+import bisect
 import random
 
-class Plug:
-    count = 1
+slot_names = {}
+
+class Slotted:
+    """Base of the model classes, which keep their attributes in __slots__ to stay small.
+    
+    They pickle to the same plain attribute dict as before they had slots,
+    so pickles written either way load into either."""
+    __slots__ = ()
+    
+    def __getstate__(self):
+        cls = type(self)
+        if cls not in slot_names:
+            slot_names[cls] = [name for c in cls.__mro__ for name in c.__dict__.get('__slots__', ()) if name != '__dict__']
+        return {name: getattr(self, name) for name in slot_names[cls] if hasattr(self, name)}
+        
+    def __setstate__(self, state):
+        if isinstance(state, tuple):
+            # (dict, slots) of the default object state
+            state = {**(state[0] or {}), **(state[1] or {})}
+        for name, value in state.items():
+            setattr(self, name, value)
+            
+class Plug(Slotted):
+    __slots__ = ('name', 'parent', 'type', 'variable', 'prefix', 'value', 'defaultValue', 'inParam', 'declared',
+                 'declare_variable', 'editable', 'internal', 'list', 'display', 'consumers')
     def __init__(self, name, parent, type, variable, value, generate_variable=True, display=True, inParam=True, declare_variable=True, internal = False):
         self.name = name
         self.parent = parent
         self.type = type
         self.variable = variable
+        # stem of a generated variable name, numbered by ShaderGraph.nameVariables; None for fixed names
+        self.prefix = variable if generate_variable else None
         self.value = value
         self.defaultValue = value
         self.inParam = inParam
@@ -15,19 +41,45 @@ class Plug:
         self.editable = True
         self.internal = internal
         
-        self.list = []
-        
-        if generate_variable:
-            self.variable += str(Plug.count)
-            Plug.count += 1
+        # choices of list values, shared empty tuple for all other plugs
+        self.list = ()
+        # input plugs fed by this output plug, a list (most feed only one) from the first connection
+        self.consumers = None
         
         self.display = display
         
+    def __getstate__(self):
+        # rebuilt by ShaderGraph.indexConsumers when a graph is unpickled
+        state = super().__getstate__()
+        state.pop('consumers', None)
+        return state
+        
+    def __setstate__(self, state):
+        self.consumers = None
+        super().__setstate__(state)
+        if not hasattr(self, 'prefix'):
+            # pickled when generated names were numbered at creation, the number ends them
+            stem = self.variable.rstrip('0123456789')
+            generated = stem != self.variable and not isinstance(self.parent, UniformNode)
+            self.prefix = stem if generated else None
+        
     def __str__(self):
         return f'{self.variable}'
         
     def setValue(self, value):
+        """Set a value or connect to an output plug, keeping the consumers of the plugs up to date."""
+        previous = self.value
+        if isinstance(previous, Plug) and previous.consumers and self in previous.consumers:
+            previous.consumers.remove(self)
         self.value = value
+        if isinstance(value, Plug):
+            value.addConsumer(self)
+            
+    def addConsumer(self, plug):
+        if self.consumers is None:
+            self.consumers = [plug]
+        elif plug not in self.consumers:
+            self.consumers.append(plug)
         
     def getDecleration(self):
         if isinstance(self.value, Plug):
@@ -36,7 +88,7 @@ class Plug:
             return f'{self.type} {self.variable} = {self.value}'
         
     def setDefaultValue(self):
-        self.value = self.defaultValue
+        self.setValue(self.defaultValue)
     
     def setList( self, list ):
         self.list = list
@@ -44,7 +96,8 @@ class Plug:
     def getList( self ):
         return self.list
         
-class Value:
+class Value(Slotted):
+    __slots__ = ('parent', 'value')
     def __init__(self, value=''):
         self.parent = None
         self.value = value
@@ -62,6 +115,7 @@ class Value:
         self.value = value
         
 class ColorValue(Value):
+    __slots__ = ('color',)
     def __init__(self, color=(.9,.9,.9,1)):
         super().__init__()
         self.color = color
@@ -76,6 +130,7 @@ class ColorValue(Value):
         self.color = (round(r/255.0,3), round(g/255.0,3), round(b/255.0,3), 1.0)
         
 class Vec3Value(Value):
+    __slots__ = ('vector',)
     def __init__(self, vector=(0,0,0)):
         super().__init__()
         self.vector = vector
@@ -84,6 +139,7 @@ class Vec3Value(Value):
         return f'vec3({self.vector[0]}, {self.vector[1]}, {self.vector[2]})'
     
 class Vec4Value(Value):
+    __slots__ = ('vector',)
     def __init__(self, vector=(0,0,0,1)):
         super().__init__()
         self.vector = vector
@@ -92,6 +148,7 @@ class Vec4Value(Value):
         return f'vec4({self.vector[0]}, {self.vector[1]}, {self.vector[2]}, {self.vector[3]})'
     
 class Mat4Value(Value):
+    __slots__ = ('mat',)
     def __init__(self, mat=(1,0,0,0, 0,1,0,0, 0,0,1,0, 0,0,0,1)):
         super().__init__()
         self.mat = mat
@@ -100,6 +157,7 @@ class Mat4Value(Value):
         return f'mat4({self.mat[0]}, {self.mat[1]}, {self.mat[2]}, {self.mat[3]}, {self.mat[4]}, {self.mat[5]}, {self.mat[6]}, {self.mat[7]}, {self.mat[8]}, {self.mat[9]}, {self.mat[10]}, {self.mat[11]}, {self.mat[12]}, {self.mat[13]}, {self.mat[14]}, {self.mat[15]})'
     
 class FloatValue(Value):
+    __slots__ = ()
     def __init__(self, value=1):
         super().__init__(value)
         
@@ -113,14 +171,17 @@ class FloatValue(Value):
             pass
         
 class StringValue(Value):
+    __slots__ = ()
     def __init__(self, value='sin'):
         super().__init__(value)
 
 class ListValue(Value):
+    __slots__ = ()
     def __init__(self, value = 'sin'):
         super().__init__(value)
         
-class Node:
+class Node(Slotted):
+    __slots__ = ('inplugs', 'outplugs', 'name', 'active', 'location', 'can_delete', 'global_declared')
     def __init__( self, name='Node' ):
         self.inplugs = {}
         self.outplugs = {}
@@ -185,19 +246,28 @@ class Node:
         return f'{self.outplugs[name].getDecleration()}'
         
 class UniformNode(Node):
-    varcount = 1
+    __slots__ = ('uniform', 'plug', 'prefix')
     def __init__(self, name, type, count, function):
         super().__init__(name)
         
-        name = name+str(UniformNode.varcount)
-        UniformNode.varcount += 1
-        
+        # numbered by ShaderGraph.nameVariables like the variables
+        self.prefix = name
         self.uniform = (name, count, function)
         
         self.plug = Plug('Uniform', self, type, name, "uniform "+type+" "+name, inParam=False, generate_variable=False)
         self.addOutPlug(self.plug)
         self.plug.editable = False
         
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        if not hasattr(self, 'prefix'):
+            self.prefix = self.uniform[0].rstrip('0123456789')
+            
+    def setUniformName(self, name):
+        self.uniform = (name,) + self.uniform[1:]
+        self.plug.variable = name
+        self.plug.value = self.plug.defaultValue = f'uniform {self.plug.type} {name}'
+        
     def __str__(self):
         return self.plug.value
         
@@ -205,6 +275,7 @@ class UniformNode(Node):
         return self.__str__()
         
 class UniformRandomFloatNode(UniformNode):
+    __slots__ = ()
     def __init__(self):
         super().__init__('RandomFloat', 'float', 1, UniformRandomFloatNode.getRandomFloat)
         
@@ -212,6 +283,7 @@ class UniformRandomFloatNode(UniformNode):
         return [random.random()]
         
 class UniformRandomColorNode(UniformNode):
+    __slots__ = ()
     def __init__(self):
         super().__init__('RandomColor', 'vec4', 4, UniformRandomColorNode.getRandomColor)
         
@@ -219,6 +291,7 @@ class UniformRandomColorNode(UniformNode):
         return (random.random(), random.random(), random.random(), 1)
         
 class ScaleNode(Node):
+    __slots__ = ()
     def __init__(self):
         super().__init__('Scale')
         
@@ -230,6 +303,7 @@ class ScaleNode(Node):
         return f'vec4 {self.outplugs["ScaleOutColor"].variable} = {self.inplugs["ScaleInColor"].variable} * {self.inplugs["ScaleFloat"].variable}'
         
 class Vec4ToColorNode(Node):
+    __slots__ = ()
     def __init__(self):
         super().__init__('Vec4 to Color')
         
@@ -243,6 +317,7 @@ class Vec4ToColorNode(Node):
         return f'vec4 {self.outplugs["Color"].variable} = vec4({self.inplugs["R"].variable}, {self.inplugs["G"].variable}, {self.inplugs["B"].variable}, {self.inplugs["A"].variable})'
         
 class InvertColorNode(Node):
+    __slots__ = ()
     def __init__(self):
         super().__init__('Invert Color')
         
@@ -253,6 +328,7 @@ class InvertColorNode(Node):
         return f'vec4 {self.outplugs["outColor"].variable} = vec4(1-{self.inplugs["inColor"].variable}.r, 1-{self.inplugs["inColor"].variable}.g, 1-{self.inplugs["inColor"].variable}.b, {self.inplugs["inColor"].variable}.a)'
         
 class DivideNode(Node):
+    __slots__ = ()
     def __init__(self):
         super().__init__('Divide')
         
@@ -264,6 +340,7 @@ class DivideNode(Node):
         return f'float {self.outplugs["Result"].variable} = {self.inplugs["Divident"].variable} / {self.inplugs["Divisor"].variable}'
         
 class OperatorIINode(Node):
+    __slots__ = ()
     def __init__(self):
         super().__init__('Operator (II)')
         
@@ -279,6 +356,7 @@ class OperatorIINode(Node):
         return f'float {self.outplugs["Result"].variable} = {self.inplugs["From"].variable} {self.inplugs["Operator"].value} {self.inplugs["What"].variable}'
         
 class AddColorNode(Node):
+    __slots__ = ()
     def __init__(self):
         super().__init__('Add Color')
         
@@ -290,6 +368,7 @@ class AddColorNode(Node):
         return f'vec4 {self.outplugs["Result"].variable} = {self.inplugs["Color1"].variable} + {self.inplugs["Color2"].variable}'
         
 class VectorTransformNode(Node):
+    __slots__ = ()
     def __init__(self):
         super().__init__('Vector transform')
         
@@ -301,6 +380,7 @@ class VectorTransformNode(Node):
         return f'vec4 {self.outplugs["Result"].variable} = {self.inplugs["Matrix"].variable} * vec4({self.inplugs["Vector"].variable})'
         
 class SmoothStepNode(Node):
+    __slots__ = ()
     def __init__(self):
         super().__init__('Smooth Step')
         
@@ -313,6 +393,7 @@ class SmoothStepNode(Node):
         return f'float {self.outplugs["Result"].variable} = smoothstep({self.inplugs["Edge1"].variable}, {self.inplugs["Edge2"].variable}, {self.inplugs["Interpolation"].variable})'
         
 class PlotNode(Node):
+    __slots__ = ()
     def __init__(self):
         super().__init__('Plot')
         
@@ -324,6 +405,7 @@ class PlotNode(Node):
         return f'float {self.outplugs["Result"].variable} = smoothstep({self.inplugs["Pct"].variable}-0.02,{self.inplugs["Pct"].variable},{self.inplugs["Interp"].variable}) - smoothstep({self.inplugs["Pct"].variable},{self.inplugs["Pct"].variable}+0.02,{self.inplugs["Interp"].variable})'
         
 class FunctionINode(Node):
+    __slots__ = ('varTypePlug',)
     def __init__(self):
         super().__init__('Function (I)')
         
@@ -342,6 +424,7 @@ class FunctionINode(Node):
         return f'{self.inplugs["Type"].value} {self.outplugs["Result"].variable} = {self.inplugs["Function"].value}({self.inplugs["Param"].value})'
 
 class FunctionIINode(Node):
+    __slots__ = ()
     def __init__(self):
         super().__init__('Function (II)')
         
@@ -361,6 +444,7 @@ class FunctionIINode(Node):
         return f'{self.inplugs["Type"].value} {self.outplugs["Result"].variable} = {self.inplugs["Function"].value}({self.inplugs["Param1"].variable}, {self.inplugs["Param2"].variable})'
 
 class FunctionIIINode(Node):
+    __slots__ = ()
     def __init__(self):
         super().__init__('Function (III)')
         
@@ -381,6 +465,7 @@ class FunctionIIINode(Node):
         return f'{self.inplugs["Type"].value} {self.outplugs["Result"].variable} = {self.inplugs["Function"].value}({self.inplugs["Param1"].variable}, {self.inplugs["Param2"].variable}, {self.inplugs["Param3"].variable})'
 
 class FunctionIVNode(Node):
+    __slots__ = ()
     def __init__(self):
         super().__init__('Function (IV)')
         
@@ -402,14 +487,24 @@ class FunctionIVNode(Node):
         return f'{self.inplugs["Type"].value} {self.outplugs["Result"].variable} = {self.inplugs["Function"].value}({self.inplugs["Param1"].variable}, {self.inplugs["Param2"].variable}, {self.inplugs["Param3"].variable}, {self.inplugs["Param4"].variable})'
 
 class FragCoordNode(Node):
+    __slots__ = ()
     def __init__(self):
         super().__init__('Coordinates')
         
-        self.addOutPlug(Plug('X', self, 'float', 'gl_FragCoord.x', FloatValue(), generate_variable=False, declare_variable=False))
-        self.addOutPlug(Plug('Y', self, 'float', 'gl_FragCoord.y', FloatValue(), generate_variable=False, declare_variable=False))
-        self.addOutPlug(Plug('Z', self, 'float', 'gl_FragCoord.z', FloatValue(), declare_variable=False))
+        # window coordinates stay the same when the preview renders at a reduced scale
+        self.addOutPlug(Plug('X', self, 'float', '(gl_FragCoord.x/sg_RenderScale)', FloatValue(), generate_variable=False, declare_variable=False))
+        self.addOutPlug(Plug('Y', self, 'float', '(gl_FragCoord.y/sg_RenderScale)', FloatValue(), generate_variable=False, declare_variable=False))
+        self.addOutPlug(Plug('Z', self, 'float', 'gl_FragCoord.z', FloatValue(), generate_variable=False, declare_variable=False))
+        
+    def getGlobalCode(self):
+        return 'uniform float sg_RenderScale;\n'
         
 class InputMeshNode(Node):
+    __slots__ = ()
+    # vertex layout uploaded by the preview, see mesh.packVertices
+    position_format = 'float'
+    normal_format = 'float'
+    
     def __init__(self):
         super().__init__('Input Mesh')
         
@@ -422,13 +517,46 @@ class InputMeshNode(Node):
         self.addOutPlug(plug)
 
     def getGlobalCode(self):
-        return 'layout(location = 0) in vec3 Vertex;\nlayout(location = 1) in vec3 Normal;\n';
+        if InputMeshNode.position_format == 'quantized':
+            code = 'layout(location = 0) in vec3 VertexQuantized;\nuniform vec3 sg_BoundsMin;\nuniform vec3 sg_BoundsSize;\n'
+            code += '#define Vertex (sg_BoundsMin + VertexQuantized * sg_BoundsSize)\n'
+        else:
+            # half floats are widened by the attribute fetch
+            code = 'layout(location = 0) in vec3 Vertex;\n'
+            
+        if InputMeshNode.normal_format == 'int2101010':
+            code += 'layout(location = 1) in vec4 NormalPacked;\n#define Normal (NormalPacked.xyz)\n'
+        elif InputMeshNode.normal_format == 'octahedral':
+            code += 'layout(location = 1) in vec2 NormalOct;\n'
+            code += 'vec3 sg_OctDecode(vec2 e) {\n\tvec3 n = vec3(e, 1.0 - abs(e.x) - abs(e.y));\n\tfloat t = max(-n.z, 0.0);\n\tn.xy -= vec2(n.x >= 0.0 ? t : -t, n.y >= 0.0 ? t : -t);\n\treturn normalize(n);\n}\n'
+            code += '#define Normal (sg_OctDecode(NormalOct))\n'
+        else:
+            code += 'layout(location = 1) in vec3 Normal;\n'
+        return code
+        
+class InstanceNode(Node):
+    __slots__ = ()
+    def __init__(self):
+        super().__init__('Instance')
+        
+        plug = Plug('Instance ID', self, 'float', 'float(gl_InstanceID)', FloatValue(), generate_variable=False, declare_variable=False)
+        plug.editable = False
+        self.addOutPlug(plug)
+        
+        plug = Plug('Transform', self, 'mat4', 'InstanceTransform', Mat4Value(), generate_variable=False, declare_variable=False)
+        plug.editable = False
+        self.addOutPlug(plug)
+        
+    def getGlobalCode(self):
+        # per instance attribute, occupies locations 2 to 5
+        return 'layout(location = 2) in mat4 InstanceTransform;\n'
         
 class VertexColorNode(Node):
+    __slots__ = ()
     def __init__(self):
         super().__init__('Vertex Color')
         
-        p = Plug('Vertex Color', self, '', 'vertexColor', ColorValue(), False, declare_variable=False)
+        p = Plug('Vertex Color', self, 'vec4', 'vertexColor', ColorValue(), False, declare_variable=False)
         p.editable = False
         self.addOutPlug( p )
         
@@ -436,6 +564,7 @@ class VertexColorNode(Node):
         return 'in vec4 vertexColor;\n';
         
 class VertexShaderNode(Node):
+    __slots__ = ()
     def __init__(self):
         super().__init__('Vertex Shader')
         
@@ -450,6 +579,7 @@ class VertexShaderNode(Node):
         return 'out vec4 vertexColor;\n';
         
 class FragmentShaderNode(Node):
+    __slots__ = ()
     def __init__(self):
         super().__init__('Fragment Shader')
         
@@ -476,6 +606,7 @@ node_classes = {
             'Function (III)': FunctionIIINode,
             'Function (IV)': FunctionIVNode,
             'Vector Transform': VectorTransformNode,
+            'Instance': InstanceNode,
         }
         
 custom_nodes = {}
@@ -501,37 +632,329 @@ class NodeFactory:
     def addCustomNode(name, outplugs):
         custom_nodes[name] = (name, outplugs)
     
+class NodeList:
+    """Nodes of a graph in the order they were added, with constant time append and removal.
+    
+    Every node keeps the position it was appended at; restore puts a removed
+    node back at its position. Indexing builds a list and is only meant for
+    scripts, iterate instead.
+    """
+    def __init__( self, nodes=() ):
+        self.positions = {}
+        self.counter = 0
+        self.extend(nodes)
+        
+    def __iter__( self ):
+        return iter(self.positions)
+        
+    def __reversed__( self ):
+        return reversed(self.positions)
+        
+    def __len__( self ):
+        return len(self.positions)
+        
+    def __contains__( self, node ):
+        return node in self.positions
+        
+    def __getitem__( self, index ):
+        return list(self.positions)[index]
+        
+    def append( self, node ):
+        # ShaderGraph.new leaves out custom nodes that are not registered
+        if node is not None:
+            self.positions[node] = self.counter
+            self.counter += 1
+            
+    def extend( self, nodes ):
+        for node in nodes:
+            self.append(node)
+            
+    def remove( self, node ):
+        """Remove a node, returns its position."""
+        try:
+            return self.positions.pop(node)
+        except KeyError:
+            raise ValueError('node is not in the graph') from None
+            
+    def restore( self, node, position ):
+        if not self.positions or position > next(reversed(self.positions.values())):
+            self.positions[node] = position
+            self.counter = max(self.counter, position+1)
+        else:
+            # rare (undo): rebuild the order
+            items = list(self.positions.items())
+            at = bisect.bisect([p for _, p in items], position)
+            items.insert(at, (node, position))
+            self.positions = dict(items)
+            
+    def clear( self ):
+        self.positions.clear()
+        
 class ShaderGraph:
+    """Nodes of a vertex and fragment shader.
+    
+    Edits made through addNode, removeNode, connect, disconnect, setValue and
+    moveNode are reported to the listeners as listener(operation, *arguments),
+    with the state each edit replaced so it can be journaled or undone:
+    
+        'add', node, position in nodes or None when appended
+        'remove', node, [(plug, source) of the connections it had to drop], position it had in nodes
+        'connect', plug, previous value
+        'disconnect', plug, previous source
+        'value', plug, previous value
+        'move', node, previous location
+        'reset'
+    
+    Output plugs know the input plugs they feed (Plug.consumers), so removing
+    a node and following connections downstream take time proportional to
+    the connections involved.
+    
+    Variable and uniform names are numbered by prepare from the connections
+    alone, so equal graphs generate byte-identical GLSL whatever the order
+    their nodes were created or loaded in.
+    
+    connect refuses connections that would make a cycle. A topological order
+    of the nodes is kept up to date incrementally (Pearce and Kelly), so a
+    connection is checked by searching only the nodes ordered between its
+    two ends; the order is rebuilt once nodes were put into nodes directly.
+    """
     def __init__(self):
         self.uniforms = {}
-        self.nodes = []
+        self.nodes = NodeList()
+        self.listeners = []
+        # node -> rank in a topological order, sources first
+        self.order = {}
+        self.order_counter = 0
         
         self.new()
         
+    def __getstate__( self ):
+        # listeners belong to the editor session, not to the graph
+        state = self.__dict__.copy()
+        state['listeners'] = []
+        state['order'] = {}
+        return state
+        
+    def __setstate__( self, state ):
+        state.setdefault('listeners', [])
+        state['order'] = {}
+        state.setdefault('order_counter', 0)
+        if not isinstance(state['nodes'], NodeList):
+            state['nodes'] = NodeList(state['nodes'])
+        self.__dict__.update(state)
+        self.indexConsumers()
+        
+    def indexConsumers( self ):
+        """Rebuild Plug.consumers from the connections of all nodes."""
+        for node in self.nodes:
+            for plug in node.outplugs.values():
+                plug.consumers = None
+        for node in self.nodes:
+            self.attachInputs(node)
+            
+    def attachInputs( self, node ):
+        for plug in node.inplugs.values():
+            if isinstance(plug.value, Plug):
+                plug.value.addConsumer(plug)
+                
+    def detachInputs( self, node ):
+        # the plugs keep their values, for the node to be added back
+        for plug in node.inplugs.values():
+            source = plug.value
+            if isinstance(source, Plug) and source.consumers and plug in source.consumers:
+                source.consumers.remove(plug)
+                
+    def notify( self, operation, *args ):
+        self.requires_compilation = self.requires_compilation or operation != 'move'
+        for listener in self.listeners:
+            listener( operation, *args )
+        
     def getVertexShaderNode(self):
         return self.vsnode
         
     def getFragmentShaderNode(self):
         return self.fsnode
         
+    def consumers( self, node ):
+        """Input plugs of other nodes fed by the outputs of node."""
+        return [plug for out in node.outplugs.values() if out.consumers for plug in out.consumers if plug.parent is not node]
+        
+    def downstream( self, nodes ):
+        """Nodes that depend on the given ones, directly or indirectly."""
+        found = set()
+        pending = list(nodes)
+        while pending:
+            for plug in self.consumers(pending.pop()):
+                if plug.parent not in found:
+                    found.add(plug.parent)
+                    pending.append(plug.parent)
+        return found
+        
+    def sources( self, node ):
+        """Other nodes feeding the inputs of node."""
+        return [plug.value.parent for plug in node.inplugs.values() if isinstance(plug.value, Plug) and plug.value.parent is not node]
+        
+    def sortNodes( self ):
+        """Rebuild the topological order of all nodes."""
+        self.order = {}
+        for root in self.nodes:
+            if root in self.order:
+                continue
+            # ranked once all of their sources are
+            self.order[root] = None
+            stack = [(root, iter(self.sources(root)))]
+            while stack:
+                node, sources = stack[-1]
+                for source in sources:
+                    if source not in self.order:
+                        self.order[source] = None
+                        stack.append((source, iter(self.sources(source))))
+                        break
+                else:
+                    stack.pop()
+                    self.order[node] = self.order_counter
+                    self.order_counter += 1
+                    
+    def getOrder( self ):
+        if len(self.order) != len(self.nodes):
+            self.sortNodes()
+        return self.order
+        
+    def affectedNodes( self, source, target ):
+        """Nodes to reorder for a new connection from node source to node target, None if it closes a cycle.
+        
+        Returns the nodes depending on target and the nodes target would depend
+        on, limited to those ordered between target and source. Empty when
+        source already comes before target.
+        """
+        order = self.getOrder()
+        if source is target:
+            return None
+        lower, upper = order[target], order[source]
+        if lower > upper:
+            return [], []
+        forward = {target}
+        pending = [target]
+        while pending:
+            for plug in self.consumers(pending.pop()):
+                node = plug.parent
+                if node is source:
+                    return None
+                if node not in forward and order[node] < upper:
+                    forward.add(node)
+                    pending.append(node)
+        backward = {source}
+        pending = [source]
+        while pending:
+            for node in self.sources(pending.pop()):
+                if node not in backward and order[node] > lower:
+                    backward.add(node)
+                    pending.append(node)
+        return forward, backward
+        
+    def canConnect( self, plug, source ):
+        """Whether output plug source can feed input plug without making a cycle."""
+        return self.affectedNodes(source.parent, plug.parent) is not None
+        
+    def addNode( self, node, position=None ):
+        if position is None:
+            self.nodes.append(node)
+        else:
+            self.nodes.restore(node, position)
+        self.attachInputs(node)
+        # after its sources, whatever ranks they have
+        if len(self.order) == len(self.nodes)-1:
+            self.order[node] = self.order_counter
+            self.order_counter += 1
+        self.notify('add', node, position)
+        
     def removeNode(self, rnode):
-        self.nodes.remove(rnode)
-        for node in self.nodes:
-            for plug in node.inplugs.values():
-                try:
-                    if rnode==plug.value.parent:
-                        plug.setDefaultValue()
-                except:
-                    pass
+        position = self.nodes.remove(rnode)
+        self.order.pop(rnode, None)
+        dropped = []
+        for plug in list(self.consumers(rnode)):
+            dropped.append((plug, plug.value))
+            plug.setDefaultValue()
+        self.detachInputs(rnode)
+        self.notify('remove', rnode, dropped, position)
+        
+    def connect( self, plug, source ):
+        """Feed input plug from output plug source, raises ValueError if that would make a cycle."""
+        affected = self.affectedNodes(source.parent, plug.parent)
+        if affected is None:
+            raise ValueError(f'connecting {source.parent.name} to {plug.parent.name} would make a cycle')
+        forward, backward = affected
+        # the nodes source depends on take the lowest of the ranks involved
+        order = self.order
+        moved = sorted(backward, key=order.get) + sorted(forward, key=order.get)
+        for node, rank in zip(moved, sorted(order[node] for node in moved)):
+            order[node] = rank
+        previous = plug.value
+        plug.setValue(source)
+        self.notify('connect', plug, previous)
+        
+    def disconnect( self, plug ):
+        """Return an input plug to its own (last edited) value."""
+        previous = plug.value
+        plug.setDefaultValue()
+        self.notify('disconnect', plug, previous)
+        
+    def setValue( self, plug, value ):
+        """Replace the value object of an unconnected plug, the previous one is kept unchanged."""
+        previous = plug.value
+        if plug.defaultValue is previous:
+            plug.defaultValue = value
+        plug.setValue(value)
+        self.notify('value', plug, previous)
+        
+    def moveNode( self, node, location, previous=None ):
+        """Place a node; previous is its location before an interactive drag that already moved it."""
+        if previous is None:
+            previous = list(node.location)
+        node.location = list(location)
+        self.notify('move', node, list(previous))
+                    
+    def nameVariables( self ):
+        """Number the generated variables and uniforms in a canonical order.
+        
+        Nodes are numbered once their sources are, starting from the vertex
+        and the fragment shader and following the input plugs in the order
+        the nodes declare them; the nodes the shaders do not use come last.
+        """
+        visited = set()
+        variable = uniform = 1
+        for root in [self.vsnode, self.fsnode, *self.nodes]:
+            if not root or root in visited:
+                continue
+            visited.add(root)
+            stack = [(root, iter(root.inplugs.values()))]
+            while stack:
+                node, plugs = stack[-1]
+                for plug in plugs:
+                    source = plug.value
+                    if isinstance(source, Plug) and source.parent not in visited:
+                        visited.add(source.parent)
+                        stack.append((source.parent, iter(source.parent.inplugs.values())))
+                        break
+                else:
+                    stack.pop()
+                    if isinstance(node, UniformNode):
+                        node.setUniformName(f'{node.prefix}{uniform}')
+                        uniform += 1
+                    for plug in (*node.inplugs.values(), *node.outplugs.values()):
+                        if plug.prefix is not None:
+                            plug.variable = f'{plug.prefix}{variable}'
+                            variable += 1
                     
     def prepare(self):
+        self.nameVariables()
         self.uniforms.clear()
         for node in self.nodes:
             if not node:
                 continue
             node.global_declared = False
             if isinstance(node, UniformNode):
-                self.uniforms[node.name] = node.uniform
+                self.uniforms[node.uniform[0]] = node.uniform
             for plug in node.inplugs.values():
                 plug.declared = False
             for plug in node.outplugs.values():
@@ -540,7 +963,7 @@ class ShaderGraph:
     def new( self ):
         self.uniforms.clear()
         self.nodes.clear()
-        Plug.count = 1
+        self.order = {}
         
         # vertex shader
         self.vsnode = VertexShaderNode()
@@ -558,6 +981,13 @@ class ShaderGraph:
         vtn = VectorTransformNode()
         vtn.location = [130, 80]
         
+        # copies of the preview mesh are placed by their instance transform
+        inn = InstanceNode()
+        inn.location = [10, -60]
+        
+        itn = VectorTransformNode()
+        itn.location = [130, -20]
+        
         fn = FunctionINode()
         fn.inplugs['Function'].value.SetValue('abs')
         fn.inplugs['Type'].value.SetValue('vec4')
@@ -566,7 +996,9 @@ class ShaderGraph:
         self.vsnode.inplugs['Position'].setValue(vtn.outplugs['Result'])
         fn.inplugs['Param'].setValue(ivn.outplugs['Normal'])
         self.vsnode.inplugs['Color'].setValue(fn.outplugs['Result'])
-        vtn.inplugs['Vector'].setValue(ivn.outplugs['Position'])
+        itn.inplugs['Vector'].setValue(ivn.outplugs['Position'])
+        itn.inplugs['Matrix'].setValue(inn.outplugs['Transform'])
+        vtn.inplugs['Vector'].setValue(itn.outplugs['Result'])
         if mn:
             vtn.inplugs['Matrix'].setValue(mn.outplugs['Matrix'])
     
@@ -581,18 +1013,11 @@ class ShaderGraph:
         
         self.fsnode.inplugs['Color'].setValue(vcn.outplugs['Vertex Color'])
         
-        self.nodes.extend([self.vsnode, ivn, vtn, fn, mn, self.fsnode, vcn])
+        self.nodes.extend([self.vsnode, ivn, inn, itn, vtn, fn, mn, self.fsnode, vcn])
         
         self.in_error = False
         self.requires_compilation = True
-        
-    def updateVariableCount( self ):
-        Plug.count = 1
-        for node in self.nodes:
-            for plug in node.inplugs.values():
-                Plug.count += 1
-            for plug in node.outplugs.values():
-                Plug.count += 1
+        self.notify('reset')
         
 # TEST
 if __name__ == '__main__':
@@ -633,4 +1058,47 @@ if __name__ == '__main__':
     
     g.new()
     
-    
\ No newline at end of file
+        
+    # python shadergraph.py --bench 20000: memory per node and code generation time of a node chain
+    import sys
+    if '--bench' in sys.argv:
+        import pickle
+        import time
+        import tracemalloc
+        count = int(sys.argv[sys.argv.index('--bench')+1])
+        sys.setrecursionlimit(max(sys.getrecursionlimit(), count*20))
+        
+        tracemalloc.start()
+        last = None
+        for i in range(count):
+            node = NodeFactory.getNewNode(('Divide', 'Smooth Step', 'Operator (II)')[i%3])
+            if last:
+                list(node.inplugs.values())[-1].setValue(last.outplugs['Result'])
+            g.nodes.append(node)
+            last = node
+        memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        g.getFragmentShaderNode().inplugs['Color'].setValue(last.outplugs['Result'])
+        
+        start = time.perf_counter()
+        g.prepare()
+        code, globalcode = g.getFragmentShaderNode().generateCode('Pixel Color', '', '')
+        elapsed = time.perf_counter()-start
+        print(f'{count} nodes: {memory/count:.0f} bytes per node, code generation {elapsed*1000:.0f}ms')
+        
+        # a connection back over a few nodes of the chain only searches between its ends,
+        # finding the cycle by traversal visits all of the chain downstream
+        chain = [node for node in g.nodes if 'Result' in node.outplugs][-count:]
+        start = time.perf_counter()
+        for i in range(0, count-3, 3):
+            assert not g.canConnect(chain[i].inplugs['Divident'], chain[i+2].outplugs['Result'])
+        checked = (time.perf_counter()-start) / len(range(0, count-3, 3))
+        start = time.perf_counter()
+        g.downstream([chain[0]])
+        traversed = time.perf_counter()-start
+        print(f'cycle check {checked*1e6:.1f}us per connection, traversal from the first node {traversed*1000:.1f}ms')
+        
+        if count <= 2000:
+            copy = pickle.loads(pickle.dumps(g, 0))
+            copy.prepare()
+            assert copy.getFragmentShaderNode().generateCode('Pixel Color', '', '') == (code, globalcode)
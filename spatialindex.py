@@ -0,0 +1,88 @@
+import math
+
+class GridIndex:
+    """Uniform grid over axis aligned rectangles (x, y, width, height).
+
+    Items are kept in every cell their rectangle overlaps, so queries only
+    look at the cells under the query point or rectangle. Moving an item only
+    touches the cells it enters or leaves.
+    """
+    def __init__( self, cellsize=128 ):
+        self.cellsize = cellsize
+        self.cells = {}
+        self.rects = {}
+        self.itemcells = {}
+
+    def __len__( self ):
+        return len( self.rects )
+
+    def __contains__( self, item ):
+        return item in self.rects
+
+    def cellRange( self, rect ):
+        x, y, w, h = rect
+        cs = self.cellsize
+        return math.floor( x/cs ), math.floor( y/cs ), math.floor( (x+w)/cs ), math.floor( (y+h)/cs )
+
+    def update( self, item, rect ):
+        """Insert an item or move it to a new rectangle."""
+        rect = tuple( rect )
+        self.rects[item] = rect
+        cells = self.cellRange( rect )
+        old = self.itemcells.get( item )
+        if old == cells:
+            return
+        if old:
+            self.removeFromCells( item, old )
+        self.itemcells[item] = cells
+        x1, y1, x2, y2 = cells
+        for cx in range( x1, x2+1 ):
+            for cy in range( y1, y2+1 ):
+                self.cells.setdefault( (cx, cy), set() ).add( item )
+
+    def remove( self, item ):
+        if item in self.rects:
+            self.removeFromCells( item, self.itemcells.pop( item ) )
+            del self.rects[item]
+
+    def removeFromCells( self, item, cells ):
+        x1, y1, x2, y2 = cells
+        for cx in range( x1, x2+1 ):
+            for cy in range( y1, y2+1 ):
+                cell = self.cells[(cx, cy)]
+                cell.discard( item )
+                if not cell:
+                    del self.cells[(cx, cy)]
+
+    def clear( self ):
+        self.cells.clear()
+        self.rects.clear()
+        self.itemcells.clear()
+
+    def queryPoint( self, x, y ):
+        """Items whose rectangle contains the point."""
+        cs = self.cellsize
+        found = []
+        for item in self.cells.get( (math.floor( x/cs ), math.floor( y/cs )), () ):
+            rx, ry, rw, rh = self.rects[item]
+            if rx <= x <= rx+rw and ry <= y <= ry+rh:
+                found.append( item )
+        return found
+
+    def queryRect( self, rect ):
+        """Items whose rectangle intersects the given one."""
+        x, y, w, h = rect
+        x1, y1, x2, y2 = self.cellRange( rect )
+        found = set()
+        if (x2-x1+1) * (y2-y1+1) > len( self.cells ):
+            # fewer occupied cells than cells under the rectangle
+            candidates = ( i for cx, cy in self.cells if x1 <= cx <= x2 and y1 <= cy <= y2 for i in self.cells[(cx, cy)] )
+        else:
+            candidates = ( i for cx in range( x1, x2+1 ) for cy in range( y1, y2+1 ) for i in self.cells.get( (cx, cy), () ) )
+        for item in candidates:
+            if item in found:
+                continue
+            rx, ry, rw, rh = self.rects[item]
+            if rx <= x+w and x <= rx+rw and ry <= y+h and y <= ry+rh:
+                found.add( item )
+        return found
@@ -0,0 +1,11 @@
+import os
+import sys
+
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) )
+
+from shadergraph import NodeFactory
+
+# custom nodes as registered by glframe
+NodeFactory.addCustomNode( 'Screen Size', [( 'Width', 'float', 'sg_ScreenSize.x' ), ( 'Height', 'float', 'sg_ScreenSize.y' )] )
+NodeFactory.addCustomNode( 'Time', [( 'time', 'float', 'sg_Time' )] )
+NodeFactory.addCustomNode( 'MVP Matrix', [( 'Matrix', 'mat4', 'MVP' )] )
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from cpueval import renderGraph
+from shadergraph import NodeFactory, ShaderGraph
+
+def colorGraph():
+    """Vec4 to Color into the fragment shader."""
+    graph = ShaderGraph()
+    color = NodeFactory.getNewNode( 'Vec4 to Color' )
+    graph.addNode( color )
+    graph.connect( graph.getFragmentShaderNode().inplugs['Color'], color.outplugs['Color'] )
+    return graph, color
+
+def test_constant_color():
+    graph, color = colorGraph()
+    for name, value in zip( 'RGBA', ( 0.25, 0.5, 2.0, 1.0 ) ):
+        color.inplugs[name].value.SetFloat( value )
+    image = renderGraph( graph, 7, 5 )
+    assert image.shape == ( 5, 7, 4 ) and image.dtype == np.float32
+    # clamped like an 8 bit framebuffer
+    assert ( image == np.float32( [0.25, 0.5, 1.0, 1.0] ) ).all()
+
+def test_uv_gradient():
+    graph, color = colorGraph()
+    coords = NodeFactory.getNewNode( 'Frag Coords' )
+    size = NodeFactory.getNewNode( 'Screen Size' )
+    graph.addNode( coords )
+    graph.addNode( size )
+    for axis, dimension, channel in ( ( 'X', 'Width', 'R' ), ( 'Y', 'Height', 'G' ) ):
+        divide = NodeFactory.getNewNode( 'Divide' )
+        graph.addNode( divide )
+        graph.connect( divide.inplugs['Divident'], coords.outplugs[axis] )
+        graph.connect( divide.inplugs['Divisor'], size.outplugs[dimension] )
+        graph.connect( color.inplugs[channel], divide.outplugs['Result'] )
+    color.inplugs['B'].value.SetFloat( 0 )
+
+    width, height = 16, 8
+    image = renderGraph( graph, width, height )
+    x, y = np.meshgrid( np.arange( width ), np.arange( height ) )
+    # top row first, window y grows upwards
+    assert np.allclose( image[..., 0], ( x+0.5 ) / width )
+    assert np.allclose( image[..., 1], ( height-0.5-y ) / height )
+    assert ( image[..., 2] == 0 ).all() and ( image[..., 3] == 1 ).all()
+
+def test_uniforms_replace_time_and_random_values():
+    graph, color = colorGraph()
+    time = NodeFactory.getNewNode( 'Time' )
+    random = NodeFactory.getNewNode( 'Random Float' )
+    graph.addNode( time )
+    graph.addNode( random )
+    graph.connect( color.inplugs['R'], time.outplugs['time'] )
+    graph.connect( color.inplugs['G'], random.outplugs['Uniform'] )
+    graph.nameVariables()
+    image = renderGraph( graph, 2, 2, time=0.75, uniforms={random.uniform[0]: 0.125} )
+    assert np.allclose( image[..., :2], [0.75, 0.125] )
+
+def test_vertex_color_needs_the_gpu():
+    # the default graph colours the fragments with the vertex colour
+    with pytest.raises( ValueError ):
+        renderGraph( ShaderGraph(), 4, 4 )
@@ -0,0 +1,80 @@
+import glob
+import json
+import os
+
+import pytest
+
+from graphio import graphDocument, readGraph, writeGraph
+from shadergraph import ShaderGraph
+
+ROOT = os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) )
+EXAMPLES = sorted( glob.glob( os.path.join( ROOT, 'examples', '*.glsg' ) ) )
+# pickled by the app before FORMAT_VERSION 1, with pickle.dump( graph, f, 0 )
+DEFAULT_PICKLE = os.path.join( ROOT, 'tests', 'data', 'default_graph.pickle' )
+PRE_SLOTS_PICKLE = os.path.join( ROOT, 'tests', 'data', 'pre_slots_graph.pickle' )
+DEFAULT_KINDS = ['Vertex Shader', 'Input Mesh', 'Vector Transform', 'Function (I)', 'MVP Matrix', 'Fragment Shader', 'Vertex Color']
+DEFAULT_EDGES = [[0, 'Position', 2, 'Result'], [0, 'Color', 3, 'Result'], [2, 'Vector', 1, 'Position'], [2, 'Matrix', 4, 'Matrix'],
+                 [3, 'Param', 1, 'Normal'], [5, 'Color', 6, 'Vertex Color']]
+
+def damaged( data ):
+    """Truncations and byte flips spread over the file."""
+    step = max( 1, len( data ) // 40 )
+    for cut in range( 1, len( data ), step ):
+        yield data[:cut]
+    for i in range( 0, len( data ), step ):
+        yield data[:i] + bytes( [data[i] ^ 0xff] ) + data[i+1:]
+
+def test_default_pickle_is_read_node_for_node():
+    document = graphDocument( readGraph( DEFAULT_PICKLE ) )
+    assert [n['kind'] for n in document['nodes']] == DEFAULT_KINDS
+    assert document['edges'] == DEFAULT_EDGES
+    assert document['nodes'][3]['values']['Function'] == ['list', 'abs']
+    assert document['nodes'][3]['values']['Type'] == ['list', 'vec4']
+
+def test_pre_slots_pickle_rebuilds_its_uniform():
+    graph = readGraph( PRE_SLOTS_PICKLE )
+    document = graphDocument( graph )
+    assert [n['kind'] for n in document['nodes']] == DEFAULT_KINDS + ['Random Float', 'Vec4 to Color', 'Smooth Step']
+    assert document['edges'] == DEFAULT_EDGES[:-1] + [[5, 'Color', 8, 'Color'], [8, 'R', 7, 'Uniform'], [8, 'G', 9, 'Result']]
+    graph.prepare()
+    assert 'uniform float RandomFloat1;' in graph.getFragmentShaderNode().generateCode( 'Pixel Color', '', '' )[1]
+
+@pytest.mark.parametrize( 'path', EXAMPLES, ids=os.path.basename )
+def test_fragment_only_examples_keep_one_vertex_side( path ):
+    kinds = [n['kind'] for n in graphDocument( readGraph( path ) )['nodes']]
+    assert kinds.count( 'Vertex Shader' ) == 1
+    assert kinds.count( 'Fragment Shader' ) == 1
+
+@pytest.mark.parametrize( 'binary', [True, False], ids=['binary', 'json'] )
+def test_damaged_files_raise_value_error( tmp_path, binary ):
+    original = tmp_path/'original.glsg'
+    writeGraph( readGraph( EXAMPLES[0] ), str( original ), binary )
+    path = tmp_path/'damaged.glsg'
+    for data in damaged( original.read_bytes() ):
+        path.write_bytes( data )
+        try:
+            readGraph( str( path ) )
+        except ValueError:
+            pass
+
+def test_damaged_legacy_pickle_raises_value_error( tmp_path ):
+    with open( EXAMPLES[0], 'rb' ) as f:
+        data = f.read()
+    path = tmp_path/'damaged.glsg'
+    for data in damaged( data ):
+        path.write_bytes( data )
+        try:
+            readGraph( str( path ) )
+        except ValueError:
+            pass
+
+@pytest.mark.parametrize( 'data', [b'', b'GLSG', b'GLSG\x01\x00\x01\x00garbage', b'{"nodes": [{}]}', b'{"nodes": 1}'] )
+def test_not_a_graph( tmp_path, data ):
+    path = tmp_path/'bad.glsg'
+    path.write_bytes( data )
+    with pytest.raises( ValueError ):
+        readGraph( str( path ) )
+
+def test_missing_file_is_not_a_value_error( tmp_path ):
+    with pytest.raises( IOError ):
+        readGraph( str( tmp_path/'missing.glsg' ) )
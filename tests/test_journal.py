@@ -0,0 +1,65 @@
+import copy
+import random
+
+import pytest
+
+import journal
+from graphio import graphDocument
+from history import UndoHistory
+from journal import GraphJournal, recoverGraph
+from shadergraph import NodeFactory, ShaderGraph
+
+def canonical( document ):
+    """Nodes and edges of a document regardless of node order, which undo does not keep in recovery."""
+    keys = [repr( sorted( ( k, repr( v ) ) for k, v in node.items() ) ) for node in document['nodes']]
+    assert len( set( keys ) ) == len( keys )
+    return sorted( keys ), sorted( ( keys[i], plug, keys[source], sourceplug ) for i, plug, source, sourceplug in document['edges'] )
+
+def edit( graph, history, rng, step ):
+    nodes = [node for node in graph.nodes if node and 'Result' in node.outplugs]
+    choice = rng.random()
+    if choice < 0.15 or len( nodes ) < 4:
+        node = NodeFactory.getNewNode( rng.choice( ( 'Divide', 'Smooth Step' ) ) )
+        node.name = f'{node.name} {step}'
+        node.location = [step, 0]
+        graph.addNode( node )
+    elif choice < 0.25:
+        graph.removeNode( rng.choice( nodes ) )
+    elif choice < 0.4:
+        node = rng.choice( nodes )
+        graph.moveNode( node, [node.location[0]+1, node.location[1]] )
+    elif choice < 0.55:
+        node = rng.choice( nodes )
+        plug = rng.choice( list( node.inplugs.values() ) )
+        if type( plug.value ).__name__ == 'FloatValue':
+            value = copy.copy( plug.value )
+            value.SetFloat( step )
+            graph.setValue( plug, value )
+    elif choice < 0.75:
+        node, source = rng.sample( nodes, 2 )
+        plug = rng.choice( [plug for plug in node.inplugs.values() if plug.type == 'float' and not plug.internal] or [None] )
+        if plug and graph.canConnect( plug, source.outplugs['Result'] ):
+            graph.connect( plug, source.outplugs['Result'] )
+    elif choice < 0.85:
+        node = rng.choice( nodes )
+        connected = [plug for plug in node.inplugs.values() if type( plug.value ).__name__ == 'Plug']
+        if connected:
+            graph.disconnect( rng.choice( connected ) )
+    elif choice < 0.95:
+        history.undo()
+    else:
+        history.redo()
+
+@pytest.mark.parametrize( 'seed', range( 5 ) )
+def test_recovery_across_compactions( tmp_path, monkeypatch, seed ):
+    monkeypatch.setattr( journal, 'COMPACT_MIN_OPS', 20 )
+    rng = random.Random( seed )
+    graph = ShaderGraph()
+    history = UndoHistory( graph )
+    autosave = GraphJournal( graph, str( tmp_path/'graph' ) )
+    for step in range( 400 ):
+        edit( graph, history, rng, step )
+        if step % 50 == 49:
+            autosave.flush()
+            assert canonical( graphDocument( recoverGraph( autosave.basename ) ) ) == canonical( graphDocument( graph ) )
+    autosave.close()
@@ -0,0 +1,35 @@
+import numpy as np
+
+import mesh
+
+def area( positions, faces ):
+    p = positions.astype( np.float64 )
+    return np.linalg.norm( np.cross( p[faces[:, 1]]-p[faces[:, 0]], p[faces[:, 2]]-p[faces[:, 0]] ), axis=1 ).sum() / 2
+
+def grid( n ):
+    """Open unit square in the z=0 plane with n x n vertices."""
+    x, y = np.meshgrid( np.linspace( 0, 1, n ), np.linspace( 0, 1, n ), indexing='ij' )
+    positions = np.stack( ( x, y, np.zeros_like( x ) ), -1 ).reshape( -1, 3 ).astype( 'f' )
+    i = ( np.arange( n-1 )[:, None] * n + np.arange( n-1 )[None, :] ).reshape( -1 )
+    return positions, np.concatenate( ( np.stack( ( i, i+n, i+1 ), -1 ), np.stack( ( i+1, i+n, i+n+1 ), -1 ) ) )
+
+def weld( positions, faces ):
+    unique, inverse = np.unique( positions.round( 5 ), axis=0, return_inverse=True )
+    faces = inverse.reshape( -1 )[faces]
+    keep = ( faces[:, 0] != faces[:, 1] ) & ( faces[:, 1] != faces[:, 2] ) & ( faces[:, 2] != faces[:, 0] )
+    return unique.astype( 'f' ), faces[keep]
+
+def test_open_mesh_keeps_its_outline():
+    positions, vfaces = grid( 20 )
+    simple, sfaces, _ = mesh.simplify( positions, vfaces, vfaces.copy(), 40 )
+    assert len( sfaces ) <= 40
+    assert abs( area( simple, sfaces ) - 1 ) < 1e-3
+    used = simple[np.unique( sfaces )]
+    assert np.allclose( used.min( axis=0 ), 0 ) and np.allclose( used.max( axis=0 ), [1, 1, 0] )
+
+def test_unwelded_seam_does_not_shrink():
+    positions, vfaces = mesh.sphere( 40 )
+    simple, sfaces, _ = mesh.simplify( positions, vfaces, vfaces.copy(), 152 )
+    wpositions, wfaces = weld( positions, vfaces )
+    wsimple, wsfaces, _ = mesh.simplify( wpositions, wfaces, wfaces.copy(), 152 )
+    assert area( simple, sfaces ) > 0.95 * area( wsimple, wsfaces )
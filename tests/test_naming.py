@@ -0,0 +1,88 @@
+import glob
+import json
+import os
+import pickle
+import re
+
+import pytest
+
+from graphio import decodeBinary, documentGraph, encodeBinary, graphDocument, readGraph, writeGraph
+from shadergraph import NodeFactory, ShaderGraph
+
+ROOT = os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) )
+EXAMPLES = sorted( glob.glob( os.path.join( ROOT, 'examples', '*.glsg' ) ) )
+# a graph pickled by shadergraph.py before plugs kept their name stems
+PRE_SLOTS_PICKLE = os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), 'data', 'pre_slots_graph.pickle' )
+
+def shaders( graph ):
+    sources = []
+    for output, name in ( ( graph.getVertexShaderNode(), 'Vertex Position' ), ( graph.getFragmentShaderNode(), 'Pixel Color' ) ):
+        graph.prepare()
+        sources.append( output.generateCode( name, '', '' ) )
+    return sources
+
+def declarations( code ):
+    return re.findall( r'^\t\w+ (\w+) =', code, re.MULTILINE )
+
+def colorGraph( order ):
+    """Random Float and Smooth Step into a Vec4 to Color, the nodes created in the given order."""
+    created = {}
+    for kind in order:
+        created[kind] = NodeFactory.getNewNode( kind )
+        # unrelated nodes used to shift the global numbering
+        NodeFactory.getNewNode( 'Divide' )
+    graph = ShaderGraph()
+    color = created['Vec4 to Color']
+    for kind in order:
+        graph.addNode( created[kind] )
+    graph.connect( color.inplugs['R'], created['Random Float'].outplugs['Uniform'] )
+    graph.connect( color.inplugs['G'], created['Smooth Step'].outplugs['Result'] )
+    graph.connect( graph.getFragmentShaderNode().inplugs['Color'], color.outplugs['Color'] )
+    return graph
+
+@pytest.mark.parametrize( 'filename', EXAMPLES, ids=os.path.basename )
+def test_save_load_keeps_glsl( filename, tmp_path ):
+    graph = readGraph( filename )
+    expected = shaders( graph )
+    writeGraph( graph, str( tmp_path/'binary.glsg' ), binary=True )
+    writeGraph( graph, str( tmp_path/'text.glsg' ), binary=False )
+    copies = [
+        readGraph( str( tmp_path/'binary.glsg' ) ),
+        readGraph( str( tmp_path/'text.glsg' ) ),
+        decodeBinary( encodeBinary( graphDocument( graph ) ) ),
+        documentGraph( json.loads( json.dumps( graphDocument( graph ) ) ) ),
+        readGraph( filename ),
+        pickle.loads( pickle.dumps( graph ) ),
+    ]
+    for copy in copies:
+        assert shaders( copy ) == expected
+
+def test_node_order_does_not_change_glsl():
+    graph = readGraph( EXAMPLES[0] )
+    expected = shaders( graph )
+    reordered = documentGraph( graphDocument( graph ) )
+    reordered.nodes = type( reordered.nodes )( reversed( list( reordered.nodes ) ) )
+    assert shaders( reordered ) == expected
+
+def test_creation_order_does_not_change_glsl():
+    first = shaders( colorGraph( ['Random Float', 'Smooth Step', 'Vec4 to Color'] ) )
+    second = shaders( colorGraph( ['Vec4 to Color', 'Smooth Step', 'Random Float'] ) )
+    assert first == second
+
+def test_pre_slots_pickle_is_renamed():
+    with open( PRE_SLOTS_PICKLE, 'rb' ) as f:
+        graph = pickle.load( f )
+    color = next( node for node in graph.nodes if node.name == 'Vec4 to Color' )
+    step = NodeFactory.getNewNode( 'Smooth Step' )
+    graph.addNode( step )
+    graph.connect( color.inplugs['B'], step.outplugs['Result'] )
+
+    graph.prepare()
+    code, globalcode = graph.getFragmentShaderNode().generateCode( 'Pixel Color', '', '' )
+    names = declarations( code )
+    assert len( names ) == len( set( names ) )
+    assert 'uniform float RandomFloat1;' in globalcode
+    # named like the same graph saved and loaded again, which writes its literals as floats
+    resaved = documentGraph( graphDocument( graph ) )
+    resaved.prepare()
+    assert declarations( resaved.getFragmentShaderNode().generateCode( 'Pixel Color', '', '' )[0] ) == names
@@ -0,0 +1,49 @@
+import struct
+
+import numpy as np
+import pytest
+
+import mesh
+from readglb import GLB_JSON, GLB_MAGIC, GlbMesh, writeGlb
+from readply import PlyMesh
+
+def writeMixedPly( filename, positions, polygons, counttype='uchar', trim=0 ):
+    header = 'ply\nformat binary_little_endian 1.0\n'
+    header += f'element vertex {len( positions )}\n' + ''.join( f'property float {c}\n' for c in 'xyz' )
+    header += f'element face {len( polygons )}\nproperty list {counttype} int vertex_indices\nend_header\n'
+    counts = {'uchar': '<u1', 'ushort': '<u2'}[counttype]
+    body = b''.join( np.array( [len( p )], counts ).tobytes() + np.array( p, '<i4' ).tobytes() for p in polygons )
+    with open( filename, 'wb' ) as f:
+        f.write( header.encode( 'ascii' ) + np.asarray( positions, '<f4' ).tobytes() + body[:len( body )-trim] )
+
+@pytest.mark.parametrize( 'counttype', ['uchar', 'ushort'] )
+def test_mixed_polygons( tmp_path, counttype ):
+    rng = np.random.default_rng( 0 )
+    positions = rng.random( ( 40, 3 ) )
+    polygons = [rng.integers( 0, 40, n ).tolist() for n in rng.integers( 3, 8, 500 )]
+    writeMixedPly( tmp_path/'mixed.ply', positions, polygons, counttype )
+    _, _, vfaces, _ = PlyMesh( tmp_path/'mixed.ply' ).getArrays()
+    assert ( vfaces == mesh.triangulate( polygons ) ).all()
+
+def test_truncated_polygons( tmp_path ):
+    writeMixedPly( tmp_path/'cut.ply', np.zeros( ( 5, 3 ) ), [[0, 1, 2], [0, 1, 2, 3, 4]], trim=4 )
+    with pytest.raises( ValueError ):
+        PlyMesh( tmp_path/'cut.ply' )
+
+def test_triangulate():
+    assert mesh.triangulate( [[0, 1, 2, 3], [4, 5], [6, 7, 8]] ).tolist() == [[0, 1, 2], [0, 2, 3], [6, 7, 8]]
+    assert mesh.triangulate( [] ).shape == ( 0, 3 )
+
+def test_glb_without_bin_chunk( tmp_path ):
+    positions, vfaces = mesh.sphere( 8 )
+    normals, _ = mesh.smoothNormals( positions, vfaces )
+    writeGlb( tmp_path/'sphere.glb', positions, normals, vfaces )
+    assert ( GlbMesh( tmp_path/'sphere.glb' ).getArrays()[2] == vfaces ).all()
+
+    # the JSON chunk alone
+    data = ( tmp_path/'sphere.glb' ).read_bytes()
+    length, kind = struct.unpack_from( '<II', data, 12 )
+    assert kind == GLB_JSON
+    ( tmp_path/'nobin.glb' ).write_bytes( struct.pack( '<4sII', GLB_MAGIC, 2, 20+length ) + data[12:20+length] )
+    with pytest.raises( ValueError, match='BIN' ):
+        GlbMesh( tmp_path/'nobin.glb' )
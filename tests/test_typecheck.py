@@ -0,0 +1,47 @@
+import copy
+import random
+
+from shadergraph import NodeFactory, ShaderGraph
+from typecheck import checkTypes, recheckTypes
+
+def functionGraph():
+    """Function nodes chained into the color, with a vec4 divisor and an unused node."""
+    graph = ShaderGraph()
+    divide = NodeFactory.getNewNode( 'Divide' )
+    first = NodeFactory.getNewNode( 'Function (II)' )
+    second = NodeFactory.getNewNode( 'Function (I)' )
+    color = NodeFactory.getNewNode( 'Vec4 to Color' )
+    unused = NodeFactory.getNewNode( 'Function (I)' )
+    for node in ( divide, first, second, color, unused ):
+        graph.addNode( node )
+    graph.connect( divide.inplugs['Divisor'], graph.getVertexShaderNode().inplugs['Position'].value )
+    graph.connect( first.inplugs['Param1'], divide.outplugs['Result'] )
+    graph.connect( second.inplugs['Param'], first.outplugs['Result'] )
+    graph.connect( color.inplugs['R'], second.outplugs['Result'] )
+    graph.connect( graph.getFragmentShaderNode().inplugs['Color'], color.outplugs['Color'] )
+    return graph, [divide, first, second, unused]
+
+def test_recheck_matches_full_check():
+    rng = random.Random( 0 )
+    graph, nodes = functionGraph()
+    checked = set()
+    errors = checkTypes( graph, checked )
+    assert nodes[-1] not in checked
+    seen = 0
+    for step in range( 300 ):
+        node = rng.choice( nodes )
+        if 'Type' in node.inplugs:
+            plug = node.inplugs[rng.choice( ( 'Type', 'Function' ) )]
+            value = copy.copy( plug.value )
+            value.SetValue( rng.choice( ( 'float', 'vec4' ) if plug.name == 'Type' else ( 'abs', 'dot', 'length', 'max' ) ) )
+        else:
+            plug = node.inplugs['Divident']
+            value = copy.copy( plug.value )
+            value.SetFloat( step )
+        before = dict( errors )
+        graph.setValue( plug, value )
+        changed = recheckTypes( graph, errors, [node], checked )
+        seen += len( changed )
+        assert errors == checkTypes( graph )
+        assert changed == {plug.parent for plug in before.keys() ^ errors.keys()} | {plug.parent for plug in before.keys() & errors.keys() if before[plug] != errors[plug]}
+    assert seen
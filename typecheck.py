@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+from shadergraph import Plug, FloatValue, ColorValue, Vec3Value, Vec4Value, Mat4Value, FunctionINode, FunctionIINode, FunctionIIINode, FunctionIVNode
+
+FUNCTION_NODES = ( FunctionINode, FunctionIINode, FunctionIIINode, FunctionIVNode )
+VALUE_TYPES = {FloatValue: 'float', ColorValue: 'vec4', Vec3Value: 'vec3', Vec4Value: 'vec4', Mat4Value: 'mat4'}
+SIZES = {'float': 1, 'vec2': 2, 'vec3': 3, 'vec4': 4}
+
+# overloads of the functions offered by the Function nodes, as (parameters, result):
+# T is any of float and vecN, the same throughout an overload, V only a vecN
+UNARY = [( ( 'T', ), 'T' )]
+SIGNATURES = {
+    'length': [( ( 'T', ), 'float' )],
+    'noise1': [( ( 'T', ), 'float' )],
+    'noise2': [( ( 'T', ), 'vec2' )],
+    'noise3': [( ( 'T', ), 'vec3' )],
+    'noise4': [( ( 'T', ), 'vec4' )],
+    'not': [],
+    'cross': [( ( 'vec3', 'vec3' ), 'vec3' )],
+    'distance': [( ( 'T', 'T' ), 'float' )],
+    'dot': [( ( 'T', 'T' ), 'float' )],
+    'equal': [( ( 'V', 'V' ), 'bV' )],
+    'notEqual': [( ( 'V', 'V' ), 'bV' )],
+    'lessThan': [( ( 'V', 'V' ), 'bV' )],
+    'lessThanEqual': [( ( 'V', 'V' ), 'bV' )],
+    'outerProduct': [( ( 'V', 'V' ), 'matV' )],
+    'max': [( ( 'T', 'T' ), 'T' ), ( ( 'T', 'float' ), 'T' )],
+    'min': [( ( 'T', 'T' ), 'T' ), ( ( 'T', 'float' ), 'T' )],
+    'mod': [( ( 'T', 'T' ), 'T' ), ( ( 'T', 'float' ), 'T' )],
+    'modf': [( ( 'T', 'T' ), 'T' )],
+    'pow': [( ( 'T', 'T' ), 'T' )],
+    'reflect': [( ( 'T', 'T' ), 'T' )],
+    'step': [( ( 'T', 'T' ), 'T' ), ( ( 'float', 'T' ), 'T' )],
+    'clamp': [( ( 'T', 'T', 'T' ), 'T' ), ( ( 'T', 'float', 'float' ), 'T' )],
+    'mix': [( ( 'T', 'T', 'T' ), 'T' ), ( ( 'T', 'T', 'float' ), 'T' )],
+    'smoothstep': [( ( 'T', 'T', 'T' ), 'T' ), ( ( 'float', 'float', 'T' ), 'T' )],
+    'refract': [( ( 'T', 'T', 'float' ), 'T' )],
+}
+
+def outputType( plug ):
+    """GLSL type of the variable an output plug stands for, None when unknown."""
+    if isinstance( plug.parent, FUNCTION_NODES ) and plug.name == 'Result':
+        # declared with the type chosen on the node
+        return plug.parent.inplugs['Type'].value.value
+    return plug.type or None
+
+def valueType( value ):
+    """GLSL type of an input plug's value: a connected output plug or a literal."""
+    if isinstance( value, Plug ):
+        return outputType( value )
+    return VALUE_TYPES.get( type( value ) )
+
+def functionType( name, args ):
+    """Result type of calling a built-in function or constructor with arguments of the given types, None if no overload matches."""
+    if name in SIZES and name != 'float':
+        # constructor from scalars and vectors adding up to its size, or from a single float
+        if args == ['float'] or sum( SIZES.get( arg, 0 ) for arg in args ) == SIZES[name] and all( arg in SIZES for arg in args ):
+            return name
+        return None
+    for params, result in SIGNATURES.get( name, UNARY ):
+        if len( params ) != len( args ):
+            continue
+        bound = None
+        for param, arg in zip( params, args ):
+            if param in ( 'T', 'V' ):
+                if arg not in SIZES or param == 'V' and arg == 'float' or bound not in ( None, arg ):
+                    break
+                bound = arg
+            elif param != arg:
+                break
+        else:
+            if result == 'T':
+                return bound
+            if result == 'bV':
+                return 'b'+bound
+            if result == 'matV':
+                return f'mat{SIZES[bound]}'
+            return result
+    return None
+
+def checkNode( node, errors ):
+    for plug in node.inplugs.values():
+        if plug.internal or not plug.declare_variable:
+            continue
+        actual = valueType( plug.value )
+        if plug.type and actual and actual != plug.type:
+            errors[plug] = f'{node.name} {plug.name}: {actual} connected to a {plug.type} input'
+
+    if isinstance( node, FUNCTION_NODES ):
+        function = node.inplugs['Function'].value.value
+        declared = node.inplugs['Type'].value.value
+        params = [plug for plug in node.inplugs.values() if not plug.internal]
+        # declared parameters are passed as their variables, the others inline
+        args = [plug.type if plug.declare_variable else valueType( plug.value ) for plug in params]
+        if None in args:
+            return
+        result = functionType( function, args )
+        call = f'{function}({", ".join( args )})'
+        if result is None:
+            errors[node.inplugs['Function']] = f'{node.name}: there is no {call}'
+        elif result != declared:
+            errors[node.inplugs['Type']] = f'{node.name}: {call} gives {result}, not {declared}'
+
+def checkTypes( graph, visited=None ):
+    """Type mismatches in the nodes the shaders use, as {plug: message}.
+
+    Every input plug is declared as a variable of its own type and assigned
+    its source, which GLSL only accepts for the same type. Function nodes
+    declare their result with the chosen Type, which must be what the
+    function returns for the parameters it is given. The nodes checked are
+    added to `visited` when it is given.
+    """
+    errors = {}
+    if visited is None:
+        visited = set()
+    pending = [graph.getVertexShaderNode(), graph.getFragmentShaderNode()]
+    while pending:
+        node = pending.pop()
+        if node in visited:
+            continue
+        visited.add( node )
+        checkNode( node, errors )
+        for plug in node.inplugs.values():
+            if isinstance( plug.value, Plug ) and plug.value.parent not in visited:
+                pending.append( plug.value.parent )
+    return errors
+
+def recheckTypes( graph, errors, nodes, checked ):
+    """Update errors after value edits on nodes, returns the nodes whose mismatches changed.
+
+    Output types are declared by their node, never inferred from its
+    sources, so a value edit can only change the checks of the node itself
+    and of the nodes its outputs feed, not of everything downstream. Only
+    nodes in `checked`, those the shaders use, are checked again.
+    """
+    affected = set( nodes )
+    for node in nodes:
+        affected.update( plug.parent for plug in graph.consumers( node ) )
+    changed = set()
+    for node in affected & checked:
+        before = {plug: errors.pop( plug ) for plug in node.inplugs.values() if plug in errors}
+        checkNode( node, errors )
+        if before != {plug: errors[plug] for plug in node.inplugs.values() if plug in errors}:
+            changed.add( node )
+    return changed
+
+if __name__ == '__main__':
+    import glob
+    import os
+    import sys
+    import time
+    from graphio import readGraph
+    from shadergraph import NodeFactory, ShaderGraph
+
+    NodeFactory.addCustomNode( 'Screen Size', [( 'Width', 'float', 'sg_ScreenSize.x' ), ( 'Height', 'float', 'sg_ScreenSize.y' )] )
+    NodeFactory.addCustomNode( 'Time', [( 'time', 'float', 'sg_Time' )] )
+    NodeFactory.addCustomNode( 'MVP Matrix', [( 'Matrix', 'mat4', 'MVP' )] )
+
+    for filename in sorted( glob.glob( os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), 'examples', '*.glsg' ) ) ):
+        assert not checkTypes( readGraph( filename ) ), filename
+
+    # a vec4 into a float input, and Type: vec3 on a function of floats
+    graph = ShaderGraph()
+    divide = NodeFactory.getNewNode( 'Divide' )
+    function = NodeFactory.getNewNode( 'Function (II)' )
+    function.inplugs['Type'].value.SetValue( 'vec3' )
+    divide.inplugs['Divisor'].setValue( graph.getVertexShaderNode().inplugs['Position'].value )
+    function.inplugs['Param1'].setValue( divide.outplugs['Result'] )
+    color = NodeFactory.getNewNode( 'Vec4 to Color' )
+    color.inplugs['R'].setValue( function.outplugs['Result'] )
+    graph.getFragmentShaderNode().inplugs['Color'].setValue( color.outplugs['Color'] )
+    graph.nodes.extend( [divide, function, color] )
+    for message in checkTypes( graph ).values():
+        print( message )
+
+    # time of the check against code generation, on a chain of nodes
+    sys.setrecursionlimit( 100000 )
+    graph = ShaderGraph()
+    last = None
+    for i in range( 5000 ):
+        node = NodeFactory.getNewNode( ( 'Divide', 'Smooth Step', 'Operator (II)' )[i%3] )
+        if last:
+            list( node.inplugs.values() )[-1].setValue( last.outplugs['Result'] )
+        graph.nodes.append( node )
+        last = node
+    color = NodeFactory.getNewNode( 'Vec4 to Color' )
+    color.inplugs['R'].setValue( last.outplugs['Result'] )
+    graph.nodes.append( color )
+    graph.getFragmentShaderNode().inplugs['Color'].setValue( color.outplugs['Color'] )
+    start = time.perf_counter()
+    assert not checkTypes( graph )
+    checked = time.perf_counter()-start
+    start = time.perf_counter()
+    graph.prepare()
+    graph.getFragmentShaderNode().generateCode( 'Pixel Color', '', '' )
+    generated = time.perf_counter()-start
+    print( f'5000 nodes: type check {checked*1000:.1f}ms, code generation {generated*1000:.1f}ms' )